@@ -1,3 +1,29 @@
-import behavior.visualization
-import behavior.analysis
-import behavior.utils
+import importlib
+
+##############################################################################
+
+
+def _lazy_submodules(package, submodules):
+    """Return the __getattr__ and __dir__ of a package (PEP 562).
+
+    The submodules are imported on first access (eg. behavior.utils.file_io),
+    so importing the package does not load matplotlib or scipy.
+    """
+    def __getattr__(name):
+        if name in submodules:
+            return importlib.import_module(f'{package}.{name}')
+        raise AttributeError(f'module {package!r} has no attribute {name!r}')
+
+    def __dir__():
+        return sorted(set(vars(importlib.import_module(package)))
+                      | set(submodules))
+
+    return __getattr__, __dir__
+
+
+__getattr__, __dir__ = _lazy_submodules(__name__, [
+    'analysis',
+    'pipeline',
+    'utils',
+    'visualization',
+])
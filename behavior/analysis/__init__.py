@@ -1,2 +1,15 @@
-import behavior.analysis.freezing_analysis
-import behavior.analysis.motion_analysis
+from behavior import _lazy_submodules
+
+__getattr__, __dir__ = _lazy_submodules(__name__, [
+    'binning',
+    'calibration',
+    'classCohortTensor',
+    'classFreezingDetector',
+    'cleaning',
+    'freezing_analysis',
+    'kinematics',
+    'motion_analysis',
+    'resampling',
+    'run_length',
+    'summary',
+])
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import warnings
+
+import numpy as np
+from behavior.analysis.summary import reshape_cohort_trials
+from behavior.utils.classProtocol import Protocol
+
+# Functions used to reduce the samples of each bin
+REDUCTIONS = {
+    'mean': np.nanmean,
+    'sum': np.nansum,
+    'max': np.nanmax,
+    'min': np.nanmin,
+}
+
+
+##############################################################################
+
+def default_reduction(column):
+    """Return the reduction of a column: 'sum' for distances, else 'mean'.
+
+    The mean of the freezing_events or darting_events columns is the
+    fraction of the bin with the behavior.
+    """
+    return 'sum' if column.startswith('ed_') else 'mean'
+
+##############################################################################
+
+
+def bin_trials(
+        trials,
+        bin_samples,
+        reductions='mean',
+):
+    """Reduce the samples of trial arrays into fixed bins.
+
+    Parameters
+    ----------
+    trials : numpy.ndarray
+        Array with shape (..., samples, metrics), eg. from reshape_trials()
+        or reshape_cohort_trials().
+
+    bin_samples : int
+        Number of samples per bin. The samples after the last complete bin
+        are dropped.
+
+    reductions : str or list of str, optional
+        One of 'mean', 'sum', 'max' or 'min' for all metrics, or one per
+        metric.
+
+    Returns
+    -------
+    binned : numpy.ndarray
+        Array with shape (..., bins, metrics).
+    """
+    trials = np.asarray(trials, dtype=float)
+    n_samples, n_metrics = trials.shape[-2:]
+    n_bins = n_samples//bin_samples
+    if n_bins == 0:
+        raise ValueError(f'bin_samples ({bin_samples}) is longer than the '
+                         f'trials ({n_samples} samples)')
+
+    if isinstance(reductions, str):
+        reductions = [reductions]*n_metrics
+
+    # (..., bins, samples per bin, metrics)
+    reshaped = trials[..., :n_bins*bin_samples, :].reshape(
+        trials.shape[:-2] + (n_bins, bin_samples, n_metrics))
+
+    binned = np.empty(trials.shape[:-2] + (n_bins, n_metrics))
+    with warnings.catch_warnings():
+        # Bins without valid samples are NaN
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for reduction in set(reductions):
+            metrics = [metric for metric, name in enumerate(reductions)
+                       if name == reduction]
+            binned[..., metrics] = REDUCTIONS[reduction](
+                reshaped[..., metrics], axis=-2)
+
+    return binned
+
+##############################################################################
+
+
+def calculate_time_course(
+        dataframe,
+        columns,
+        bin_sec=1,
+        reductions=None,
+        protocol=None,
+):
+    """Calculate the time course of trial-aligned signals in fixed bins.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Trial-aligned dataframe of one or more animals (see
+        reshape_cohort_trials()), eg. the motion analysis dataframe for
+        freezing_events or the preprocessing dataframe for ed_ and speed_
+        columns.
+
+    columns : list of str
+        Columns to bin.
+
+    bin_sec : float, optional
+        Duration of each bin in seconds (eg. 1, 5 or 10).
+
+    reductions : list of str, optional
+        Reduction of each column (see bin_trials()). Defaults to the sum for
+        the ed_ columns and the mean for the others.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials.
+
+    Returns
+    -------
+    animal_ids : list of str
+    cs_ids : list of str
+    bin_start_sec : numpy.ndarray
+        Start of each bin in seconds relative to the cs onset.
+    time_course : numpy.ndarray
+        Array with shape (animals, cs, bins, len(columns)).
+    """
+    if protocol is None:
+        protocol = Protocol()
+    if reductions is None:
+        reductions = [default_reduction(column) for column in columns]
+
+    bin_samples = int(round(bin_sec*protocol.fps))
+    if bin_samples < 1:
+        raise ValueError(f'bin_sec must be at least one sample '
+                         f'({1/protocol.fps} seconds)')
+
+    animal_ids, cs_ids, trials = reshape_cohort_trials(dataframe, columns,
+                                                       protocol)
+    time_course = bin_trials(trials, bin_samples, reductions)
+
+    bin_start_sec = (np.arange(time_course.shape[-2])*bin_samples
+                     / protocol.fps - protocol.pre_cs_sec)
+
+    return animal_ids, cs_ids, bin_start_sec, time_course
+
+##############################################################################
@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import pandas as pd
+import numpy as np
+from behavior.analysis.run_length import detect_runs, find_runs
+from behavior.utils.classProtocol import Protocol
+
+
+##############################################################################
+
+def calculate_run_length_per_frame(mask):
+    """Return, for every True frame, the length of the run it belongs to.
+
+    Parameters
+    ----------
+    mask : numpy.ndarray of bool
+        1D array. Insert False values to keep runs from merging.
+
+    Returns
+    -------
+    run_length : numpy.ndarray of int
+        0 for the False frames.
+    """
+    start, stop = find_runs(mask)
+    length = stop - start
+
+    run_length = np.zeros(len(mask), dtype=np.int32)
+    run_length[mask] = np.repeat(length, length)
+
+    return run_length
+
+
+def _cs_blocks(dataframe, n_samples):
+    # Identify each cs trial (block of n_samples rows) and the rows where
+    # a new animal starts (plus the end of the dataframe)
+    n_blocks = len(dataframe) // n_samples
+    if n_blocks*n_samples != len(dataframe):
+        raise ValueError(f'Each cs must span {n_samples} contiguous rows.')
+    if 'animal_id' in dataframe.columns:
+        animal_ids = dataframe['animal_id'].to_numpy()[::n_samples]
+    else:
+        animal_ids = np.zeros(n_blocks, dtype=int)
+    blocks = pd.DataFrame({
+        'animal_id': animal_ids.astype(str),
+        'cs_id': dataframe['cs_id'].to_numpy()[::n_samples].astype(str),
+    })
+
+    boundaries = np.flatnonzero(animal_ids[1:] != animal_ids[:-1]
+                                )*n_samples + n_samples
+    boundaries = np.append(boundaries, len(dataframe))
+
+    return blocks, boundaries
+
+
+def _score_sweep(
+        detected,
+        blocks,
+        reference,
+        reference_column,
+        cs_epoch,
+        settings,
+):
+    # Score the detection of every setting (detected has shape
+    # (*settings, blocks)) against the reference scoring of each cs trial.
+    # settings maps the parameter names to grids with shape settings.
+
+    # Align the reference scoring with the cs trials
+    reference = reference.copy()
+    if 'cs_epoch' in reference.columns:
+        reference = reference[reference['cs_epoch'] == cs_epoch]
+    if 'animal_id' not in reference.columns:
+        reference['animal_id'] = '0'
+    reference = reference.astype({'animal_id': str, 'cs_id': str})
+    expected = blocks.merge(reference[['animal_id', 'cs_id',
+                                       reference_column]],
+                            on=['animal_id', 'cs_id'],
+                            how='left',
+                            )[reference_column].to_numpy(dtype=float)
+
+    valid = ~np.isnan(expected)
+    detected = detected[..., valid]
+    expected = expected[valid]
+    error = detected - expected
+
+    # Pearson correlation for every setting
+    detected_centered = detected - detected.mean(axis=-1, keepdims=True)
+    expected_centered = expected - expected.mean()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r = ((detected_centered*expected_centered).sum(axis=-1)
+             / np.sqrt((detected_centered**2).sum(axis=-1)
+                       * (expected_centered**2).sum()))
+
+    scores = pd.DataFrame({
+        **{name: grid.ravel() for name, grid in settings.items()},
+        'r': r.ravel(),
+        'bias': error.mean(axis=-1).ravel(),
+        'mae': np.abs(error).mean(axis=-1).ravel(),
+        'n_cs': int(valid.sum()),
+    })
+
+    # Error per cs_id: average the cs trials of all the animals
+    cs_codes, cs_ids = pd.factorize(blocks['cs_id'].to_numpy()[valid])
+    counts = np.bincount(cs_codes, minlength=len(cs_ids))
+    one_hot = np.zeros((len(cs_codes), len(cs_ids)))
+    one_hot[np.arange(len(cs_codes)), cs_codes] = 1/counts[cs_codes]
+    per_cs_bias = error @ one_hot
+    per_cs_mae = np.abs(error) @ one_hot
+
+    n_settings = r.size
+    per_cs_error = pd.DataFrame({
+        **{name: np.repeat(grid.ravel(), len(cs_ids))
+           for name, grid in settings.items()},
+        'cs_id': np.tile(cs_ids, n_settings),
+        'bias': per_cs_bias.ravel(),
+        'mae': per_cs_mae.ravel(),
+    })
+
+    return scores, per_cs_error
+
+##############################################################################
+
+
+def sweep_freezing_parameters(
+        dataframe,
+        bodyparts,
+        motion_thresholds,
+        min_freezing_durations,
+        reference,
+        reference_column='freezing_norm',
+        cs_epoch='peri_cs',
+        protocol=None,
+):
+    """Score a grid of freezing parameters against a reference scoring.
+
+    Freezing is detected like extract_freezing_events() for every
+    combination of motion_threshold and min_freezing_duration, and
+    normalized and rounded like calculate_mean_freezing(), so the best
+    setting reproduces the freezing_norm of the pipeline. The grid is
+    evaluated in one batched pass over the euclidean distance arrays.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Trial-aligned dataframe with ed_{bodypart} columns, as created by
+        calculate_euclidean_distance_dataframe(). Dataframes of several
+        animals can be concatenated; they are told apart by animal_id.
+
+    bodyparts : list of str
+        Bodyparts that must all be bellow threshold (eg. ['head']).
+
+    motion_thresholds : array_like of float
+        Euclidean distance thresholds to evaluate. Thresholds based on the
+        signal can be built with calculate_threshold().
+
+    min_freezing_durations : array_like of int
+        Minimum freezing durations (in frames) to evaluate. Durations
+        bellow 1 keep every freezing frame, like a duration of 1.
+
+    reference : pandas.DataFrame
+        Manual scoring in long format with the columns cs_id,
+        reference_column and optionally animal_id and cs_epoch (eg. the
+        RT or EZ scores of notebook 4 after melting).
+
+    reference_column : str, optional
+        Column of `reference` with the normalized freezing (0 to 1).
+
+    cs_epoch : str, optional
+        Epoch to score.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials.
+
+    Returns
+    -------
+    scores : DataFrame
+        One row per setting with the pearson correlation (r), bias
+        (mean of detected - reference), mean absolute error (mae) and the
+        number of cs compared.
+    per_cs_error : DataFrame
+        One row per setting and cs_id with the bias and mae.
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    thresholds = np.asarray(motion_thresholds, dtype=float)
+    durations = np.asarray(min_freezing_durations, dtype=int)
+    n_samples = protocol.n_samples
+    start, stop = protocol.analysis_bounds[cs_epoch]
+
+    blocks, boundaries = _cs_blocks(dataframe, n_samples)
+
+    # Frames where all the bodyparts are bellow each threshold
+    # shape: (thresholds, frames)
+    distance = dataframe[[f'ed_{bodypart}' for bodypart in bodyparts]
+                         ].to_numpy(dtype=float).max(axis=1)
+    below = distance[np.newaxis, :] < thresholds[:, np.newaxis]
+
+    # Runs must not continue between animals or between thresholds:
+    # insert a False frame at every boundary before flattening.
+    padded = np.insert(below, boundaries, False, axis=1)
+    run_length = calculate_run_length_per_frame(padded.ravel())
+    run_length = np.delete(run_length.reshape(padded.shape),
+                           boundaries + np.arange(len(boundaries)),
+                           axis=1)
+    run_length = run_length.reshape(len(thresholds), len(blocks), n_samples
+                                    )[:, :, start:stop]
+
+    # Normalized freezing per setting and cs trial, rounded like
+    # calculate_mean_freezing(). Frames without freezing have a run length
+    # of 0, so a duration bellow 1 counts as 1.
+    # shape: (thresholds, durations, blocks)
+    freezing = np.stack([(run_length >= max(duration, 1)).sum(axis=-1)
+                         for duration in durations], axis=1)
+    freezing = np.round(freezing/(stop - start), 2)
+
+    grid_threshold, grid_duration = np.meshgrid(thresholds, durations,
+                                                indexing='ij')
+    return _score_sweep(freezing, blocks, reference, reference_column,
+                        cs_epoch, {'motion_threshold': grid_threshold,
+                                   'min_freezing_duration': grid_duration})
+
+##############################################################################
+
+
+def _count_epoch_onsets(start, stop, n_samples, window_start, epoch):
+    # Return (run, block) of the darting onsets counted in the epoch, like
+    # calculate_epoch_summary(): runs are split at the trial boundaries and
+    # a run already running at the start of the analysis window counts
+    # there.
+    first = start // n_samples
+    n_trials = (stop - 1)//n_samples - first + 1
+    run_index = np.repeat(np.arange(len(start)), n_trials)
+    block = (np.repeat(first, n_trials) + np.arange(len(run_index))
+             - np.repeat(np.cumsum(n_trials) - n_trials, n_trials))
+
+    local_start = np.maximum(start[run_index] - block*n_samples, 0)
+    local_stop = np.minimum(stop[run_index] - block*n_samples, n_samples)
+    onset = np.maximum(local_start, window_start)
+    counted = ((onset < local_stop) & (onset >= epoch[0])
+               & (onset < epoch[1]))
+
+    return run_index[counted], block[counted]
+
+
+def sweep_darting_parameters(
+        dataframe,
+        bodypart,
+        factors,
+        threshold_distances,
+        reference,
+        reference_column='darting_events',
+        cs_epoch='peri_cs',
+        protocol=None,
+):
+    """Score a grid of darting parameters against a reference scoring.
+
+    Darting is detected like the pipeline does for every combination of
+    the calculate_threshold() factor and threshold_distance: the speed
+    threshold of each animal is calculate_threshold(speed_{bodypart},
+    factor), the runs above it are found in smooth_speed_{bodypart} (or
+    speed_{bodypart} without smoothing) and kept like
+    extract_darting_events() when the ed_{bodypart} covered is above
+    threshold_distance. The events are counted per cs like the
+    darting_events of calculate_epoch_summary(). The runs are detected
+    once per factor and shared by all the distance thresholds.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Trial-aligned dataframe with the speed_{bodypart} and ed_{bodypart}
+        columns, as created by calculate_speed_dataframe(). Dataframes of
+        several animals can be concatenated; they are told apart by
+        animal_id.
+
+    bodypart : str
+        Bodypart used to detect darting (eg. 'head').
+
+    factors : array_like of float
+        Factors of calculate_threshold() to evaluate.
+
+    threshold_distances : array_like of float
+        Minimum distances (cm) covered by a darting event to evaluate.
+
+    reference : pandas.DataFrame
+        Manual scoring in long format with the columns cs_id,
+        reference_column and optionally animal_id and cs_epoch.
+
+    reference_column : str, optional
+        Column of `reference` with the number of darting events.
+
+    cs_epoch : str, optional
+        Epoch to score.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials.
+
+    Returns
+    -------
+    scores : DataFrame
+        One row per setting with the pearson correlation (r), bias
+        (mean of detected - reference), mean absolute error (mae) and the
+        number of cs compared.
+    per_cs_error : DataFrame
+        One row per setting and cs_id with the bias and mae.
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    factors = np.asarray(factors, dtype=float)
+    threshold_distances = np.asarray(threshold_distances, dtype=float)
+    n_samples = protocol.n_samples
+    bounds = protocol.analysis_bounds
+    window_start = min(start for start, _ in bounds.values())
+
+    blocks, boundaries = _cs_blocks(dataframe, n_samples)
+    animal_starts = np.concatenate([[0], boundaries[:-1]])
+
+    speed = dataframe[f'speed_{bodypart}'].to_numpy(dtype=float)
+    smooth_speed = dataframe.get(f'smooth_speed_{bodypart}',
+                                 dataframe[f'speed_{bodypart}']
+                                 ).to_numpy(dtype=float)
+
+    # Mean and std of the speed of each animal (see calculate_threshold())
+    mean = np.array([np.nanmean(speed[start:stop])
+                     for start, stop in zip(animal_starts, boundaries)])
+    std = np.array([np.nanstd(speed[start:stop])
+                    for start, stop in zip(animal_starts, boundaries)])
+
+    # Runs must not continue between animals: insert a False frame after
+    # every animal, then map the runs back to the rows of the dataframe.
+    padding = boundaries + np.arange(len(boundaries))
+    distance = np.insert(dataframe[f'ed_{bodypart}'].to_numpy(dtype=float),
+                         boundaries, 0)
+
+    # Number of darting events per setting and cs trial
+    # shape: (factors, threshold_distances, blocks)
+    darting = np.zeros((len(factors), len(threshold_distances),
+                        len(blocks)))
+    for i, factor in enumerate(factors):
+        threshold = np.repeat(np.round(mean + factor*std),
+                              boundaries - animal_starts)
+        runs = detect_runs(np.insert(smooth_speed > threshold, boundaries,
+                                     False),
+                           values=distance)
+        start = runs['start'] - np.searchsorted(padding, runs['start'])
+        stop = runs['stop'] - np.searchsorted(padding, runs['stop'])
+
+        run_index, block = _count_epoch_onsets(start, stop, n_samples,
+                                               window_start,
+                                               bounds[cs_epoch])
+        for j, threshold_distance in enumerate(threshold_distances):
+            keep = runs['distance'][run_index] > threshold_distance
+            darting[i, j] = np.bincount(block[keep], minlength=len(blocks))
+
+    grid_factor, grid_distance = np.meshgrid(factors, threshold_distances,
+                                             indexing='ij')
+    return _score_sweep(darting, blocks, reference, reference_column,
+                        cs_epoch, {'factor': grid_factor,
+                                   'threshold_distance': grid_distance})
+
+##############################################################################
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+from behavior.utils.classProtocol import Protocol
+
+# Summary columns used as metrics by default
+METRIC_PREFIXES = ('freezing_', 'darting_', 'total_distance_', 'mean_speed_')
+
+# Columns describing each animal
+COORDINATE_COLUMNS = ['animal_id', 'session', 'treatment', 'sex']
+
+# Columns identifying an entry of the animal axis
+ANIMAL_COLUMNS = ['animal_id', 'session']
+
+
+class CohortTensor():
+    """Create a class to hold the summary of a cohort as a labeled array.
+
+    The values have shape (animals, cs, epochs, metrics). Each entry of the
+    animal axis is one animal in one session (or one animal when there is
+    no session column), described by a row of `coords` (animal_id, session,
+    treatment and sex). Group statistics are computed with segmented
+    reductions over the animal axis.
+    """
+
+    def __init__(
+            self,
+            values,
+            coords,
+            cs_ids,
+            cs_epochs,
+            metrics,
+    ):
+
+        self.values = values
+        self.coords = coords.reset_index(drop=True)
+        self.cs_ids = list(cs_ids)
+        self.cs_epochs = list(cs_epochs)
+        self.metrics = list(metrics)
+
+    @classmethod
+    def from_summary(
+            cls,
+            dataframe,
+            metrics=None,
+    ):
+        """Create a tensor from summary statistics in the long format.
+
+        Parameters
+        ----------
+        dataframe : pandas.DataFrame
+            One row per animal, cs_id and cs_epoch, eg. the output of
+            concatenate_transformed_dataframes().
+
+        metrics : list of str, optional
+            Columns to keep. Defaults to the freezing, darting, distance and
+            speed columns.
+
+        Returns
+        -------
+        tensor : CohortTensor
+            Missing (animal, cs, epoch) combinations are NaN.
+        """
+        if metrics is None:
+            metrics = [column for column in dataframe.columns
+                       if column.startswith(METRIC_PREFIXES)]
+        if 'animal_id' not in dataframe.columns:
+            raise ValueError('The summary has no animal_id column')
+        coordinate_columns = [column for column in COORDINATE_COLUMNS
+                              if column in dataframe.columns]
+        animal_columns = [column for column in ANIMAL_COLUMNS
+                          if column in dataframe.columns]
+
+        # One entry per animal and session
+        animal_codes = dataframe.groupby(animal_columns, sort=True,
+                                         dropna=False).ngroup().to_numpy()
+        coords = dataframe[coordinate_columns].iloc[
+            np.unique(animal_codes, return_index=True)[1]]
+
+        cs_codes, cs_ids = pd.factorize(dataframe['cs_id'], sort=True)
+        cs_epochs = [epoch for epoch in Protocol.epochs
+                     if epoch in set(dataframe['cs_epoch'])]
+        epoch_codes = pd.Categorical(dataframe['cs_epoch'],
+                                     categories=cs_epochs).codes
+
+        shape = (len(coords), len(cs_ids), len(cs_epochs), len(metrics))
+        flat_index = np.ravel_multi_index((animal_codes, cs_codes,
+                                           epoch_codes), shape[:3])
+        if len(np.unique(flat_index)) != len(flat_index):
+            raise ValueError(f'There are several rows for the same '
+                             f'{animal_columns}, cs_id and cs_epoch')
+
+        values = np.full(shape, np.nan)
+        values.reshape(-1, len(metrics))[flat_index] = dataframe[
+            metrics].to_numpy(dtype=float)
+
+        return cls(values, coords, cs_ids, cs_epochs, metrics)
+
+    def select(self, **coords):
+        """Return the animals matching the coordinates.
+
+        Eg. tensor.select(treatment='a', session='tes01').
+        """
+        mask = np.ones(len(self.coords), dtype=bool)
+        for column, value in coords.items():
+            mask &= (self.coords[column] == value).to_numpy()
+        return CohortTensor(self.values[mask], self.coords[mask],
+                            self.cs_ids, self.cs_epochs, self.metrics)
+
+    def normalize(
+            self,
+            reference_epoch='pre_cs',
+            reference_cs=None,
+            method='subtract',
+    ):
+        """Normalize each animal to its own baseline.
+
+        Parameters
+        ----------
+        reference_epoch : str, optional
+            Epoch used as baseline.
+
+        reference_cs : str, optional
+            cs used as baseline for every cs (eg. 'cs_01'). By default each
+            cs is normalized to its own reference epoch.
+
+        method : str, optional
+            'subtract' the baseline or 'divide' by it.
+
+        Returns
+        -------
+        tensor : CohortTensor
+        """
+        epoch = self.cs_epochs.index(reference_epoch)
+        if reference_cs is None:
+            baseline = self.values[:, :, epoch:epoch+1]
+        else:
+            cs = self.cs_ids.index(reference_cs)
+            baseline = self.values[:, cs:cs+1, epoch:epoch+1]
+
+        if method == 'subtract':
+            values = self.values - baseline
+        elif method == 'divide':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = self.values/baseline
+        else:
+            raise ValueError(f"method must be 'subtract' or 'divide', "
+                             f"not {method}")
+
+        return CohortTensor(values, self.coords, self.cs_ids, self.cs_epochs,
+                            self.metrics)
+
+    def aggregate(self, by='treatment'):
+        """Calculate the mean, SEM and number of animals per group.
+
+        Parameters
+        ----------
+        by : str or list of str, optional
+            Coordinates defining the groups (eg. ['treatment', 'sex']).
+
+        Returns
+        -------
+        groups : pandas.DataFrame
+            The coordinates of each group.
+        mean, sem : numpy.ndarray
+            Arrays with shape (groups, cs, epochs, metrics), ignoring NaN.
+        n : numpy.ndarray
+            Number of animals with a value in each entry.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        group_codes = self.coords.groupby(by, sort=True, dropna=False
+                                          ).ngroup().to_numpy()
+
+        # Sort the animals by group to reduce contiguous segments
+        order = np.argsort(group_codes, kind='stable')
+        codes = group_codes[order]
+        values = self.values[order]
+        starts = np.flatnonzero(np.diff(codes, prepend=-1))
+        groups = self.coords[by].iloc[order[starts]].reset_index(drop=True)
+
+        valid = ~np.isnan(values)
+        n = np.add.reduceat(valid, starts, axis=0)
+        total = np.add.reduceat(np.where(valid, values, 0), starts, axis=0)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            mean = total/n
+            deviation = np.where(valid, values - mean[codes], 0)
+            variance = np.add.reduceat(deviation**2, starts, axis=0)/(n - 1)
+            sem = np.sqrt(variance/n)
+
+        return groups, mean, sem, n
+
+    def aggregate_dataframe(self, by='treatment'):
+        """Return aggregate() in the long format.
+
+        One row per group, cs_id and cs_epoch, with the columns {metric}_mean,
+        {metric}_sem and {metric}_n.
+        """
+        groups, mean, sem, n = self.aggregate(by)
+        n_cells = len(self.cs_ids)*len(self.cs_epochs)
+
+        dataframe = groups.loc[groups.index.repeat(n_cells)
+                               ].reset_index(drop=True)
+        dataframe['cs_id'] = np.tile(np.repeat(self.cs_ids,
+                                               len(self.cs_epochs)),
+                                     len(groups))
+        dataframe['cs_epoch'] = np.tile(self.cs_epochs,
+                                        len(groups)*len(self.cs_ids))
+        for name, array in [('mean', mean), ('sem', sem), ('n', n)]:
+            flat = array.reshape(-1, len(self.metrics))
+            for column, metric in enumerate(self.metrics):
+                dataframe[f'{metric}_{name}'] = flat[:, column]
+
+        return dataframe
+
+##############################################################################
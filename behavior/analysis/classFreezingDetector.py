@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+from behavior.analysis.kinematics import PIXEL_TO_CM, extract_coordinate_arrays
+from behavior.analysis.run_length import RUN_DTYPE, runs_to_mask
+
+
+class FreezingDetector():
+    """Create a class to detect freezing online, one frame at a time.
+
+    Uses the same rule as extract_freezing_events(): a sample is still when
+    the displacement of every bodypart is bellow the motion threshold, and
+    freezing is a run of at least min_freezing_duration still samples.
+    Sample i is the displacement between frames i and i+1, so the sample
+    completed by frame k is k-1.
+
+    Only the previous coordinates and the current run are kept, so the
+    state does not grow with the length of the recording.
+    """
+
+    __slots__ = ('motion_threshold', 'min_freezing_duration', 'scale',
+                 'n_frames', 'run_start', 'run_length', 'freezing',
+                 '_previous')
+
+    def __init__(
+            self,
+            motion_threshold,
+            min_freezing_duration,
+            convert=True,
+    ):
+
+        self.motion_threshold = motion_threshold
+        self.min_freezing_duration = min_freezing_duration
+        # Convert pix to cm: 28 cm = 330 pix
+        self.scale = PIXEL_TO_CM if convert else 1.
+        self.reset()
+
+    def reset(self):
+        """Forget the previous frames."""
+        self.n_frames = 0
+        self.run_start = 0
+        self.run_length = 0
+        self.freezing = False
+        self._previous = None
+
+    def update(self, coordinates):
+        """Process the next frame.
+
+        Parameters
+        ----------
+        coordinates : array-like
+            x, y coordinates of the bodyparts, with shape (bodyparts, 2).
+
+        Returns
+        -------
+        event : tuple or None
+            ('onset', sample) when the current run reaches the minimum
+            duration, with the first sample of the run, or ('offset',
+            sample) when a freezing ends, with the first sample after it.
+        """
+        coordinates = np.array(coordinates, dtype=float)
+        event = None
+
+        if self._previous is not None:
+            step = coordinates - self._previous
+            displacement = np.hypot(step[:, 0], step[:, 1])*self.scale
+            # NaN coordinates are not still, as in the batch detection
+            still = bool((displacement < self.motion_threshold).all())
+            sample = self.n_frames - 1
+
+            if still:
+                if self.run_length == 0:
+                    self.run_start = sample
+                self.run_length += 1
+                if not self.freezing \
+                        and self.run_length >= self.min_freezing_duration:
+                    self.freezing = True
+                    event = ('onset', self.run_start)
+            else:
+                if self.freezing:
+                    self.freezing = False
+                    event = ('offset', sample)
+                self.run_length = 0
+
+        self._previous = coordinates
+        self.n_frames += 1
+
+        return event
+
+##############################################################################
+
+
+def replay_freezing_detector(
+        dataframe,
+        bodyparts,
+        motion_threshold,
+        min_freezing_duration,
+        convert=True,
+):
+    """Feed a recorded deeplabcut dataframe to a FreezingDetector.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Data output from deeplabcut with (scorer, bodypart, coord) columns.
+
+    bodyparts : list of str
+
+    motion_threshold : float
+
+    min_freezing_duration : int
+
+    convert : bool, optional
+        Convert pixel to cm: 28 cm = 330 pix
+
+    Returns
+    -------
+    freezing_events : numpy.ndarray
+        1 for the freezing samples, with one sample less than the frames,
+        as extract_freezing_events() on the displacement of each frame.
+
+    events : list of tuple
+        The events returned by FreezingDetector.update(). A freezing still
+        going on at the end of the recording is closed at the last sample.
+    """
+    _, x, y = extract_coordinate_arrays(dataframe, bodyparts)
+    detector = FreezingDetector(motion_threshold, min_freezing_duration,
+                                convert=convert)
+
+    events = []
+    for coordinates in np.stack([x, y], axis=-1):
+        event = detector.update(coordinates)
+        if event is not None:
+            events.append(event)
+
+    n_samples = max(len(x) - 1, 0)
+    if detector.freezing:
+        events.append(('offset', n_samples))
+
+    starts = [sample for name, sample in events if name == 'onset']
+    stops = [sample for name, sample in events if name == 'offset']
+    runs = np.zeros(len(starts), dtype=RUN_DTYPE)
+    runs['start'] = starts
+    runs['stop'] = stops
+    runs['length'] = runs['stop'] - runs['start']
+
+    return runs_to_mask(runs, n_samples), events
+
+##############################################################################
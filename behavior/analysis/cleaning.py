@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import pandas as pd
+import numpy as np
+from behavior.analysis.kinematics import extract_bodypart_list
+
+
+##############################################################################
+
+def clean_dlc_coordinates(
+        dataframe,
+        likelihood_cutoff=0.9,
+        max_gap=5,
+        bodyparts=None,
+):
+    """Remove low-confidence deeplabcut points and fill the short gaps.
+
+    Points with a likelihood bellow the cutoff are masked. Gaps up to
+    max_gap frames between two valid points are filled by linear
+    interpolation. Longer gaps, and gaps at the start or end of the
+    recording, are flagged and left as NaN.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Data output from deeplabcut with (scorer, bodypart, coord) columns.
+
+    likelihood_cutoff : float, optional
+        Minimum likelihood of a valid point.
+
+    max_gap : int, optional
+        Maximum number of consecutive frames to interpolate.
+
+    bodyparts : list of str, optional
+        Bodyparts to clean. Defaults to all the bodyparts in the dataframe.
+
+    Returns
+    -------
+    cleaned : pandas.DataFrame
+        Copy of the dataframe with the x, y coordinates cleaned.
+    dropout : pandas.DataFrame
+        Statistics per bodypart: number of frames bellow the cutoff,
+        dropout fraction, number of gaps, longest gap, and number of
+        frames interpolated or flagged (left as NaN).
+    """
+    if bodyparts is None:
+        bodyparts = extract_bodypart_list(dataframe)
+
+    scorer = dataframe.columns.get_level_values(0)[0]
+    x_columns = [(scorer, bodypart, 'x') for bodypart in bodyparts]
+    y_columns = [(scorer, bodypart, 'y') for bodypart in bodyparts]
+    likelihood_columns = [(scorer, bodypart, 'likelihood')
+                          for bodypart in bodyparts]
+
+    # shape: (frames, bodyparts)
+    x = dataframe[x_columns].to_numpy(dtype=float, copy=True)
+    y = dataframe[y_columns].to_numpy(dtype=float, copy=True)
+    likelihood = dataframe[likelihood_columns].to_numpy(dtype=float)
+    n_frames = len(x)
+
+    valid = likelihood >= likelihood_cutoff
+    valid &= ~(np.isnan(x) | np.isnan(y))
+
+    # Index of the previous and next valid frame of every frame
+    frames = np.arange(n_frames)[:, np.newaxis]
+    previous = np.maximum.accumulate(np.where(valid, frames, -1), axis=0)
+    following = np.minimum.accumulate(
+        np.where(valid, frames, n_frames)[::-1], axis=0)[::-1]
+
+    # Length of the gap each invalid frame belongs to
+    gap_length = following - previous - 1
+    interior = (previous >= 0) & (following < n_frames)
+    fill = ~valid & interior & (gap_length <= max_gap)
+    flagged = ~valid & ~fill
+
+    # Linear interpolation between the previous and next valid frames
+    previous = previous.clip(0, n_frames - 1)
+    following = following.clip(0, n_frames - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = (frames - previous)/(following - previous)
+
+    for array in (x, y):
+        before = np.take_along_axis(array, previous, axis=0)
+        after = np.take_along_axis(array, following, axis=0)
+        array[fill] = (before + (after - before)*weight)[fill]
+        array[flagged] = np.nan
+
+    cleaned = dataframe.copy()
+    cleaned[x_columns] = x
+    cleaned[y_columns] = y
+
+    # Dropout statistics per bodypart
+    invalid = ~valid
+    gap_starts = invalid & ~np.vstack([np.zeros((1, len(bodyparts)), bool),
+                                       invalid[:-1]])
+    dropout = pd.DataFrame({
+        'bodypart': bodyparts,
+        'n_frames': n_frames,
+        'n_low_likelihood': invalid.sum(axis=0),
+        'dropout_fraction': invalid.mean(axis=0) if n_frames else 0.,
+        'n_gaps': gap_starts.sum(axis=0),
+        'longest_gap': np.where(invalid, gap_length, 0).max(axis=0,
+                                                            initial=0),
+        'n_interpolated': fill.sum(axis=0),
+        'n_flagged': flagged.sum(axis=0),
+    })
+
+    return cleaned, dropout
+
+##############################################################################
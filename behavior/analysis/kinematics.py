@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+
+# Convert pix to cm: 28 cm = 330 pix
+PIXEL_TO_CM = 28/330
+
+
+##############################################################################
+
+def extract_bodypart_list(dataframe):
+    """Return the bodyparts of a deeplabcut dataframe in column order.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Data output from deeplabcut with (scorer, bodypart, coord) columns.
+
+    Returns
+    -------
+    bodypart_list : list of str
+    """
+    return list(dict.fromkeys(dataframe.columns.get_level_values(-2)))
+
+##############################################################################
+
+
+def extract_frame_index(dataframe):
+    """Return the frame number of each row of a deeplabcut dataframe.
+
+    The dataframe index is used when it holds integer frame numbers (eg. a
+    dataframe from read_dlc_cs_windows()), otherwise the row position.
+    """
+    if pd.api.types.is_integer_dtype(dataframe.index):
+        return dataframe.index.to_numpy()
+    return np.arange(len(dataframe))
+
+##############################################################################
+
+
+def extract_coordinate_arrays(dataframe, bodyparts=None):
+    """Extract the x, y coordinates of all bodyparts as 2D arrays.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Data output from deeplabcut with (scorer, bodypart, coord) columns.
+
+    bodyparts : list of str, optional
+        Bodyparts to extract. Defaults to all the bodyparts in the dataframe.
+
+    Returns
+    -------
+    bodyparts : list of str
+    x, y : numpy.ndarray
+        Arrays with shape (frames, bodyparts).
+    """
+    if bodyparts is None:
+        bodyparts = extract_bodypart_list(dataframe)
+
+    # Drop the scorer level to access the columns by (bodypart, coord)
+    coords = dataframe.droplevel(0, axis=1) if dataframe.columns.nlevels == 3 \
+        else dataframe
+
+    x = np.column_stack([coords[(bodypart, 'x')].to_numpy(dtype=float)
+                         for bodypart in bodyparts])
+    y = np.column_stack([coords[(bodypart, 'y')].to_numpy(dtype=float)
+                         for bodypart in bodyparts])
+
+    return list(bodyparts), x, y
+
+##############################################################################
+
+
+def calculate_kinematics(
+        dataframe,
+        frame_rate,
+        convert=False,
+        bodyparts=None,
+):
+    """Calculate displacement, speed and cumulative distance per bodypart.
+
+    All the bodyparts are processed at once. The displacement at frame i is
+    the euclidean distance between frames i and i+1, so every array has one
+    row less than the deeplabcut dataframe.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Data output from deeplabcut with (scorer, bodypart, coord) columns.
+
+    frame_rate : float
+        Aquisition rate in frames per second.
+
+    convert : bool, optional
+        Convert pixel to cm: 28 cm = 330 pix
+
+    bodyparts : list of str, optional
+        Bodyparts to process. Defaults to all the bodyparts in the dataframe.
+
+    Returns
+    -------
+    kinematics : dict
+        'bodyparts' : list of str, the column order of the arrays.
+        'displacement' : numpy.ndarray (frames-1, bodyparts)
+        'speed' : numpy.ndarray (frames-1, bodyparts)
+        'cumulative_distance' : numpy.ndarray (frames-1, bodyparts)
+        'frame_index' : numpy.ndarray (frames-1,), frame number of each row.
+    """
+    bodyparts, x, y = extract_coordinate_arrays(dataframe, bodyparts)
+
+    displacement = np.hypot(np.diff(x, axis=0), np.diff(y, axis=0))
+
+    if convert:
+        displacement *= PIXEL_TO_CM
+
+    kinematics = {
+        'bodyparts': bodyparts,
+        'displacement': displacement,
+        'speed': displacement*frame_rate,
+        'cumulative_distance': np.cumsum(displacement, axis=0),
+        'frame_index': extract_frame_index(dataframe)[:-1],
+    }
+
+    return kinematics
+
+##############################################################################
+
+
+def smooth_signals(
+        array,
+        window_length=9,
+        polyorder=1,
+        deriv=0,
+        delta=1.0,
+        segments=None,
+):
+    """Apply a Savitzky-Golay filter along the time axis of all signals.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Signals with shape (frames,) or (frames, signals).
+
+    window_length, polyorder : int, optional
+        Parameters of scipy.signal.savgol_filter().
+
+    deriv : int, optional
+        Order of the derivative to compute (0 smooths the signals).
+
+    delta : float, optional
+        Time between samples, used when deriv > 0 (eg. 1/frame_rate).
+
+    segments : numpy.ndarray, optional
+        Label of the continuous segment of each frame (eg. a trial). The
+        filter does not cross from one segment to the next.
+
+    Returns
+    -------
+    smoothed : numpy.ndarray
+        Array with the same shape. Segments shorter than the window are
+        left unfiltered (or zero for derivatives). NaN values spread to the
+        samples within half a window.
+
+    Notes
+    -----
+    The edges of a segment are fitted with mode='interp' of
+    scipy.signal.savgol_filter(), which does not accept NaN. A segment
+    with a NaN (eg. a frame flagged by clean_dlc_coordinates()) is filtered
+    with mode='nearest' instead, which repeats the edge samples. Only the
+    first and last window_length // 2 samples of that segment differ from
+    the mode='interp' filter; the interior samples are the same.
+    """
+    from scipy.signal import savgol_filter
+
+    array = np.asarray(array, dtype=float)
+    if segments is None:
+        bounds = [0, len(array)]
+    else:
+        segments = np.asarray(segments)
+        bounds = np.concatenate([[0],
+                                 np.flatnonzero(segments[1:] != segments[:-1])
+                                 + 1,
+                                 [len(array)]])
+
+    smoothed = np.zeros_like(array) if deriv else array.copy()
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop - start < window_length:
+            continue
+        segment = array[start:stop]
+        # The polynomial fit of the edges does not accept NaN (eg. frames
+        # flagged by clean_dlc_coordinates()); extend the edges instead
+        mode = 'interp' if np.isfinite(segment).all() else 'nearest'
+        smoothed[start:stop] = savgol_filter(segment,
+                                             window_length=window_length,
+                                             polyorder=polyorder,
+                                             deriv=deriv,
+                                             delta=delta,
+                                             axis=0,
+                                             mode=mode,
+                                             )
+    return smoothed
+
+##############################################################################
+
+
+def calculate_velocity(
+        dataframe,
+        frame_rate,
+        convert=False,
+        bodyparts=None,
+        window_length=9,
+        polyorder=2,
+):
+    """Calculate the smoothed velocity of all bodyparts.
+
+    The velocity is the Savitzky-Golay derivative of the x, y coordinates,
+    computed once over the (frames, bodyparts) arrays. Gaps in the frame
+    numbers (eg. between windows from read_dlc_cs_windows()) are not
+    crossed by the filter.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Data output from deeplabcut with (scorer, bodypart, coord) columns.
+
+    frame_rate : float
+        Aquisition rate in frames per second.
+
+    convert : bool, optional
+        Convert pixel to cm: 28 cm = 330 pix
+
+    bodyparts : list of str, optional
+        Bodyparts to process. Defaults to all the bodyparts in the dataframe.
+
+    window_length, polyorder : int, optional
+        Parameters of the Savitzky-Golay filter.
+
+    Returns
+    -------
+    velocity : dict
+        'bodyparts' : list of str, the column order of the arrays.
+        'velocity_x', 'velocity_y' : numpy.ndarray (frames, bodyparts)
+        'speed' : numpy.ndarray (frames, bodyparts), norm of the velocity.
+        'frame_index' : numpy.ndarray (frames,)
+    """
+    bodyparts, x, y = extract_coordinate_arrays(dataframe, bodyparts)
+    frame_index = extract_frame_index(dataframe)
+
+    # Label the continuous runs of frames
+    segments = np.concatenate([[0], np.cumsum(np.diff(frame_index) != 1)])
+
+    velocity_x, velocity_y = (smooth_signals(array,
+                                             window_length=window_length,
+                                             polyorder=polyorder,
+                                             deriv=1,
+                                             delta=1/frame_rate,
+                                             segments=segments,
+                                             ) for array in (x, y))
+    if convert:
+        velocity_x *= PIXEL_TO_CM
+        velocity_y *= PIXEL_TO_CM
+
+    velocity = {
+        'bodyparts': bodyparts,
+        'velocity_x': velocity_x,
+        'velocity_y': velocity_y,
+        'speed': np.hypot(velocity_x, velocity_y),
+        'frame_index': frame_index,
+    }
+
+    return velocity
+
+##############################################################################
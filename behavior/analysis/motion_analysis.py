@@ -9,7 +9,20 @@ Licensed under GNU Lesser General Public License v3.0
 
 import pandas as pd
 import numpy as np
-from scipy.signal import savgol_filter
+from behavior.analysis.kinematics import (
+    PIXEL_TO_CM,
+    calculate_kinematics,
+    calculate_velocity,
+    extract_coordinate_arrays,
+    extract_frame_index,
+    smooth_signals,
+)
+from behavior.analysis.resampling import resample_cs_windows
+from behavior.analysis.run_length import detect_runs, runs_to_mask
+from behavior.analysis.summary import calculate_epoch_summary
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.classSessionIndex import SessionIndex
+from behavior.utils.organization import create_trial_aligned_dataframe
 
 
 ##############################################################################
@@ -29,17 +42,12 @@ def calculate_euclidean_distance(df, convert=False):
     -------
     array with distance values for each CS
     """
-    vector_distance = np.array([])
-
-    for index in range(0, len(df)-1):
-        x1, y1 = df.iloc[index, 0:2]
-        x2, y2 = df.iloc[index+1, 0:2]
-        distance = np.sqrt(np.square(x2-x1) + np.square(y2-y1))
-        vector_distance = np.append(vector_distance, distance)
+    coords = df.iloc[:, 0:2].to_numpy(dtype=float)
+    vector_distance = np.hypot(*np.diff(coords, axis=0).T)
 
     # Convert pix to cm: 28 cm = 330 pix
     if convert:
-        vector_distance = (vector_distance*28)/330
+        vector_distance = vector_distance*PIXEL_TO_CM
 
     return vector_distance
 
@@ -58,6 +66,7 @@ def calculate_euclidean_distance_dataframe(
     dataframe,
     rat,
     convert=True,
+    protocol=None,
 ):
     """Create a dataframe with the euclidean distance for each coord pair.
 
@@ -70,98 +79,48 @@ def calculate_euclidean_distance_dataframe(
     convert : bool, optional
         Convert pix to cm: 28 cm = 330 pix
 
+    protocol : Protocol object, optional
+        Timing of the cs trials. Defaults to 60 s pre-cs and 90 s after the
+        cs onset, interpolated to 30 fps.
+
     Returns
     -------
     dataframe_final
     euclidian_dict
     """
-    # Extract the list of unique bodyparts
-    bodypart_list = list({bodypart
-                          for scorer, bodypart, coord in dataframe.columns})
-
-    # Create a dictionary with the bodypart as key,
-    # and the x,y,likelihood dataframe as values
-    idx = pd.IndexSlice
-    dict_df = {bodypart: dataframe.loc[:, idx[:, bodypart]]
-               for bodypart in bodypart_list}
-
-    # Calculate the euclideand distance for each body part
-    euclidian_dict = {}
-
-    for bodypart in bodypart_list:
-
-        array = calculate_euclidean_distance(dict_df.get(bodypart),
-                                             convert=convert,
-                                             )
-        euclidian_dict.setdefault(bodypart)
-
-        # Instantiate dictionary to save the euclidian distances per cs
-        cs_array_dict = {}
-
-        for cs, cs_start in rat.cs_start.items():  # Loops through all the cs
-
-            cs_array_dict.setdefault(cs)
-
-            # Slice the corresponding cs epoch:
-            # 60 seconds before cs_start : 90 seconds after
-            start = int(cs_start - (60*rat.frame_rate))
-            end = int(cs_start + (90*rat.frame_rate))
-
-            # Interpolate the array to correspond to 30fps of aquisition rate.
-            # real aquisition rate
-            old_length = np.linspace(start, end, num=(end-start), endpoint=True)
-            # new aquisition rate: 30 frames per second during 30 seconds
-            new_length = np.linspace(start, end, num=(150*30), endpoint=True)
-            x = new_length
-            xp = old_length
-            fp = array[start:end]
-
-            # Interpolate
-            yinterp = np.interp(x, xp, fp)
-
-            # Add the interpolation to the cs key
-            cs_array_dict[cs] = yinterp
-
-        # Add the results from each cs to the bodypart key
-        euclidian_dict[bodypart] = cs_array_dict
-
-    # Instantiate the DataFrame
-    columns = [
-        'user', 'exp_id', 'treatment',
-        'session', 'species', 'animal_id',
-        'session', 'cs_id', 'cs_epoch'
-    ]
-    number_cs = len(rat.cs_start.keys())
-    dataframe_final = pd.DataFrame(index=np.arange(1, 4500*number_cs+1),
-                                   columns=columns)
-
-    # Build the final dataframe to return
-    for bodypart in bodypart_list:
-        counter = 1
-        for cs, cs_start in rat.cs_start.items():
-            # cs = 'cs_01'
-            # cs_start = cs_index.get('cs_01')
-
-            # Update dataframe
-            start = counter
-            end = counter+4499
-
-            # Add the ed_bodypart to the dataframe_final
-            dataframe_final.loc[start:end, f'ed_{bodypart}'] = euclidian_dict.get(bodypart).get(cs)
-            dataframe_final.loc[start:end, 'cs_id'] = cs
-
-            # Conplete info
-            dataframe_final.loc[start:end, 'user'] = rat.user
-            dataframe_final.loc[start:end, 'exp_id'] = rat.experiment_id
-            dataframe_final.loc[start:end, 'session'] = rat.session
-            dataframe_final.loc[start:end, 'species'] = rat.species
-            dataframe_final.loc[start:end, 'animal_id'] = rat.animal_id
-
-            # Discriminate the cs_epoch
-            dataframe_final.loc[start:start+1800, 'cs_epoch'] = 'pre_cs'
-            dataframe_final.loc[start+1800:start+2700, 'cs_epoch'] = 'peri_cs'
-            dataframe_final.loc[start+2700:end, 'cs_epoch'] = 'post_cs'
-            counter += 4500
+    if protocol is None:
+        protocol = Protocol()
+
+    # Calculate the euclidean distance for all the bodyparts at once
+    kinematics = calculate_kinematics(dataframe,
+                                      rat.frame_rate,
+                                      convert=convert,
+                                      )
+    bodypart_list = kinematics['bodyparts']
+
+    # Interpolate every cs of every bodypart to the protocol frame rate
+    # shape: (cs, samples, bodyparts)
+    resampled = resample_cs_windows(kinematics['displacement'],
+                                    rat.cs_start.values(),
+                                    rat.frame_rate,
+                                    protocol,
+                                    frame_index=kinematics['frame_index'],
+                                    )
+
+    euclidian_dict = {
+        bodypart: {cs: resampled[row, :, column]
+                   for row, cs in enumerate(rat.cs_start)}
+        for column, bodypart in enumerate(bodypart_list)
+    }
+
+    signals = {f'ed_{bodypart}': resampled[:, :, column]
+               for column, bodypart in enumerate(bodypart_list)}
+
+    dataframe_final = create_trial_aligned_dataframe(rat,
+                                                     list(rat.cs_start),
+                                                     signals,
+                                                     protocol=protocol,
+                                                     )
 
     return dataframe_final, euclidian_dict
 
@@ -172,18 +131,126 @@ def calculate_speed_dataframe(
     dataframe,
     bodyparts_list,
     frame_rate,
+    window_length=9,
+    polyorder=1,
 ):
-    """Calculate the speed using the euclidean distance points."""
+    """Calculate the speed using the euclidean distance points.
+
+    Adds a speed_{bodypart} column and a smooth_speed_{bodypart} column
+    with the speed smoothed by a Savitzky-Golay filter. The filter runs
+    once over each whole cs trial for all the bodyparts, so the epoch
+    boundaries are smoothed like any other sample.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Dataframe from calculate_euclidean_distance_dataframe().
+
+    bodyparts_list : list of str
+
+    frame_rate : float
+
+    window_length, polyorder : int, optional
+        Parameters of the Savitzky-Golay filter.
+
+    Returns
+    -------
+    final_dataframe : pandas.DataFrame
+    """
+    # Convert all the euclidean distance columns in a single operation
+    distance = dataframe[[f'ed_{bodypart}' for bodypart in bodyparts_list]
+                         ].to_numpy(dtype=float)
+    speed = calculate_speed_per_frame(distance, frame_rate)
+    smooth_speed = smooth_signals(speed,
+                                  window_length=window_length,
+                                  polyorder=polyorder,
+                                  segments=pd.factorize(dataframe['cs_id'])[0],
+                                  )
+
     # Copy the dataframe to not edit the original.
     final_dataframe = dataframe.copy()
+    for column, bodypart in enumerate(bodyparts_list):
+        final_dataframe[f'speed_{bodypart}'] = speed[:, column]
+    for column, bodypart in enumerate(bodyparts_list):
+        final_dataframe[f'smooth_speed_{bodypart}'] = smooth_speed[:, column]
+
+    return final_dataframe
+
+###############################################################################
+
+
+def calculate_velocity_dataframe(
+    dataframe,
+    dlc_dataframe,
+    rat,
+    convert=True,
+    window_length=9,
+    polyorder=2,
+    protocol=None,
+):
+    """Add the smoothed velocity of every bodypart to a trial dataframe.
+
+    The velocity is computed once over the whole deeplabcut output with
+    calculate_velocity() and interpolated to the cs trials like the
+    coordinates. Adds the velocity_x_{bodypart} and velocity_y_{bodypart}
+    columns (cm/sec, or pix/sec without conversion).
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Trial-aligned dataframe of the animal, eg. from
+        calculate_speed_dataframe().
+
+    dlc_dataframe : pandas.DataFrame
+        Data output from deeplabcut the dataframe was computed from.
+
+    rat : rat object
+
+    convert : bool, optional
+        Convert pix to cm: 28 cm = 330 pix
 
-    for bodypart in bodyparts_list:
+    window_length, polyorder : int, optional
+        Parameters of the Savitzky-Golay filter.
 
-        speed_bodypart = calculate_speed_per_frame(
-            final_dataframe[f'ed_{bodypart}'], frame_rate
-            )
+    protocol : Protocol object, optional
+        Timing of the cs trials.
 
-        final_dataframe[f'speed_{bodypart}'] = speed_bodypart
+    Returns
+    -------
+    final_dataframe : pandas.DataFrame
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    velocity = calculate_velocity(dlc_dataframe,
+                                  rat.frame_rate,
+                                  convert=convert,
+                                  window_length=window_length,
+                                  polyorder=polyorder,
+                                  )
+    bodypart_list = velocity['bodyparts']
+
+    # shape: (cs, samples, coord*bodyparts)
+    resampled = resample_cs_windows(np.hstack([velocity['velocity_x'],
+                                               velocity['velocity_y']]),
+                                    rat.cs_start.values(),
+                                    rat.frame_rate,
+                                    protocol,
+                                    include_end=True,
+                                    frame_index=velocity['frame_index'],
+                                    )
+    resampled = resampled.reshape(-1, resampled.shape[-1])
+    if len(resampled) != len(dataframe):
+        raise ValueError(f'The dataframe has {len(dataframe)} rows, but the '
+                         f'cs trials have {len(resampled)} samples')
+
+    # Copy the dataframe to not edit the original.
+    final_dataframe = dataframe.copy()
+    n_bodyparts = len(bodypart_list)
+    for column, bodypart in enumerate(bodypart_list):
+        final_dataframe[f'velocity_x_{bodypart}'] = resampled[:, column]
+        final_dataframe[f'velocity_y_{bodypart}'] = resampled[
+            :, n_bodyparts+column]
 
     return final_dataframe
 
@@ -196,32 +263,42 @@ def extract_speed_distance_from_dataframe(
         cs,
         epoch,
 ):
-    """Extract speed and distance from interm dataframe."""
-    # Extract data for chosen cs
-    cond_cs_id = dataframe['cs_id'] == cs
-
-    # Extract data from chosen cs_epoch
-    if epoch == 'pre_cs':
-        epoch = dataframe['cs_epoch'] == 'pre_cs'
-    elif epoch == 'peri_cs':
-        epoch = dataframe['cs_epoch'] == 'peri_cs'
-    elif epoch == 'post_cs':
-        epoch = dataframe['cs_epoch'] == 'post_cs'
-    else:
-        print('epoch choosen not valid.')
+    """Extract speed and distance from interm dataframe.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame or SessionIndex
+        Dataframe from calculate_speed_dataframe(). Pass a SessionIndex
+        built once when extracting many cs/epochs to avoid rescanning it.
 
-    cum_sum_ed = np.cumsum(dataframe[cond_cs_id][epoch][f'ed_{bodypart}']
-                           ).reset_index(drop=True).to_numpy()
+    bodypart : str
+    cs : str
+    epoch : str
+        One of 'pre_cs', 'peri_cs' or 'post_cs'.
+
+    Returns
+    -------
+    speed, cum_sum_ed : numpy.ndarray
+        The last 900 samples of the epoch. The speed is taken from the
+        smooth_speed_{bodypart} column; dataframes without it are smoothed
+        here, one epoch at a time.
+    """
+    if not isinstance(dataframe, SessionIndex):
+        dataframe = SessionIndex(dataframe)
+
+    distance = dataframe.get(f'ed_{bodypart}', cs, epoch)
 
     # Ensure to return an array of len(900)
-    if len(cum_sum_ed) == 900:
-        cum_sum_ed = cum_sum_ed - cum_sum_ed[0]
-    else:
-        cum_sum_ed = cum_sum_ed[-900:] - cum_sum_ed[-900]
+    cum_sum_ed = np.cumsum(distance[-900:])
+    cum_sum_ed = cum_sum_ed - cum_sum_ed[0]
 
-    # speed data
-    speed = dataframe[cond_cs_id][epoch][f'speed_{bodypart}']
-    speed = savgol_filter(speed, window_length=9, polyorder=1)
+    # speed data, smoothed over the whole trial by calculate_speed_dataframe()
+    if f'smooth_speed_{bodypart}' in dataframe.dataframe:
+        speed = dataframe.get(f'smooth_speed_{bodypart}', cs, epoch)
+    else:
+        from scipy.signal import savgol_filter
+        speed = dataframe.get(f'speed_{bodypart}', cs, epoch)
+        speed = savgol_filter(speed, window_length=9, polyorder=1)
 
     # Ensure to return an array of len(900)
     if len(speed) != 900:
@@ -239,46 +316,34 @@ def extract_darting_events(
     threshold_distance,
 ):
     """Extract darting events based on the speed and cumulative distance."""
-    # Extract the indices where speed > threshold
-    running = []
-    final = []
-    for index in range(len(speed_array)):
-        if speed_array[index] > threshold_speed:
-            running.append(index)
-        else:
-            final.append(running)
-            running = []
-
-    final = [list_ for list_ in final if list_]  # Remove empty lists
-
-    # Using the previous indices, check where
-    # the cumulative sum of the distance is above threshold
-    final_event_index = []
-    counter = 1  # Keep track of the events
-
-    for list_ in final:
-        cum_sum_distance = np.cumsum(distance_array[list_])[-1]  # last value
+    # Detect the runs where speed > threshold and sum the distance covered
+    runs = detect_runs(np.asarray(speed_array) > threshold_speed,
+                       values=distance_array,
+                       )
 
-        # Apend the lists of indices that meet the criteria
-        if cum_sum_distance > threshold_distance:
-            final_event_index.append((counter, list_))
-            counter += 1
+    # Keep the runs where the cumulative distance is above threshold
+    runs = runs[runs['distance'] > threshold_distance]
 
-    # Create an array with the len of the orinal speed array with value==0
-    array_to_return = np.zeros([len(speed_array), 1], dtype=int)
+    # Keep track of the events: (counter, list of frame indices)
+    final_event_index = [(counter, list(range(start, stop)))
+                         for counter, (start, stop)
+                         in enumerate(zip(runs['start'], runs['stop']),
+                                      start=1)]
 
-    for index, list_ in final_event_index:
-        # detected events are labelled with the value 1
-        array_to_return[list_] = 1
+    # detected events are labelled with the value 1
+    array_to_return = runs_to_mask(runs, len(speed_array))
 
-    return array_to_return.reshape(len(array_to_return)), final_event_index
+    return array_to_return, final_event_index
 
 ###############################################################################
 
 
 def calculate_threshold(arr, factor):
-    """Return the threshold of the signal based on the mean and std."""
-    threshold = round(np.mean(arr) + factor*np.std(arr))
+    """Return the threshold of the signal based on the mean and std.
+
+    NaN samples (eg. frames flagged by clean_dlc_coordinates()) are ignored.
+    """
+    threshold = round(np.nanmean(arr) + factor*np.nanstd(arr))
     return threshold
 
 ###############################################################################
@@ -287,37 +352,16 @@ def calculate_threshold(arr, factor):
 def group_darting_events(dataframe):
     """Group darting events for each cs in pre, peri and post-cs epochs.
 
-    The function uses the dataframe and data
+    Each event is assigned to the cs_epoch of its first frame.
 
     """
-    darting_events = []
-    running_index = []
-    counter = 1
-    for index, element in enumerate(dataframe['darting_events']):
-        if element == 1:
-            running_index.append(index)
-        else:
-            darting_events.append((counter, running_index))
-            counter += 1
-            running_index = []
-
-    # Remove empty lists
-    darting_events = [list_ for index, list_ in darting_events if list_]
+    runs = detect_runs(dataframe['darting_events'].to_numpy() == 1)
+    epoch_at_onset = dataframe['cs_epoch'].to_numpy()[runs['start']]
 
     darting_per_cs_epoch = {
-        'pre_cs': 0,
-        'peri_cs': 0,
-        'post_cs': 0,
+        epoch: int(np.count_nonzero(epoch_at_onset == epoch))
+        for epoch in ['pre_cs', 'peri_cs', 'post_cs']
     }
-    # Devide the findings in pre, peri and post-cs
-    for list_ in darting_events:
-        # pre-cs
-        if list_[0] < 900:
-            darting_per_cs_epoch['pre_cs'] += 1
-        elif list_[0] > 900 & list_[0] < 1800:
-            darting_per_cs_epoch['peri_cs'] += 1
-        else:
-            darting_per_cs_epoch['post_cs'] += 1
 
     return darting_per_cs_epoch
 
@@ -325,52 +369,13 @@ def group_darting_events(dataframe):
 ###############################################################################
 
 
-def calculate_mean_darting(dataframe):
+def calculate_mean_darting(dataframe, protocol=None):
     """Calculate mean darting events during pre, peri and post_cs epochs."""
-    # Create shell dataframe
-    df = pd.DataFrame(columns=[
-        'cs_id', 'cs_epoch', 'darting_raw', 'darting_norm', 'darting_events'
-        ]
-    )
-    # Extract unique cs_ids
-    cs_id_list = dataframe.cs_id.unique()
-
-    for cs_id in cs_id_list:
-        # access the specific cs
-        condition = dataframe['cs_id'].isin([cs_id])
-
-        # Extract the relevant time points and cs epochs
-        individual_cs = dataframe[condition]
-
-        individual_cs = individual_cs[['cs_epoch', 'cs_id', 'darting_events']
-                                      ].reset_index(drop=True).iloc[900:3600]
-
-        # Calculate the overall darting and add it to the dataframe
-        darting = individual_cs.groupby(['cs_epoch']).sum().reset_index()
-        darting.columns = ['cs_epoch', 'darting_raw']
-        darting['cs_id'] = cs_id
-
-        # Normalize to the total epoch bin time (30 seconds, 900 frames)
-        darting['darting_norm'] = darting['darting_raw'
-                                          ].agg(lambda x: x/900
-                                                ).agg(lambda x: round(x, 2)
-                                                      )
-
-        # Extracting the number of darting events and merge with the dataframe
-        darting_per_cs_epoch = pd.Series(group_darting_events(individual_cs),
-                                         ).reset_index()
-        darting = darting.merge(darting_per_cs_epoch,
-                                left_on='cs_epoch',
-                                right_on='index',
-                                ).drop('index', axis=1)
-        darting.rename(columns={0: 'darting_events'}, inplace=True)
-
-        # Append to the dataframe to return
-        df = df.append(darting)
-
-    df.reset_index(inplace=True, drop=True)
-
-    return df
+    summary = calculate_epoch_summary(dataframe[['cs_id', 'darting_events']],
+                                      protocol=protocol,
+                                      )
+    return summary[['cs_id', 'cs_epoch', 'darting_raw', 'darting_norm',
+                    'darting_events']]
 
 ###############################################################################
 
@@ -379,37 +384,14 @@ def calculate_distance_per_cs_epoch(
         dataframe,
         bodypart='ed_back_head',
         units='cm',
+        protocol=None,
 ):
     """Calculate distance for each cs, cs_epoch based on specific bodypart."""
-    df = pd.DataFrame(columns=[
-            'cs_id', 'cs_epoch', f'total_distance_{units}',
-            ]
-        )
-
-    for cs_id in dataframe['cs_id'].unique():
-        condition = dataframe['cs_id'].isin([cs_id])
-
-        # Extract the relevant time points and cs epochs
-        individual_cs = dataframe[condition]
-
-        individual_cs = individual_cs[['cs_epoch', 'cs_id', bodypart]
-                                      ].reset_index(drop=True).iloc[900:3600]
-
-        # Distance covered during each cs_epoch
-        total_distance = individual_cs.groupby(['cs_epoch']
-                                               ).sum().agg(lambda x: round(x, 2)
-                                                           ).reset_index()
-
-        total_distance.rename(columns={bodypart: f'total_distance_{units}'},
-                              inplace=True)
-
-        # Add cs_id
-        total_distance['cs_id'] = cs_id
-
-        # Append to the dataframe to return
-        df = df.append(total_distance).reset_index(drop=True)
-
-    return df
+    return calculate_epoch_summary(dataframe[['cs_id', bodypart]],
+                                   distance_column=bodypart,
+                                   distance_units=units,
+                                   protocol=protocol,
+                                   )
 
 ###############################################################################
 
@@ -418,42 +400,21 @@ def calculate_mean_speed_per_epoch(
         dataframe,
         bodypart='speed_back_head',
         units='cm/sec',
+        protocol=None,
 ):
     """Calculate the mean speed during pre, peri and post cs."""
-    df = pd.DataFrame(columns=[
-            'cs_id', 'cs_epoch', f'mean_speed_{units}',
-            ]
-        )
-
-    for cs_id in dataframe['cs_id'].unique():
-
-        condition = dataframe['cs_id'].isin([cs_id])
-
-        # Extract the relevant time points and cs epochs
-        individual_cs = dataframe[condition]
-
-        individual_cs = individual_cs[['cs_epoch', 'cs_id', bodypart]
-                                      ].reset_index(drop=True).iloc[900:3600]
-
-        # Calculate mean speed during each cs_epoch
-        speed = individual_cs.groupby(['cs_epoch']
-                                      ).mean().agg(lambda x: round(x, 2)
-                                                   ).reset_index()
-
-        speed.rename(columns={bodypart: f'mean_speed_{units}'}, inplace=True)
-
-        # Add cs_id
-        speed['cs_id'] = cs_id
-
-        # Append to the dataframe to return
-        df = df.append(speed).reset_index(drop=True)
-    return df
+    return calculate_epoch_summary(dataframe[['cs_id', bodypart]],
+                                   speed_column=bodypart,
+                                   speed_units=units,
+                                   protocol=protocol,
+                                   )
 
 ###############################################################################
 
 def create_bodypart_coord_dataframe(
         dataframe,
         rat,
+        protocol=None,
 ):
     """Create a datafrme with each x, y bodypart position and
     corrects the aquisition rate to 30 fps.
@@ -461,11 +422,16 @@ def create_bodypart_coord_dataframe(
     Parameters
     ----------
     dataframe : DataFrame
-        The raw dataframe from deeplabcut output.
+        The raw dataframe from deeplabcut output, or the cs trials read
+        with read_dlc_cs_windows().
 
     rat : Animal object
         Instance of the Animal class with all the necessary information
 
+    protocol : Protocol object, optional
+        Timing of the cs trials. Defaults to 60 s pre-cs and 90 s after the
+        cs onset, interpolated to 30 fps.
+
     Returns
     -------
     dataframe : DataFrame
@@ -473,109 +439,34 @@ def create_bodypart_coord_dataframe(
         per cs_epoch with Animal information.
 
     """
-    # Extract the list of unique bodyparts from deeplabcut raw dataframe
-    bodypart_list = list({bodypart
-                          for scorer, bodypart, coord in dataframe.columns})
-
-    # Create a dictionary with the bodypart as key,
-    # and the x, y deeplabcut dataframe as values
-    idx = pd.IndexSlice
-    dict_bodypart_dataframes = {bodypart: dataframe.loc[:, idx[:, bodypart, ['x', 'y']]]
-                                for bodypart in bodypart_list}
-
-    # Part 1 - Loop the bodyparts, extract each x, y position
-    # during each cs and correct the aquisition (to 30fps)
-    bodypart_coord_dict = {}
-    for bodypart in bodypart_list:
-
-        cs_array_dict = {}
-        for cs, cs_start in rat.cs_start.items():  # Loops through all the cs
-
-            # For each coordinate
-            coord_dict = {}
-            for coord in ['x', 'y']:
-
-                # Slice the corresponding cs epoch:
-                # 60 seconds before cs_start : 90 seconds after
-                start = int(cs_start - (60*rat.frame_rate))  # pre-cs
-                end = int(cs_start + (90*rat.frame_rate))    # post-cs start
-
-                # Interpolate the data to correct from aquisition rate to 30fps.
-                # original data
-                data_points = dict_bodypart_dataframes.get(bodypart).loc[start:end, idx[:, :, coord]].to_numpy()
-
-                # real aquisition rate
-                old_length = np.linspace(start,
-                                         end,
-                                         num=len(data_points),
-                                         endpoint=True,
-                                         )
-
-                # new aquisition rate: 30 frames per second
-                # during 150 seconds (ie 60+90)
-                new_length = np.linspace(start,
-                                         end,
-                                         num=(150*30),
-                                         endpoint=True,
-                                         )
-
-                # numpy interp function arguments
-                x = new_length
-                xp = old_length
-                fp = data_points.squeeze()
-                # Interpolate
-                yinterp = np.interp(x, xp, fp)
-
-                # Add the coordinate interpolation to dictionary
-                coord_dict.update({coord: yinterp})
-
-            # Add the x, y interpolations as values to cs_id as key
-            cs_array_dict.setdefault(cs, coord_dict)
-        # for each bodypart, assing the dictionary
-        # containing all the cs and corresponsing x, y positions
-        bodypart_coord_dict.setdefault(bodypart, cs_array_dict)
-
-    # Part 2 - Build the dataframe to return
-
-    # Instantiate the DataFrame
-    columns = [
-        'user', 'exp_id', 'treatment',
-        'session', 'species', 'animal_id',
-        'session', 'cs_id', 'cs_epoch'
-    ]
-    number_cs = len(rat.cs_start.keys())
-    dataframe_final = pd.DataFrame(index=np.arange(1, 4500*number_cs+1),
-                                   columns=columns)
-
-    # Build the final dataframe to return
-    for bodypart in bodypart_list:
-        counter = 1
-        for cs, cs_start in rat.cs_start.items():
-
-            # Update dataframe
-            start = counter
-            end = counter+4499
-
-            # Add the ed_bodypart to the dataframe_final
-            for coord in ['x', 'y']:
-                coord_data = bodypart_coord_dict.get(bodypart).get(cs).get(coord)
-                dataframe_final.loc[start:end, f'{coord}_coord_{bodypart}'] = coord_data
-
-            dataframe_final.loc[start:end, 'cs_id'] = cs
-            # Conplete info with animal object information
-            dataframe_final.loc[start:end, 'user'] = rat.user
-            dataframe_final.loc[start:end, 'exp_id'] = rat.experiment_id
-            dataframe_final.loc[start:end, 'session'] = rat.session
-            dataframe_final.loc[start:end, 'species'] = rat.species
-            dataframe_final.loc[start:end, 'animal_id'] = rat.animal_id
-
-            # Discriminate the cs_epoch
-            dataframe_final.loc[start:start+1800, 'cs_epoch'] = 'pre_cs'
-            dataframe_final.loc[start+1800:start+2700, 'cs_epoch'] = 'peri_cs'
-            dataframe_final.loc[start+2700:end, 'cs_epoch'] = 'post_cs'
-
-            # move to the next cs_id
-            counter += 4500
+    if protocol is None:
+        protocol = Protocol()
+
+    # Extract the x, y position of all the bodyparts: (frames, bodyparts)
+    bodypart_list, x, y = extract_coordinate_arrays(dataframe)
+
+    # Interpolate every cs of every coordinate to the protocol frame rate
+    # shape: (cs, samples, coord*bodyparts)
+    resampled = resample_cs_windows(np.hstack([x, y]),
+                                    rat.cs_start.values(),
+                                    rat.frame_rate,
+                                    protocol,
+                                    include_end=True,
+                                    frame_index=extract_frame_index(dataframe),
+                                    )
+
+    n_bodyparts = len(bodypart_list)
+    signals = {}
+    for column, bodypart in enumerate(bodypart_list):
+        signals[f'x_coord_{bodypart}'] = resampled[:, :, column]
+        signals[f'y_coord_{bodypart}'] = resampled[:, :, n_bodyparts+column]
+
+    dataframe_final = create_trial_aligned_dataframe(rat,
+                                                     list(rat.cs_start),
+                                                     signals,
+                                                     protocol=protocol,
+                                                     dtype=np.float32,
+                                                     )
 
     return dataframe_final
 
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+
+
+##############################################################################
+
+def resample_cs_windows(
+        array,
+        cs_start,
+        frame_rate,
+        protocol,
+        include_end=False,
+        frame_index=None,
+):
+    """Interpolate every cs trial of every signal to the protocol frame rate.
+
+    The source frames start:end of each trial are stretched linearly over
+    `protocol.n_samples` samples, like np.interp on each trial would.
+
+    Parameters
+    ----------
+    array : numpy.ndarray
+        Signals with shape (frames,) or (frames, signals).
+
+    cs_start : iterable of int
+        Frame of the cs onset at the aquisition frame rate.
+
+    frame_rate : float
+        Aquisition rate in frames per second.
+
+    protocol : Protocol object
+        Timing of the trials.
+
+    include_end : bool, optional
+        Include the end frame of each trial, as for positions sampled at
+        both edges of the trial. Distances between frames exclude it.
+
+    frame_index : array_like of int, optional
+        Frame number of each row of `array`, when it does not hold the
+        whole session (eg. from read_dlc_cs_windows()). Defaults to the
+        row position.
+
+    Returns
+    -------
+    resampled : numpy.ndarray
+        Array with shape (cs, protocol.n_samples, signals), or
+        (cs, protocol.n_samples) when `array` is 1D.
+    """
+    array = np.asarray(array)
+    squeeze = array.ndim == 1
+    if squeeze:
+        array = array[:, np.newaxis]
+
+    start, end = protocol.cs_windows(cs_start, frame_rate)
+    end = end + int(include_end)
+
+    if frame_index is not None:
+        # Convert frame numbers to row positions
+        frame_index = np.asarray(frame_index)
+        position = np.searchsorted(frame_index, start)
+        last = position + (end - start) - 1
+        if (last.max() >= len(frame_index)
+                or np.any(frame_index[position] != start)
+                or np.any(frame_index[last] != end - 1)):
+            raise ValueError('The signal does not contain all the frames '
+                             'of the cs trials')
+        start, end = position, last + 1
+
+    if start.min() < 0 or end.max() > len(array):
+        raise ValueError(f'cs trials span frames {start.min()} to '
+                         f'{end.max()}, but the signal has {len(array)} frames')
+
+    # Fractional position of each new sample inside its source trial
+    n_source = (end - start)[:, np.newaxis]
+    steps = np.linspace(0, 1, protocol.n_samples)[np.newaxis, :]
+    position = steps*(n_source - 1)
+
+    lower = np.minimum(np.floor(position).astype(int), n_source - 2)
+    weight = (position - lower)[..., np.newaxis]
+    lower += start[:, np.newaxis]
+
+    resampled = array[lower]*(1 - weight) + array[lower + 1]*weight
+
+    return resampled[..., 0] if squeeze else resampled
+
+##############################################################################
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+
+# Compact description of each run: frames start:stop, length and the sum of
+# a signal (eg. euclidean distance) during the run.
+RUN_DTYPE = np.dtype([
+    ('start', np.int64),
+    ('stop', np.int64),
+    ('length', np.int64),
+    ('distance', np.float64),
+])
+
+
+##############################################################################
+
+def find_runs(mask):
+    """Find the runs of consecutive True values in a boolean array.
+
+    Parameters
+    ----------
+    mask : array_like of bool
+
+    Returns
+    -------
+    start, stop : numpy.ndarray of int
+        Each run spans the frames start:stop (stop excluded).
+    """
+    mask = np.asarray(mask, dtype=bool)
+
+    # Pad with False so that runs touching the edges are closed
+    edges = np.diff(np.concatenate(([False], mask, [False])).astype(np.int8))
+    start = np.flatnonzero(edges == 1)
+    stop = np.flatnonzero(edges == -1)
+
+    return start, stop
+
+##############################################################################
+
+
+def detect_runs(
+        mask,
+        min_length=1,
+        values=None,
+):
+    """Detect runs of True values and summarize them.
+
+    Parameters
+    ----------
+    mask : array_like of bool
+
+    min_length : int, optional
+        Runs shorter than min_length frames are discarded.
+
+    values : array_like, optional
+        Signal with the same length as mask summed over each run
+        (eg. euclidean distance). Without it the distance field is 0.
+
+    Returns
+    -------
+    runs : numpy.ndarray
+        Structured array with the fields start, stop, length and distance.
+    """
+    start, stop = find_runs(mask)
+    length = stop - start
+
+    keep = length >= min_length
+    start, stop, length = start[keep], stop[keep], length[keep]
+
+    runs = np.empty(len(start), dtype=RUN_DTYPE)
+    runs['start'] = start
+    runs['stop'] = stop
+    runs['length'] = length
+    runs['distance'] = 0
+
+    if values is not None and len(runs):
+        # Segmented sum: reduce over start:stop pairs and keep the odd
+        # segments. A trailing 0 keeps stop == len(values) a valid index.
+        values = np.append(np.asarray(values, dtype=float), 0)
+        boundaries = np.column_stack([start, stop]).ravel()
+        runs['distance'] = np.add.reduceat(values, boundaries)[::2]
+
+    return runs
+
+##############################################################################
+
+
+def runs_to_mask(runs, size):
+    """Create an int array of len(size) with 1 in every run and 0 elsewhere.
+
+    Parameters
+    ----------
+    runs : numpy.ndarray
+        Structured array from detect_runs().
+
+    size : int
+        Length of the array to return.
+
+    Returns
+    -------
+    mask : numpy.ndarray of int
+    """
+    steps = np.zeros(size + 1, dtype=int)
+    np.add.at(steps, runs['start'], 1)
+    np.add.at(steps, runs['stop'], -1)
+
+    return np.cumsum(steps[:-1])
+
+##############################################################################
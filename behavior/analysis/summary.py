@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import pandas as pd
+import numpy as np
+from behavior.utils.classProtocol import Protocol
+
+
+##############################################################################
+
+def reshape_trials(
+        dataframe,
+        columns,
+        protocol=None,
+):
+    """Reshape trial-aligned columns into a (cs, samples, columns) array.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Trial-aligned dataframe where the samples of each cs are contiguous,
+        as created by calculate_euclidean_distance_dataframe().
+
+    columns : list of str
+        Numeric columns to extract.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials.
+
+    Returns
+    -------
+    cs_ids : list of str
+    trials : numpy.ndarray
+        Array with shape (cs, protocol.n_samples, len(columns)).
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    cs_codes, cs_ids = pd.factorize(dataframe['cs_id'])
+    n_cs = len(cs_ids)
+
+    # Every cs must be a contiguous block of protocol.n_samples rows
+    if len(dataframe) != n_cs*protocol.n_samples or np.any(
+            cs_codes.reshape(n_cs, -1) != np.arange(n_cs)[:, np.newaxis]):
+        raise ValueError(f'Each cs must span {protocol.n_samples} contiguous '
+                         'rows. Check the protocol used to build the data.')
+
+    trials = dataframe[list(columns)].to_numpy(dtype=float
+                                               ).reshape(n_cs,
+                                                         protocol.n_samples,
+                                                         len(columns))
+
+    return list(cs_ids), trials
+
+##############################################################################
+
+
+def reshape_cohort_trials(
+        dataframe,
+        columns,
+        protocol=None,
+):
+    """Reshape the trials of several animals into a 4D array.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Trial-aligned dataframes of one or more animals concatenated, with
+        the rows of each animal contiguous and the same cs in every animal.
+        Without an animal_id column the dataframe is one animal.
+
+    columns : list of str
+        Numeric columns to extract.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials.
+
+    Returns
+    -------
+    animal_ids : list of str
+    cs_ids : list of str
+    trials : numpy.ndarray
+        Array with shape (animals, cs, protocol.n_samples, len(columns)).
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    if 'animal_id' not in dataframe.columns:
+        cs_ids, trials = reshape_trials(dataframe, columns, protocol)
+        return [None], cs_ids, trials[np.newaxis]
+
+    animal_codes, animal_ids = pd.factorize(dataframe['animal_id'])
+    cs_codes, cs_ids = pd.factorize(dataframe['cs_id'])
+    n_animals, n_cs = len(animal_ids), len(cs_ids)
+
+    # Every (animal, cs) must be a contiguous block of protocol.n_samples rows
+    block_codes = animal_codes*n_cs + cs_codes
+    if len(dataframe) != n_animals*n_cs*protocol.n_samples or np.any(
+            block_codes.reshape(n_animals*n_cs, -1)
+            != np.arange(n_animals*n_cs)[:, np.newaxis]):
+        raise ValueError('Each animal must have the same cs, each spanning '
+                         f'{protocol.n_samples} contiguous rows.')
+
+    trials = dataframe[list(columns)].to_numpy(dtype=float
+                                               ).reshape(n_animals,
+                                                         n_cs,
+                                                         protocol.n_samples,
+                                                         len(columns))
+
+    return list(animal_ids), list(cs_ids), trials
+
+##############################################################################
+
+
+def calculate_epoch_summary(
+        dataframe,
+        distance_column=None,
+        speed_column=None,
+        distance_units='cm',
+        speed_units='cm/sec',
+        protocol=None,
+):
+    """Calculate the summary statistics per cs and cs_epoch in one pass.
+
+    The pre and post-cs epochs are restricted to the protocol analysis
+    window (by default 30 seconds on each side of the cs).
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Trial-aligned dataframe. The freezing_events and darting_events
+        columns are summarized when present.
+
+    distance_column : str, optional
+        Euclidean distance column to sum (eg. 'ed_back_head').
+
+    speed_column : str, optional
+        Speed column to average (eg. 'speed_back_head').
+
+    distance_units, speed_units : str, optional
+        Units appended to the name of the distance and speed columns.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials.
+
+    Returns
+    -------
+    summary : DataFrame
+        One row per cs_id and cs_epoch with the columns
+        freezing_raw, freezing_norm, darting_raw, darting_norm,
+        darting_events, total_distance_{units} and mean_speed_{units}
+        depending on the data available.
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    event_columns = [column for column in ['freezing_events', 'darting_events']
+                     if column in dataframe.columns]
+    columns = event_columns + [column for column in [distance_column,
+                                                     speed_column]
+                               if column is not None]
+
+    cs_ids, trials = reshape_trials(dataframe, columns, protocol)
+    trials = dict(zip(columns, np.moveaxis(trials, -1, 0)))
+
+    epochs = list(protocol.analysis_bounds)
+    bounds = list(protocol.analysis_bounds.values())
+    epoch_length = np.array([stop - start for start, stop in bounds])
+
+    def reduce_epochs(array, function):
+        # Returns an array with shape (cs, epochs)
+        return np.column_stack([function(array[:, start:stop], axis=1)
+                                for start, stop in bounds])
+
+    summary = {
+        'cs_id': np.repeat(cs_ids, len(epochs)),
+        'cs_epoch': np.tile(epochs, len(cs_ids)),
+    }
+
+    for column in event_columns:
+        name = column.replace('_events', '')
+        raw = reduce_epochs(trials[column], np.nansum).astype(int)
+        summary[f'{name}_raw'] = raw.ravel()
+        # Normalize to the total epoch bin time (eg. 30 seconds, 900 frames)
+        summary[f'{name}_norm'] = np.round(raw/epoch_length, 2).ravel()
+
+    if 'darting_events' in trials:
+        # Count the events starting in each epoch of the analysis window
+        window = slice(bounds[0][0], bounds[-1][1])
+        events = trials['darting_events'] == 1
+        onsets = np.zeros_like(events)
+        onsets[:, window] = events[:, window]
+        onsets[:, window][:, 1:] &= ~events[:, window][:, :-1]
+        summary['darting_events'] = reduce_epochs(onsets, np.sum).ravel()
+
+    if distance_column is not None:
+        summary[f'total_distance_{distance_units}'] = np.round(
+            reduce_epochs(trials[distance_column], np.nansum), 2).ravel()
+
+    if speed_column is not None:
+        summary[f'mean_speed_{speed_units}'] = np.round(
+            reduce_epochs(trials[speed_column], np.nanmean), 2).ravel()
+
+    return pd.DataFrame(summary)
+
+##############################################################################
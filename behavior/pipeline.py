@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+
+Run notebooks 1a, 1b, 2 and 3 on every deeplabcut output of a directory.
+"""
+
+import argparse
+import functools
+import glob
+import os
+import re
+import sys
+import traceback
+
+import pandas as pd
+
+from behavior.analysis.cleaning import clean_dlc_coordinates
+from behavior.analysis.freezing_analysis import extract_freezing_events
+from behavior.analysis.kinematics import extract_bodypart_list
+from behavior.analysis.motion_analysis import (
+    calculate_euclidean_distance_dataframe,
+    calculate_speed_dataframe,
+    calculate_threshold,
+    calculate_velocity_dataframe,
+    create_bodypart_coord_dataframe,
+    extract_darting_events,
+)
+from behavior.analysis.summary import calculate_epoch_summary
+from behavior.utils.classAnimalRegistry import VIDEO_KEY_GROUPS
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.classStageCache import StageCache
+from behavior.utils.file_io import (
+    read_dlc_cs_windows,
+    save_interim_dataframe,
+)
+from behavior.utils.organization import (
+    create_basic_working_record,
+    fetch_animal_info,
+)
+from behavior.utils import instrumentation
+from behavior.utils.parallel import parallel_map
+
+# Video label of the record files, followed by the deeplabcut suffix
+VIDEO_KEY_PATTERN = rf'{VIDEO_KEY_GROUPS}(?=DLC|\.h5$)'
+
+METADATA_COLUMNS = ['user', 'exp_id', 'treatment', 'session', 'species',
+                    'animal_id', 'cs_id', 'cs_epoch']
+
+DEFAULT_SETTINGS = {
+    'freezing_bodyparts': ['head', 'ear_right', 'ear_left', 'between_eyes'],
+    'motion_threshold': 0.20,       # cm
+    'min_freezing_duration': 15,    # frames, for 30fps == 0.5 second
+    'darting_bodypart': 'head',
+    'darting_factor': 1,
+    'threshold_distance': 15,       # cm
+    'summary_bodypart': 'upper_torso',
+    'likelihood_cutoff': None,
+    'max_gap': 5,
+    'smoothing_window': 9,          # frames, Savitzky-Golay filter
+    'smoothing_polyorder': 1,
+}
+
+##############################################################################
+
+
+def discover_dlc_outputs(directory):
+    """Find the deeplabcut .h5 outputs in a directory.
+
+    Parameters
+    ----------
+    directory : str
+
+    Returns
+    -------
+    dlc_outputs : list of (video_key, path) tuples
+        Files without a valid video key are ignored.
+    """
+    dlc_outputs = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.h5'))):
+        match = re.search(VIDEO_KEY_PATTERN, os.path.basename(path))
+        if match:
+            dlc_outputs.append((match.group(), path))
+    return dlc_outputs
+
+##############################################################################
+
+
+def process_animal(
+        dlc_output,
+        main_record,
+        experiment_info,
+        output_directory,
+        settings=None,
+        protocol=None,
+        cache_directory=None,
+        cache_max_bytes=None,
+        output_format='parquet',
+):
+    """Run all the stages for one animal and save its outputs.
+
+    Saves the files produced by the notebooks:
+    {video_key}_bodypart_coordinates_dlc.parquet,
+    {video_key}_individual_preprocessing_dlc.parquet,
+    {video_key}_motion_analysis_dlc.parquet and
+    {video_key}_individual_summary_stats.csv (all in lowercase).
+    The interim files can be read with load_interim_dataframe().
+
+    Parameters
+    ----------
+    dlc_output : tuple
+        (video_key, path) of the deeplabcut .h5 output.
+
+    main_record, experiment_info : str
+        Absolute paths to the .csv files used by fetch_animal_info().
+
+    output_directory : str
+
+    settings : dict, optional
+        Overrides DEFAULT_SETTINGS.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials. Defaults to Protocol.from_animal(), with
+        the cs span and cs count of the experiment info.
+
+    cache_directory : str, optional
+        Cache the coordinates and preprocessing stages in this directory
+        (see StageCache), so that changing only the detection parameters
+        does not reload the deeplabcut output.
+
+    cache_max_bytes : int, optional
+        Maximum size of the cache.
+
+    output_format : str, optional
+        'parquet' or 'csv' for the interim files.
+
+    Returns
+    -------
+    report : dict
+        video_key, status ('done' or 'failed') and error.
+    """
+    video_key, path = dlc_output
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+
+    try:
+        with instrumentation.stage('process_animal', animal=video_key):
+            _process_animal(video_key, path, main_record, experiment_info,
+                            output_directory, settings, protocol,
+                            cache_directory, cache_max_bytes, output_format)
+
+    except Exception as error:
+        return {'video_key': video_key, 'status': 'failed',
+                'error': ''.join(traceback.format_exception_only(type(error),
+                                                                 error)
+                                 ).strip()}
+
+    return {'video_key': video_key, 'status': 'done', 'error': ''}
+
+
+def _process_animal(
+        video_key,
+        path,
+        main_record,
+        experiment_info,
+        output_directory,
+        settings,
+        protocol,
+        cache_directory,
+        cache_max_bytes,
+        output_format,
+):
+    # Each stage is recorded when the instrumentation is enabled
+    def stage(name, **sizes):
+        return instrumentation.stage(name, animal=video_key, **sizes)
+
+    with stage('fetch_animal_info'):
+        animal = fetch_animal_info(video_key, main_record, experiment_info)
+    if protocol is None:
+        protocol = Protocol.from_animal(animal)
+
+    cache = None
+    if cache_directory is not None:
+        cache = StageCache(cache_directory, max_bytes=cache_max_bytes)
+    loading = {'likelihood_cutoff': settings['likelihood_cutoff'],
+               'max_gap': settings['max_gap']}
+
+    def run_stage(name, compute, **parameters):
+        if cache is None:
+            return compute()
+        return cache.get_or_compute(name, compute,
+                                    input_path=path,
+                                    animal=animal,
+                                    protocol=protocol,
+                                    **loading,
+                                    **parameters)
+
+    @functools.lru_cache(maxsize=None)
+    def load_dataframe():
+        # Notebook 1a: load the cs trials (and clean them)
+        with stage('read_dlc_cs_windows') as record:
+            dataframe = read_dlc_cs_windows(path, animal, protocol)
+            record['n_frames'] = len(dataframe)
+            record['n_columns'] = dataframe.shape[1]
+        if settings['likelihood_cutoff'] is not None:
+            with stage('clean_dlc_coordinates', n_frames=len(dataframe)):
+                dataframe, _ = clean_dlc_coordinates(dataframe, **loading)
+        return dataframe
+
+    # Notebook 1a: extract the coordinates
+    def compute_coordinates():
+        dataframe = load_dataframe()
+        with stage('create_bodypart_coord_dataframe',
+                   n_frames=len(dataframe)):
+            return create_bodypart_coord_dataframe(dataframe, animal,
+                                                   protocol=protocol)
+
+    with stage('coordinates', cached=cache is not None):
+        coordinates = run_stage('coordinates', compute_coordinates)
+
+    # Notebook 1b: euclidean distance, speed and velocity
+    smoothing = {'window_length': settings['smoothing_window'],
+                 'polyorder': settings['smoothing_polyorder']}
+
+    def compute_preprocessing():
+        dataframe = load_dataframe()
+        with stage('calculate_euclidean_distance_dataframe',
+                   n_frames=len(dataframe)):
+            preprocessing, _ = calculate_euclidean_distance_dataframe(
+                dataframe, animal, protocol=protocol)
+        with stage('calculate_speed_dataframe',
+                   n_rows=len(preprocessing)):
+            preprocessing = calculate_speed_dataframe(
+                preprocessing, extract_bodypart_list(dataframe),
+                protocol.fps, **smoothing)
+        with stage('calculate_velocity_dataframe',
+                   n_frames=len(dataframe)):
+            return calculate_velocity_dataframe(preprocessing, dataframe,
+                                                animal, protocol=protocol,
+                                                **smoothing)
+
+    with stage('preprocessing', cached=cache is not None):
+        preprocessing = run_stage('preprocessing', compute_preprocessing,
+                                  **smoothing)
+
+    # Notebook 2: freezing and darting
+    motion = preprocessing[METADATA_COLUMNS].copy()
+    with stage('extract_freezing_events', n_rows=len(preprocessing)):
+        motion['freezing_events'] = extract_freezing_events(
+            preprocessing,
+            settings['freezing_bodyparts'],
+            settings['motion_threshold'],
+            settings['min_freezing_duration'],
+        )
+    with stage('extract_darting_events', n_rows=len(preprocessing)):
+        speed = preprocessing[f"speed_{settings['darting_bodypart']}"
+                              ].to_numpy()
+        motion['darting_events'], _ = extract_darting_events(
+            preprocessing[f"smooth_speed_{settings['darting_bodypart']}"
+                          ].to_numpy(),
+            preprocessing[f"ed_{settings['darting_bodypart']}"
+                          ].to_numpy(),
+            calculate_threshold(speed, factor=settings['darting_factor']),
+            settings['threshold_distance'],
+        )
+
+    # Notebook 3: summary statistics
+    bodypart = settings['summary_bodypart']
+    with stage('calculate_epoch_summary', n_rows=len(motion)):
+        summary = calculate_epoch_summary(
+            pd.concat([motion, preprocessing[[f'ed_{bodypart}',
+                                              f'speed_{bodypart}']]],
+                      axis=1),
+            distance_column=f'ed_{bodypart}',
+            speed_column=f'speed_{bodypart}',
+            protocol=protocol,
+        )
+        summary = pd.concat([create_basic_working_record(animal,
+                                                         len(summary)),
+                             summary], axis=1)
+
+    with stage('save_outputs', output_format=output_format):
+        os.makedirs(output_directory, exist_ok=True)
+        for suffix, output in [('bodypart_coordinates_dlc', coordinates),
+                               ('individual_preprocessing_dlc',
+                                preprocessing),
+                               ('motion_analysis_dlc', motion)]:
+            basename = f'{video_key}_{suffix}.{output_format}'.lower()
+            if output_format == 'parquet':
+                save_interim_dataframe(output,
+                                       os.path.join(output_directory,
+                                                    basename))
+            else:
+                output.to_csv(os.path.join(output_directory, basename))
+
+        # The summary is merged by concatenate_transformed_dataframes()
+        basename = f'{video_key}_individual_summary_stats.csv'.lower()
+        summary.to_csv(os.path.join(output_directory, basename))
+
+##############################################################################
+
+
+def run_cohort(
+        directory,
+        main_record,
+        experiment_info,
+        output_directory,
+        n_jobs=None,
+        settings=None,
+        protocol=None,
+        cache_directory=None,
+        cache_max_bytes=None,
+        output_format='parquet',
+):
+    """Process every deeplabcut output of a directory in parallel.
+
+    Each animal is processed and saved independently: a failure is
+    reported and does not stop the other animals.
+
+    Parameters
+    ----------
+    directory : str
+        Directory with the deeplabcut .h5 outputs.
+
+    main_record, experiment_info : str
+        Absolute paths to the .csv files used by fetch_animal_info().
+
+    output_directory : str
+
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cpus.
+
+    settings : dict, optional
+        Overrides DEFAULT_SETTINGS.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials. Defaults to the protocol of each animal
+        (see process_animal()).
+
+    cache_directory : str, optional
+        Directory of the StageCache shared by the workers.
+
+    cache_max_bytes : int, optional
+        Maximum size of the cache.
+
+    output_format : str, optional
+        'parquet' or 'csv' for the interim files.
+
+    Returns
+    -------
+    report : DataFrame
+        One row per animal with the video_key, status and error.
+    """
+    worker = functools.partial(process_animal,
+                               main_record=main_record,
+                               experiment_info=experiment_info,
+                               output_directory=output_directory,
+                               settings=settings,
+                               protocol=protocol,
+                               cache_directory=cache_directory,
+                               cache_max_bytes=cache_max_bytes,
+                               output_format=output_format,
+                               )
+    reports = parallel_map(worker, discover_dlc_outputs(directory),
+                           n_jobs=n_jobs)
+
+    return pd.DataFrame(reports, columns=['video_key', 'status', 'error'])
+
+##############################################################################
+
+
+def main(argv=None):
+    """Command line entry point: behavior-pipeline."""
+    parser = argparse.ArgumentParser(
+        prog='behavior-pipeline',
+        description='Extract coordinates, distance, speed, freezing, '
+                    'darting and summary statistics for every deeplabcut '
+                    'output in a directory.',
+    )
+    parser.add_argument('directory',
+                        help='directory with the deeplabcut .h5 outputs')
+    parser.add_argument('--main-record', required=True,
+                        help='.csv file with the animal records')
+    parser.add_argument('--experiment-info', required=True,
+                        help='.csv file with the cs indices and frame rate')
+    parser.add_argument('--output', required=True,
+                        help='directory where the outputs are saved')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of worker processes (default: all cpus)')
+    parser.add_argument('--freezing-bodyparts', nargs='+',
+                        default=DEFAULT_SETTINGS['freezing_bodyparts'])
+    parser.add_argument('--motion-threshold', type=float,
+                        default=DEFAULT_SETTINGS['motion_threshold'])
+    parser.add_argument('--min-freezing-duration', type=int,
+                        default=DEFAULT_SETTINGS['min_freezing_duration'])
+    parser.add_argument('--darting-bodypart',
+                        default=DEFAULT_SETTINGS['darting_bodypart'])
+    parser.add_argument('--summary-bodypart',
+                        default=DEFAULT_SETTINGS['summary_bodypart'])
+    parser.add_argument('--likelihood-cutoff', type=float, default=None,
+                        help='clean the coordinates bellow this likelihood')
+    parser.add_argument('--format', choices=['parquet', 'csv'],
+                        default='parquet',
+                        help='file format of the interim outputs')
+    parser.add_argument('--cache', default=None,
+                        help='directory to cache the intermediate stages')
+    parser.add_argument('--cache-max-gb', type=float, default=None,
+                        help='maximum size of the cache in GB')
+    parser.add_argument('--instrument', default=None,
+                        help='.jsonl file where the time of each stage is '
+                             'recorded')
+    parser.add_argument('--instrument-memory', action='store_true',
+                        help='also record the peak memory of each stage '
+                             '(slower)')
+    args = parser.parse_args(argv)
+
+    settings = {
+        'freezing_bodyparts': args.freezing_bodyparts,
+        'motion_threshold': args.motion_threshold,
+        'min_freezing_duration': args.min_freezing_duration,
+        'darting_bodypart': args.darting_bodypart,
+        'summary_bodypart': args.summary_bodypart,
+        'likelihood_cutoff': args.likelihood_cutoff,
+    }
+
+    if args.instrument:
+        instrumentation.enable(args.instrument,
+                               memory=args.instrument_memory)
+
+    report = run_cohort(args.directory,
+                        args.main_record,
+                        args.experiment_info,
+                        args.output,
+                        n_jobs=args.jobs,
+                        settings=settings,
+                        cache_directory=args.cache,
+                        cache_max_bytes=(int(args.cache_max_gb*1e9)
+                                         if args.cache_max_gb else None),
+                        output_format=args.format,
+                        )
+
+    for row in report.itertuples():
+        print(f'{row.video_key}: {row.status}'
+              + (f' | {row.error}' if row.error else ''))
+
+    n_failed = int((report['status'] == 'failed').sum())
+    print(f'{len(report) - n_failed} done, {n_failed} failed')
+
+    if args.instrument:
+        instrumentation.disable()
+        if os.path.exists(args.instrument):
+            print(instrumentation.summary_report(args.instrument
+                                                 ).to_string())
+
+    return 1 if n_failed else 0
+
+##############################################################################
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,16 @@
-import behavior.utils.classAnimal
-import behavior.utils.organization
-import behavior.utils.bonsai_led
+from behavior import _lazy_submodules
+
+__getattr__, __dir__ = _lazy_submodules(__name__, [
+    'classAnimal',
+    'classAnimalRegistry',
+    'classCohortStore',
+    'classProtocol',
+    'classSessionIndex',
+    'classStageCache',
+    'file_io',
+    'organization',
+    'bonsai_led',
+    'instrumentation',
+    'parallel',
+    'synthetic',
+])
@@ -9,10 +9,336 @@ Licensed under GNU Lesser General Public License v3.0
 # Import modules
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+import functools
+import json
 import os
-import time
 import re
+import traceback
+from behavior.utils.parallel import parallel_map
+
+# Frames skipped after each cs onset before looking for the next one
+REFRACTORY_FRAMES = 900
+
+##############################################################################
+
+
+def detect_led_onsets(
+    led_area,
+    factor,
+    refractory_frames=REFRACTORY_FRAMES,
+):
+    """Detect the frames where the LED turns on.
+
+    The LED is on in the frames where the area is above the mean area times
+    the factor. Each onset is followed by a refractory period in which no
+    other onset is detected.
+
+    Parameters
+    ----------
+    led_area : array-like
+        LED area (pixels) in each frame.
+
+    factor : float
+        Threshold for the LED ON relative to the mean area.
+
+    refractory_frames : int, optional
+        Number of frames after an onset ignored by the detection.
+
+    Returns
+    -------
+    cs_frames : numpy.ndarray
+        Frame index of each onset.
+    """
+    led_area = np.asarray(led_area, dtype=float)
+    threshold = np.nanmean(led_area)*factor
+
+    on_frames = np.flatnonzero(led_area >= threshold)
+
+    # Jump from each onset to the first frame ON after the refractory period
+    cs_frames = []
+    position = 0
+    while position < len(on_frames):
+        cs_frames.append(on_frames[position])
+        position = np.searchsorted(on_frames,
+                                   on_frames[position] + refractory_frames)
+
+    return np.array(cs_frames, dtype=int)
+
+##############################################################################
+
+
+def check_cs_count(
+    cs_frames,
+    CS_number,
+):
+    """Compare the number of detected cs with the expected number.
+
+    Returns
+    -------
+    qc : str
+        'ok', 'extra' (more onsets than expected) or 'missing'.
+        extract_cs_onsets_from_directory() flags the files that could not
+        be processed with 'error'.
+    """
+    if len(cs_frames) == CS_number:
+        return 'ok'
+    elif len(cs_frames) > CS_number:
+        return 'extra'
+    return 'missing'
+
+##############################################################################
+
+
+def save_led_onsets_plot(
+    led_area,
+    cs_frames,
+    threshold,
+    saving_path,
+    title=None,
+):
+    """Save a plot of the LED area with the detected onsets to a file.
+
+    The figure is not attached to pyplot, so no window is opened.
+    """
+    from matplotlib.figure import Figure
+
+    led_area = np.asarray(led_area, dtype=float)
+
+    fig = Figure(figsize=(20, 5))
+    ax = fig.subplots()
+    ax.plot(np.arange(len(led_area)), led_area, color='orange')
+    ax.axhline(threshold, color='grey', linestyle='--', linewidth=1)
+    for cs in cs_frames:
+        ax.axvline(cs, color='black', linewidth=1)
+        ax.annotate(str(cs), xy=(cs, np.nanmax(led_area)), xycoords='data')
+    ax.set_ylabel('LED_AREA (pixels)')
+    ax.set_xlabel('frame_index')
+    ax.set_ylim(0, np.nanmax(led_area))
+    if title:
+        ax.set_title(title)
+
+    fig.savefig(saving_path)
+
+##############################################################################
+
+
+def save_cs_index(
+    saving_path,
+    cs_frames,
+    **information,
+):
+    """Save the cs onsets in a .json sidecar file ({basename}_CS-INDEX.json).
+
+    Parameters
+    ----------
+    saving_path : str
+
+    cs_frames : list of int
+        Frame index of each cs onset.
+
+    **information
+        Other entries of the file (eg. frame_rate_fps, qc).
+    """
+    cs_index = {'cs_frames': [int(frame) for frame in cs_frames],
+                'n_cs': len(cs_frames),
+                }
+    cs_index.update(information)
+
+    with open(saving_path, 'w') as file:
+        json.dump(cs_index, file, indent=2)
+
+##############################################################################
+
+
+def load_cs_index(path):
+    """Load a cs index sidecar file.
+
+    Legacy _CS-INDEX.txt files (a list of frames) are also accepted.
+
+    Returns
+    -------
+    cs_index : dict
+        At least cs_frames and n_cs.
+    """
+    with open(path, 'r') as file:
+        content = json.loads(file.read())
+
+    if isinstance(content, list):
+        content = {'cs_frames': content, 'n_cs': len(content)}
+    return content
+
+##############################################################################
+
+
+def _cs_index_basename(bonsai_csv):
+    # Use regular expression to find the base name
+    pattern = re.compile(r'\w+_\w+\d+_\d+_\w+\d+_\w_\d+_\w\d+.csv')
+    match = re.search(pattern, bonsai_csv)
+    if match is None:
+        raise ValueError(f'{os.path.basename(bonsai_csv)} does not follow '
+                         'the video labelling convention')
+    return match.group().replace('.csv', '')
+
+##############################################################################
+
+
+def extract_cs_onsets(
+    bonsai_csv,
+    factor,
+    CS_number,
+    output_directory,
+    refractory_frames=REFRACTORY_FRAMES,
+    save_plot=True,
+):
+    """Detect the cs onsets of a bonsai output without user interaction.
+
+    The cs indices, the frame timing and the qc are saved in
+    {basename}_CS-INDEX.json and, optionally, a plot in
+    {basename}_CS-INDEX.png for later review.
+
+    Parameters
+    ----------
+    bonsai_csv : str
+        Absolute path to the bonsai .csv output (timestamp, LED area).
+
+    factor : float
+        Threshold for the LED ON relative to the mean area.
+
+    CS_number : int
+        Expected number of cs.
+
+    output_directory : str
+
+    refractory_frames : int, optional
+
+    save_plot : bool, optional
+
+    Returns
+    -------
+    report : dict
+        video_key, cs_frames, n_cs, qc (see check_cs_count()),
+        frame_rate_fps, dropped_frames, cs_index_path and plot_path.
+    """
+    bonsai_df = pd.read_csv(bonsai_csv, names=["timestamp", "LED_AREA"])
+    led_area = bonsai_df["LED_AREA"].to_numpy(dtype=float)
+
+    cs_frames = detect_led_onsets(led_area, factor, refractory_frames)
+    qc = check_cs_count(cs_frames, CS_number)
+    timing = calculate_frame_timing(bonsai_df["timestamp"])
+
+    base_name = _cs_index_basename(bonsai_csv)
+    cs_index_saving_path = os.path.join(output_directory,
+                                        f'{base_name}_CS-INDEX.json')
+    save_cs_index(cs_index_saving_path,
+                  cs_frames,
+                  video_key=base_name,
+                  expected_n_cs=CS_number,
+                  qc=qc,
+                  factor=factor,
+                  refractory_frames=refractory_frames,
+                  **timing,
+                  )
+
+    plot_saving_path = None
+    if save_plot:
+        plot_saving_path = os.path.join(output_directory,
+                                        f'{base_name}_CS-INDEX.png')
+        save_led_onsets_plot(led_area, cs_frames,
+                             np.nanmean(led_area)*factor,
+                             plot_saving_path,
+                             title=f'{base_name} | {len(cs_frames)} cs | {qc}',
+                             )
+
+    return {'video_key': base_name,
+            'cs_frames': cs_frames.tolist(),
+            'n_cs': len(cs_frames),
+            'qc': qc,
+            'frame_rate_fps': timing['frame_rate_fps'],
+            'dropped_frames': timing['dropped_frames'],
+            'cs_index_path': cs_index_saving_path,
+            'plot_path': plot_saving_path,
+            }
+
+##############################################################################
+
+
+def _extract_cs_onsets_or_flag(bonsai_csv, **parameters):
+    # Report a file that cannot be processed instead of stopping the others
+    try:
+        report = extract_cs_onsets(bonsai_csv, **parameters)
+    except Exception as error:
+        return {'video_key': os.path.basename(bonsai_csv).replace('.csv', ''),
+                'n_cs': 0,
+                'qc': 'error',
+                'error': ''.join(traceback.format_exception_only(type(error),
+                                                                 error)
+                                 ).strip()}
+    report['error'] = ''
+    return report
+
+
+def extract_cs_onsets_from_directory(
+    directory,
+    factor,
+    CS_number,
+    output_directory,
+    session=None,
+    refractory_frames=REFRACTORY_FRAMES,
+    save_plot=True,
+    n_jobs=None,
+):
+    """Detect the cs onsets of all the bonsai outputs in a directory.
+
+    The files are processed in parallel with extract_cs_onsets(). Files with
+    a qc other than 'ok' should be reviewed with their plot. A file that
+    cannot be processed (eg. a name that does not follow the labelling
+    convention) gets the qc 'error' and the error message, and the other
+    files are still processed.
+
+    Parameters
+    ----------
+    directory : str
+        Directory with the bonsai .csv outputs.
+
+    factor, CS_number, output_directory, refractory_frames, save_plot
+        See extract_cs_onsets().
+
+    session : str, optional
+        Only process the files of a session (eg. '_TES01_').
+
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cpus.
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        One row per file, sorted by video_key, with the columns of
+        extract_cs_onsets() plus error.
+    """
+    pattern = re.compile(r'_\w\w\w\d\d_')
+    files_to_process = sorted(
+        os.path.join(directory, file) for file in os.listdir(directory)
+        if file.endswith('.csv') and re.search(pattern, file)
+        and (session is None or re.search(pattern, file).group() == session)
+    )
+
+    os.makedirs(output_directory, exist_ok=True)
+
+    reports = parallel_map(functools.partial(_extract_cs_onsets_or_flag,
+                                             factor=factor,
+                                             CS_number=CS_number,
+                                             output_directory=output_directory,
+                                             refractory_frames=refractory_frames,
+                                             save_plot=save_plot,
+                                             ),
+                           files_to_process,
+                           n_jobs=n_jobs,
+                           )
+
+    return pd.DataFrame(reports, columns=['video_key', 'cs_frames', 'n_cs',
+                                          'qc', 'frame_rate_fps',
+                                          'dropped_frames', 'cs_index_path',
+                                          'plot_path', 'error'])
 
 ##############################################################################
 
@@ -24,43 +350,19 @@ def detect_bonsai_led_state(
     output_directory,
 ):
     """DOC."""
+    import matplotlib.pyplot as plt
+
     final_answer = "N"
     while final_answer != "Y":
 
         # Open bonsai output with the LED area
         bonsai_df = pd.read_csv(bonsai_csv,
                                 names=["timestamp", "LED_AREA"],
-                                date_parser="timestamp",
                                 )
         bonsai_df["cs_state"] = 0  # LED: 1==ON, 0==OFF
-        # Set baseline and threshold for detection of LED ON
-        baseline = bonsai_df["LED_AREA"].mean()  # CS == OFF
-        threshold = baseline*factor
-
-        # keep track of led behavior(on, off) in each frame
-        led_state_array = np.array([])
-
-        # Loop through all the frames to detect flurescence area
-        for frame in bonsai_df.index:
-            # detect LED OFF: CS==0
-            if bonsai_df['LED_AREA'][frame] < threshold:
-                led_state_array = np.append(led_state_array, 0)
-            # detect LED ON: CS==1
-            else:
-                led_state_array = np.append(led_state_array, 1)
-
-        frame = 0
-        CS_frame = []
 
         # Extract the frame where the led is ON
-        while frame < len(led_state_array):
-            # detection of the CS ON
-            if led_state_array[frame] == 1:
-                CS_frame.append(frame)  # append the index
-                # move forward 900 frames in order to detect the next event
-                frame += 900
-            else:
-                frame += 1
+        CS_frame = detect_led_onsets(bonsai_df["LED_AREA"], factor).tolist()
 
         # remove all cs falsely detected.
         if len(CS_frame) > CS_number:
@@ -76,7 +378,7 @@ def detect_bonsai_led_state(
 
                 # Add the cs number on the plot
                 for cs in CS_frame:
-                    ax.annotate(s=str(cs),
+                    ax.annotate(str(cs),
                                 xy=(cs, bonsai_df['LED_AREA'].max()),
                                 xycoords='data',
                                 xytext=(cs+1, bonsai_df['LED_AREA'].min()),
@@ -89,12 +391,12 @@ def detect_bonsai_led_state(
 
                 frame_to_remove = int(input("insert the frame number: "))
 
-                while True:
-                    if frame_to_remove in CS_frame:
-                        CS_frame.remove(frame_to_remove)
-                        break
-                    else:
-                        continue
+                # Ask again until the frame is one of the detected frames
+                while frame_to_remove not in CS_frame:
+                    frame_to_remove = int(input(
+                        f"{frame_to_remove} was not detected, "
+                        "insert the frame number: "))
+                CS_frame.remove(frame_to_remove)
 
                 print(CS_frame)
                 answer = str(input("Are you done? (Y/N)")).upper()
@@ -111,7 +413,7 @@ def detect_bonsai_led_state(
 
         # Add the cs number on the plot
         for cs in CS_frame:
-            ax.annotate(s=str(cs),
+            ax.annotate(str(cs),
                         xy=(cs, bonsai_df['LED_AREA'].max()),
                         xycoords='data',
                         xytext=(cs+1, bonsai_df['LED_AREA'].min()),
@@ -122,16 +424,18 @@ def detect_bonsai_led_state(
         final_answer = str(input("do you validade this extraction? (Y/N)").upper())
 
     # save file here
-    # Use regular expression to find the base name
-    pattern = re.compile(r'\w+_\w+\d+_\d+_\w+\d+_\w_\d+_\w\d+.csv')
-    base_name = re.search(pattern, bonsai_csv).group().replace('.csv',
-                                                               "_CS-INDEX.txt",
-                                                               )
-
-    cs_index_saving_path = os.path.join(output_directory, base_name)
-
-    with open(cs_index_saving_path, "w") as file:
-        file.write(str(CS_frame))
+    base_name = _cs_index_basename(bonsai_csv)
+
+    cs_index_saving_path = os.path.join(output_directory,
+                                        f'{base_name}_CS-INDEX.json')
+
+    save_cs_index(cs_index_saving_path,
+                  CS_frame,
+                  video_key=base_name,
+                  expected_n_cs=CS_number,
+                  qc=check_cs_count(CS_frame, CS_number),
+                  factor=factor,
+                  )
     print(f"Extraction done, cs indices saved at: {cs_index_saving_path}")
     return bonsai_df
 
@@ -139,101 +443,193 @@ def detect_bonsai_led_state(
 
 
 def merge_extracted_cs_indices(directory, session):
-    """DOC STRING."""
+    """Merge the cs index sidecar files of a session into one dataframe.
+
+    There is one cs_NN column per cs of the animal with the most cs; animals
+    with fewer cs are left empty in the last columns. Legacy _CS-INDEX.txt
+    files are used when there is no _CS-INDEX.json for the same video.
+
+    Parameters
+    ----------
+    directory : str
+        Directory with the _CS-INDEX.json (or .txt) files.
+
+    session : str
+        Session of the files to process (eg. '_TES01_').
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        user, exp_id, date, session, species, animal_id, cs_01, ..., cs_NN,
+        frame_rate_fps and qc (empty for legacy files).
+    """
     # Access all the files in the directory
-    files_to_process = [file for file in os.listdir(directory)
-                        if file.endswith('CS-INDEX.txt')]
-
     pattern = re.compile(r'_\w\w\w\d\d_')
-    files_to_process = [file for file in files_to_process
-                        if re.search(pattern, file).group() == session]
-
-    # generate the dataframe where all the data will be pulled together
-
-    df = pd.DataFrame(columns=['user', 'exp_id', 'date', 'session',
-                               'species', 'animal_id', 'cs_01',
-                               'cs_02', 'cs_03', 'cs_04', 'cs_05'],
-                      index=range(len(files_to_process)),
-                      )
-    # extract experiment id files
-    for index, file in enumerate(files_to_process):
+    files_to_process = {}
+    for file in sorted(os.listdir(directory)):
+        if not file.endswith(('_CS-INDEX.json', '_CS-INDEX.txt')) \
+                or not re.search(pattern, file) \
+                or re.search(pattern, file).group() != session:
+            continue
+        video_key = file.rsplit('_CS-INDEX', 1)[0]
+        if video_key not in files_to_process or file.endswith('.json'):
+            files_to_process[video_key] = file
+
+    species_names = {'r': 'rat', 'm': 'mouse'}
+
+    rows = []
+    n_cs = 0
+    for video_key, file in files_to_process.items():
 
         # Extract information from animal_key
-        user = file.split("_")[0].lower()
-        exp_id = file.split("_")[1].lower()
-        date = file.split("_")[2]
-        session = file.split("_")[3].lower()
-        species = file.split("_")[4].lower()
-        if species == 'r':
-            species = 'rat'
-        elif species == 'm':
-            species = 'mouse'
-        animal_id = file.split("_")[5]
-
-        # open the file and extract the cs indices
-        with open(os.path.join(directory, file), "r") as cs_indices:
-            cs_indices = cs_indices.read()
-            cs_indices = cs_indices.replace("[", "").replace("]", "").split(", ")
-
-        # merge all the data together
-        row_to_append = ([user, exp_id, date, session, species, animal_id]
-                         + cs_indices)
-
-        # append to the dataframe
-        df.iloc[index, :] = row_to_append
+        user, exp_id, date, video_session, species, animal_id = \
+            video_key.split("_")[:6]
+
+        cs_index = load_cs_index(os.path.join(directory, file))
+        n_cs = max(n_cs, len(cs_index['cs_frames']))
+
+        row = {'user': user.lower(),
+               'exp_id': exp_id.lower(),
+               'date': date,
+               'session': video_session.lower(),
+               'species': species_names.get(species.lower(), species.lower()),
+               'animal_id': animal_id,
+               'frame_rate_fps': cs_index.get('frame_rate_fps'),
+               'qc': cs_index.get('qc'),
+               }
+        row.update({f'cs_{number:02d}': frame for number, frame
+                    in enumerate(cs_index['cs_frames'], start=1)})
+        rows.append(row)
+
+    cs_columns = [f'cs_{number:02d}' for number in range(1, n_cs+1)]
+
+    df = pd.DataFrame(rows,
+                      columns=['user', 'exp_id', 'date', 'session', 'species',
+                               'animal_id'] + cs_columns
+                      + ['frame_rate_fps', 'qc'],
+                      )
+    df[cs_columns] = df[cs_columns].astype('Int64')
 
     return df
 
 ##############################################################################
 
 
-def calculate_frame_rate(
-        directory,
-        session,
+def calculate_frame_timing(
+        timestamps,
 ):
-    """DOC STRING."""
-    # Use regex to filter files of interest in the directory
-    pattern = re.compile(r'_\w\w\w\d\d_')
-    directory_files = [file for file in os.listdir(directory)
-                       if file.endswith('.csv')]
+    """Calculate the frame rate, dropped frames and drift from timestamps.
+
+    The timestamps are parsed once with sub-second precision and the
+    intervals between consecutive frames are computed exactly. An interval
+    longer than 1.5 times the median interval counts as round(interval /
+    median) - 1 dropped frames.
+
+    Parameters
+    ----------
+    timestamps : pandas.Series
+        Timestamp of each frame (str or datetime).
+
+    Returns
+    -------
+    timing : dict
+        frame_rate_fps (frames over the elapsed time), nominal_fps
+        (1 / median interval), n_frames, duration_sec, max_interval_ms,
+        dropped_frames and drift_sec (elapsed time minus the time expected
+        at the nominal fps).
+    """
+    timestamps = pd.to_datetime(pd.Series(timestamps), utc=True)
+
+    # Time of each frame in seconds since the first frame
+    seconds = (timestamps - timestamps.iloc[0]).dt.total_seconds().to_numpy()
+    intervals = np.diff(seconds)
+
+    if len(intervals) == 0 or seconds[-1] <= 0:
+        raise ValueError('Not enough timestamps to calculate the frame rate')
+
+    median_interval = np.median(intervals)
+    gaps = intervals[intervals > 1.5*median_interval]
+    dropped_frames = int(np.sum(np.round(gaps/median_interval) - 1))
+
+    duration = seconds[-1]
+    n_intervals = len(intervals) + dropped_frames
+
+    return {'frame_rate_fps': round(len(intervals)/duration, 2),
+            'nominal_fps': round(1/median_interval, 2),
+            'n_frames': len(seconds),
+            'duration_sec': round(duration, 3),
+            'max_interval_ms': round(intervals.max()*1000, 1),
+            'dropped_frames': dropped_frames,
+            'drift_sec': round(duration - n_intervals*median_interval, 3),
+            }
+
+##############################################################################
 
-    directory_files = [file for file in directory_files
-                       if re.search(pattern, file).group() == session]
 
-    main_dataframe = pd.DataFrame(index=range(len(directory_files)),
-                                  columns=['animal_id', 'frame_rate_fps'])
+def estimate_frame_timing(
+        bonsai_csv,
+):
+    """Estimate the frame timing of a bonsai output.
+
+    Parameters
+    ----------
+    bonsai_csv : str
+        Absolute path to the bonsai .csv output (timestamp, LED area).
 
-    for index, file in enumerate(directory_files):
+    Returns
+    -------
+    timing : dict
+        animal_id and the timing from calculate_frame_timing().
+    """
+    timestamps = pd.read_csv(bonsai_csv, names=["timestamp"], usecols=[0],
+                             )["timestamp"]
 
-        # Read timestamps
-        full_path = os.path.join(directory, file)
-        df = pd.read_csv(full_path,
-                         names=["timestamp", "LED_AREA"],
-                         parse_dates=True)
+    timing = {'animal_id': os.path.basename(bonsai_csv).split('_')[5]}
+    timing.update(calculate_frame_timing(timestamps))
+    return timing
 
-        # transform the timestamp into datetime
-        df["timestamp"] = pd.to_datetime(df["timestamp"], utc=False)
+##############################################################################
 
-        # Create a timedelta object repreesented in seconds
-        df['timestamp'] = pd.to_timedelta(df['timestamp'].dt.strftime('%H:%M:%S')
-                                          ).dt.total_seconds().astype(int)
 
-        # Create a timedelta with the first timestamp
-        df["net_timestamp"] = df["timestamp"] - df["timestamp"][0]
+def calculate_frame_rate(
+        directory,
+        session,
+        n_jobs=None,
+):
+    """Estimate the frame timing of all the bonsai outputs of a session.
 
-        # Create an additional column representing each frame as the int 1
-        # (to be used to count the number of frames in each second)
-        df["frames_count"] = np.ones(len(df))
+    Parameters
+    ----------
+    directory : str
+        Directory with the bonsai .csv outputs.
+
+    session : str
+        Session of the files to process (eg. '_TES01_').
+
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cpus.
+
+    Returns
+    -------
+    main_dataframe : pandas.DataFrame
+        One row per file with the columns of estimate_frame_timing().
+    """
+    # Use regex to filter files of interest in the directory
+    pattern = re.compile(r'_\w\w\w\d\d_')
+    directory_files = [file for file in sorted(os.listdir(directory))
+                       if file.endswith('.csv')]
 
-        # Group by "timestamp" (== each second) column
-        # and sum all the frames in each grouped second
-        df_1 = df.groupby("timestamp").sum()
+    directory_files = [os.path.join(directory, file)
+                       for file in directory_files
+                       if re.search(pattern, file)
+                       and re.search(pattern, file).group() == session]
 
-        # Append to the main dataframe
-        animal_id = file.split('_')[5]
-        mean_frame_rate = round(df_1["frames_count"].mean(), 2)
-        main_dataframe.iloc[index, :] = [animal_id, mean_frame_rate]
+    timings = parallel_map(estimate_frame_timing, directory_files,
+                           n_jobs=n_jobs)
 
-    return main_dataframe
+    return pd.DataFrame(timings,
+                        columns=['animal_id', 'frame_rate_fps', 'nominal_fps',
+                                 'n_frames', 'duration_sec', 'max_interval_ms',
+                                 'dropped_frames', 'drift_sec'])
 
 ##############################################################################
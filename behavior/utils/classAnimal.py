@@ -12,6 +12,13 @@ import re
 
 class Animal():
     """Create a class to hold attributes of individual animal """
+
+    __slots__ = (
+        'project', 'user', 'pi', 'species', 'strain', 'animal_id', 'sex',
+        'date_of_birth', 'experiment_id', 'session', 'frame_rate',
+        'cs_start', 'cs_span_sec', 'group', 'video_basename',
+    )
+
     def __init__(
             self,
             project,
@@ -47,6 +54,11 @@ class Animal():
         self.group = group
         self.video_basename = video_key
 
+    def to_dict(self):
+        """Return the attributes of the animal as a dictionary."""
+        return {attribute: getattr(self, attribute)
+                for attribute in self.__slots__}
+
     def age_at_experiment(self):
         """Return the age in days of the subject at the experiment date."""
         if self.video_basename is None:
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import copy
+import re
+
+import pandas as pd
+from behavior.utils.classAnimal import Animal
+
+# Video label following established labelling convention
+VIDEO_KEY_GROUPS = r'(\w+)_(\w+\d+)_(\d+)_(\w+\d+)_(\w)_(\d+)_(\w\d+)'
+
+
+class AnimalRegistry():
+    """Create a class to look up animals in the record files.
+
+    The main record and the experiment info .csv files are read once and
+    indexed by animal_id. Animal objects are created on request and kept
+    by video key; each call returns a copy, so editing an animal (eg.
+    its cs_start) does not change the animal returned to other callers.
+    """
+
+    def __init__(
+            self,
+            main_record_abs_path,
+            experiment_info_abs_path,
+    ):
+
+        self.main_record = self._index(main_record_abs_path)
+        self.experiment_info = self._index(experiment_info_abs_path)
+
+        # cs onset columns: cs_01, cs_02, ...
+        self.cs_columns = sorted(
+            (column for column in self._columns(self.experiment_info)
+             if re.fullmatch(r'cs_\d+', column)),
+            key=lambda column: int(column.split('_')[1]))
+
+        self._animals = {}
+
+    @staticmethod
+    def _index(abs_path):
+        dataframe = pd.read_csv(abs_path, index_col=0,
+                                dtype={'animal_id': str})
+        duplicated = dataframe['animal_id'].duplicated(keep=False)
+        records = dataframe[~duplicated].set_index('animal_id'
+                                                   ).to_dict('index')
+        # Animals with several entries cannot be resolved
+        for animal_id in dataframe.loc[duplicated, 'animal_id']:
+            records[animal_id] = None
+        return records
+
+    @staticmethod
+    def _columns(records):
+        for record in records.values():
+            if record is not None:
+                return list(record)
+        return []
+
+    @staticmethod
+    def _lookup(records, animal_id, name):
+        try:
+            record = records[animal_id]
+        except KeyError:
+            raise KeyError(f'animal_id {animal_id} not found in the {name}')
+        if record is None:
+            raise ValueError(f'animal_id {animal_id} has several entries '
+                             f'in the {name}')
+        return record
+
+    def _cs_start(self, experiment):
+        # Animals with fewer cs have the last cs columns empty. A cell can
+        # also be blank text (eg. ' '), which makes the column an object
+        # column; those cells are skipped like NaN.
+        cs_start = {}
+        for column in self.cs_columns:
+            onset = pd.to_numeric(experiment[column], errors='coerce')
+            if pd.notna(onset):
+                cs_start[column] = int(onset)
+        return cs_start
+
+    def __contains__(self, animal_id):
+        return (animal_id in self.main_record
+                and animal_id in self.experiment_info)
+
+    def animal(self, video_key):
+        """Return the Animal of a video key.
+
+        Parameters
+        ----------
+        video_key : str
+            Video label following established labelling convention.
+
+        Returns
+        -------
+        animal : instance from Animal Class
+            A new copy on every call.
+        """
+        if video_key in self._animals:
+            return copy.deepcopy(self._animals[video_key])
+
+        # Extract information from the key using python regex
+        match = re.search(VIDEO_KEY_GROUPS, video_key).groups()
+        user, exp, date, session, species, animal_id, trial = match
+
+        main = self._lookup(self.main_record, animal_id, 'main record')
+        experiment = self._lookup(self.experiment_info, animal_id,
+                                  'experiment info')
+
+        animal = Animal(
+            main['project'],
+            main['pi'],
+            user,
+            main['species'],
+            str(main['strain']),
+            animal_id,
+            main['sex'],
+            main['date_of_birth'],
+            experiment['exp_id'],
+            experiment['session'],
+            experiment['frame_rate_fps'],
+            self._cs_start(experiment),
+            experiment['cs_span_sec'],
+            experiment['treatment'],
+            video_key,
+        )
+        self._animals[video_key] = animal
+
+        return copy.deepcopy(animal)
+
+    def animals(self, video_keys):
+        """Return the Animal of every video key."""
+        return [self.animal(video_key) for video_key in video_keys]
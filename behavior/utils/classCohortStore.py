@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from behavior.analysis.summary import reshape_trials
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.file_io import load_interim_dataframe
+from behavior.utils.parallel import parallel_map
+
+# Columns of the trial-aligned dataframes saved in the animal index
+INDEX_COLUMNS = ['animal_id', 'user', 'exp_id', 'treatment', 'session',
+                 'species']
+
+
+class CohortStore():
+    """Create a class to hold the trial-aligned signals of a cohort on disk.
+
+    The directory holds signals.npy, an array with shape (animals, cs,
+    samples, signals) opened as a memory map, index.csv with one row of
+    metadata per animal, and meta.json with the names of the cs and signals.
+    Opening a store only maps the file, so worker processes can attach to
+    it (or receive it as an argument) without copying the data.
+    """
+
+    def __init__(
+            self,
+            directory,
+            mode='r',
+    ):
+
+        self.directory = directory
+        self.mode = mode
+
+        with open(os.path.join(directory, 'meta.json'), 'r') as file:
+            meta = json.load(file)
+        self.cs_ids = meta['cs_ids']
+        self.signals = meta['signals']
+        self.protocol = Protocol(**meta['protocol'])
+
+        self.array = np.load(os.path.join(directory, 'signals.npy'),
+                             mmap_mode=mode)
+        self.index = pd.read_csv(os.path.join(directory, 'index.csv'),
+                                 dtype={'animal_id': str})
+
+    def __reduce__(self):
+        # Send only the directory to other processes
+        return (CohortStore, (self.directory, self.mode))
+
+    @classmethod
+    def create(
+            cls,
+            directory,
+            n_animals,
+            cs_ids,
+            signals,
+            protocol=None,
+            dtype=np.float32,
+    ):
+        """Create an empty store (filled with NaN) and open it for writing.
+
+        Parameters
+        ----------
+        directory : str
+
+        n_animals : int
+
+        cs_ids : list of str
+
+        signals : list of str
+            Columns of the trial-aligned dataframes to store.
+
+        protocol : Protocol object, optional
+            Timing of the cs trials.
+
+        dtype : numpy.dtype, optional
+        """
+        if protocol is None:
+            protocol = Protocol()
+        os.makedirs(directory, exist_ok=True)
+
+        array = np.lib.format.open_memmap(
+            os.path.join(directory, 'signals.npy'),
+            mode='w+',
+            dtype=dtype,
+            shape=(n_animals, len(cs_ids), protocol.n_samples, len(signals)),
+        )
+        array[:] = np.nan
+        array.flush()
+        del array
+
+        with open(os.path.join(directory, 'meta.json'), 'w') as file:
+            json.dump({'cs_ids': list(cs_ids),
+                       'signals': list(signals),
+                       'protocol': vars(protocol)}, file, indent=2)
+
+        pd.DataFrame(index=range(n_animals), columns=INDEX_COLUMNS
+                     ).to_csv(os.path.join(directory, 'index.csv'),
+                              index=False)
+
+        return cls(directory, mode='r+')
+
+    def write(self, position, dataframe):
+        """Write the signals of an animal from its trial-aligned dataframe.
+
+        Returns
+        -------
+        metadata : dict
+            Index row of the animal, to be saved with save_index().
+        """
+        cs_ids, trials = reshape_trials(dataframe, self.signals, self.protocol)
+        rows = [self.cs_ids.index(cs_id) for cs_id in cs_ids]
+        self.array[position, rows] = trials
+        self.array.flush()
+
+        first_row = dataframe.iloc[0]
+        return {column: first_row[column] for column in INDEX_COLUMNS
+                if column in dataframe.columns}
+
+    def save_index(self, metadata):
+        """Save the index rows of the animals, in position order."""
+        self.index = pd.DataFrame(list(metadata), columns=INDEX_COLUMNS)
+        self.index.to_csv(os.path.join(self.directory, 'index.csv'),
+                          index=False)
+
+    def signal(self, name):
+        """Return a view (animals, cs, samples) of a signal."""
+        return self.array[..., self.signals.index(name)]
+
+    def select(self, **metadata):
+        """Return the positions of the animals matching the metadata.
+
+        Eg. store.select(treatment='a', session='tes01').
+        """
+        mask = np.ones(len(self.index), dtype=bool)
+        for column, value in metadata.items():
+            mask &= (self.index[column] == value).to_numpy()
+        return np.flatnonzero(mask)
+
+##############################################################################
+
+
+def _read_animal(paths, signals):
+    # Read the columns of one animal, possibly split in several files
+    if isinstance(paths, str):
+        paths = [paths]
+
+    dataframes = []
+    for path in paths:
+        if path.endswith('.parquet'):
+            dataframe = load_interim_dataframe(path)
+        else:
+            dataframe = pd.read_csv(path, index_col=0,
+                                    dtype={'animal_id': str})
+        dataframes.append(dataframe)
+
+    dataframe = dataframes[0]
+    for other in dataframes[1:]:
+        new_columns = [column for column in other.columns
+                       if column not in dataframe.columns]
+        dataframe = pd.concat([dataframe, other[new_columns]], axis=1)
+
+    return dataframe[[column for column in dataframe.columns
+                      if column in INDEX_COLUMNS + ['cs_id', 'cs_epoch']
+                      or column in signals]]
+
+
+def _write_animal(task):
+    store, position, paths = task
+    return store.write(position, _read_animal(paths, store.signals))
+
+
+def build_cohort_store(
+        directory,
+        animal_files,
+        signals,
+        cs_ids=None,
+        protocol=None,
+        n_jobs=None,
+):
+    """Write the interim files of a cohort into a CohortStore.
+
+    Each worker process reads one animal and writes it directly into the
+    memory map, so no dataframe is sent between processes.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the store.
+
+    animal_files : list
+        One item per animal: the path to a trial-aligned interim file
+        (.parquet or .csv), or a list of paths whose columns are combined
+        (eg. the preprocessing and motion analysis files).
+
+    signals : list of str
+        Columns to store (eg. ['ed_head', 'speed_head', 'freezing_events']).
+
+    cs_ids : list of str, optional
+        Defaults to the cs of the protocol (cs_01 ... cs_05).
+
+    protocol : Protocol object, optional
+
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cpus.
+
+    Returns
+    -------
+    store : CohortStore
+        The store opened read-only.
+    """
+    if protocol is None:
+        protocol = Protocol()
+    if cs_ids is None:
+        cs_ids = protocol.cs_ids()
+
+    store = CohortStore.create(directory, len(animal_files), cs_ids, signals,
+                               protocol=protocol)
+    metadata = parallel_map(_write_animal,
+                            [(store, position, paths)
+                             for position, paths in enumerate(animal_files)],
+                            n_jobs=n_jobs,
+                            )
+    store.save_index(metadata)
+
+    return CohortStore(directory)
+
+##############################################################################
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+
+
+class Protocol():
+    """Create a class to hold the timing of a cs protocol.
+
+    Each cs is represented by a trial with three epochs: pre_cs, peri_cs and
+    post_cs. The summary statistics only use `analysis_sec` seconds of the
+    pre and post-cs epochs around the cs.
+    """
+
+    epochs = ('pre_cs', 'peri_cs', 'post_cs')
+
+    def __init__(
+            self,
+            pre_cs_sec=60,
+            cs_span_sec=30,
+            post_cs_sec=60,
+            fps=30,
+            analysis_sec=30,
+            n_cs=5,
+    ):
+
+        self.pre_cs_sec = pre_cs_sec
+        self.cs_span_sec = cs_span_sec
+        self.post_cs_sec = post_cs_sec
+        self.fps = fps
+        self.analysis_sec = analysis_sec
+        self.n_cs = n_cs
+
+    @classmethod
+    def from_animal(cls, animal, **kwargs):
+        """Create a protocol with the cs span and cs count of an animal."""
+        kwargs.setdefault('cs_span_sec', animal.cs_span_sec)
+        kwargs.setdefault('n_cs', len(animal.cs_start))
+        return cls(**kwargs)
+
+    @property
+    def trial_sec(self):
+        """Duration of a trial in seconds."""
+        return self.pre_cs_sec + self.cs_span_sec + self.post_cs_sec
+
+    @property
+    def n_samples(self):
+        """Number of samples in a trial at the target frame rate."""
+        return int(round(self.trial_sec*self.fps))
+
+    @property
+    def epoch_bounds(self):
+        """Return {cs_epoch: (start, stop)} sample indices within a trial."""
+        cs_onset = int(round(self.pre_cs_sec*self.fps))
+        cs_offset = int(round((self.pre_cs_sec + self.cs_span_sec)*self.fps))
+        return {
+            'pre_cs': (0, cs_onset),
+            'peri_cs': (cs_onset, cs_offset),
+            'post_cs': (cs_offset, self.n_samples),
+        }
+
+    @property
+    def analysis_bounds(self):
+        """Return {cs_epoch: (start, stop)} sample indices used in summaries.
+
+        The pre and post-cs epochs are trimmed to `analysis_sec` seconds
+        next to the cs.
+        """
+        bounds = self.epoch_bounds
+        analysis_samples = int(round(self.analysis_sec*self.fps))
+        cs_onset, cs_offset = bounds['peri_cs']
+        return {
+            'pre_cs': (max(cs_onset - analysis_samples, 0), cs_onset),
+            'peri_cs': (cs_onset, cs_offset),
+            'post_cs': (cs_offset,
+                        min(cs_offset + analysis_samples, self.n_samples)),
+        }
+
+    @property
+    def epoch_codes(self):
+        """Array with the position of the cs_epoch of each trial sample."""
+        codes = np.empty(self.n_samples, dtype=np.int8)
+        for code, (start, stop) in enumerate(self.epoch_bounds.values()):
+            codes[start:stop] = code
+        return codes
+
+    def cs_ids(self, n_cs=None):
+        """Return the cs labels: cs_01, cs_02, ..."""
+        n_cs = self.n_cs if n_cs is None else n_cs
+        return [f'cs_{number:02d}' for number in range(1, n_cs+1)]
+
+    def cs_windows(self, cs_start, frame_rate):
+        """Return the (start, end) source frames of each cs trial.
+
+        Parameters
+        ----------
+        cs_start : iterable of int
+            Frame of the cs onset at the aquisition frame rate.
+
+        frame_rate : float
+            Aquisition rate in frames per second.
+
+        Returns
+        -------
+        start, end : numpy.ndarray of int
+        """
+        cs_start = np.asarray(list(cs_start), dtype=float)
+        start = (cs_start - self.pre_cs_sec*frame_rate).astype(int)
+        end = (cs_start + (self.cs_span_sec + self.post_cs_sec)*frame_rate
+               ).astype(int)
+        return start, end
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class SessionIndex():
+    """Create a class to access a trial-aligned dataframe by cs and cs_epoch.
+
+    The offsets of every (cs_id, cs_epoch) block are computed once, and each
+    column is converted once to a numpy array, so the data of any block is
+    returned as an array view without scanning the dataframe again.
+    """
+
+    def __init__(self, dataframe):
+
+        cs_codes, cs_ids = pd.factorize(dataframe['cs_id'])
+        epoch_codes, cs_epochs = pd.factorize(dataframe['cs_epoch'])
+
+        # Find where the (cs_id, cs_epoch) pair changes
+        block_codes = cs_codes*len(cs_epochs) + epoch_codes
+        starts = np.flatnonzero(np.diff(block_codes, prepend=-1))
+        stops = np.append(starts[1:], len(block_codes))
+
+        self.dataframe = dataframe
+        self.cs_ids = list(cs_ids)
+        self.cs_epochs = list(cs_epochs)
+        self.offsets = {}
+        for start, stop in zip(starts, stops):
+            key = (cs_ids[cs_codes[start]], cs_epochs[epoch_codes[start]])
+            if key in self.offsets:
+                raise ValueError(f'{key} is not contiguous in the dataframe')
+            self.offsets[key] = (start, stop)
+
+        self._arrays = {}
+
+    def column(self, column):
+        """Return a column of the dataframe as a numpy array."""
+        if column not in self._arrays:
+            self._arrays[column] = self.dataframe[column].to_numpy()
+        return self._arrays[column]
+
+    def get(self, column, cs_id, cs_epoch):
+        """Return a view of a column during a cs_id and cs_epoch."""
+        try:
+            start, stop = self.offsets[(cs_id, cs_epoch)]
+        except KeyError:
+            raise KeyError(f'{cs_id}, {cs_epoch} not found in the dataframe')
+        return self.column(column)[start:stop]
+
+    def stack(
+            self,
+            columns,
+            cs_ids=None,
+            cs_epochs=None,
+            n_samples=None,
+    ):
+        """Stack the data of several columns, cs and cs_epochs.
+
+        Parameters
+        ----------
+        columns : list of str
+            Columns to extract (eg. ['x_coord_head', 'y_coord_head']).
+
+        cs_ids : list of str, optional
+            Defaults to all the cs in the dataframe.
+
+        cs_epochs : list of str, optional
+            Defaults to all the cs_epochs in the dataframe.
+
+        n_samples : int, optional
+            Keep only the last n_samples of each epoch (eg. 900). Without
+            it, all the epochs must have the same length.
+
+        Returns
+        -------
+        array : numpy.ndarray
+            Array with shape (cs, cs_epochs, columns, samples).
+        """
+        cs_ids = self.cs_ids if cs_ids is None else list(cs_ids)
+        cs_epochs = self.cs_epochs if cs_epochs is None else list(cs_epochs)
+
+        blocks = [self.offsets[(cs_id, cs_epoch)]
+                  for cs_id in cs_ids for cs_epoch in cs_epochs]
+        lengths = {stop - start for start, stop in blocks}
+        if n_samples is None:
+            if len(lengths) > 1:
+                raise ValueError('The epochs have different lengths, '
+                                 'use n_samples to trim them.')
+            n_samples = lengths.pop()
+        elif min(lengths) < n_samples:
+            raise ValueError(f'Some epochs are shorter than {n_samples}')
+
+        # Row index of the last n_samples of every block
+        rows = (np.array([stop for start, stop in blocks])[:, np.newaxis]
+                - n_samples + np.arange(n_samples))
+
+        array = np.stack([self.column(column)[rows] for column in columns],
+                         axis=1)
+
+        return array.reshape(len(cs_ids), len(cs_epochs), len(columns),
+                             n_samples)
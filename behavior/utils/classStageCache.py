@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def describe_object(obj):
+    """Return the attributes of an object (eg. Animal, Protocol) as a dict."""
+    if hasattr(obj, '__dict__'):
+        return dict(vars(obj))
+    return {slot: getattr(obj, slot) for slot in obj.__slots__}
+
+
+def dataframe_to_arrays(dataframe):
+    """Convert a dataframe into a dict of numpy arrays.
+
+    Categorical columns are stored as integer codes plus categories. Text
+    columns are stored as strings plus a mask of the missing values and
+    their dtype, so they are rebuilt with the same values and dtype.
+    Object columns with values other than text are not supported.
+    """
+    arrays = {
+        '__columns__': np.array([str(column) for column in dataframe.columns]),
+        '__index__': dataframe.index.to_numpy(),
+    }
+    for position, column in enumerate(dataframe.columns):
+        values = dataframe.iloc[:, position]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            arrays[f'codes_{position}'] = values.cat.codes.to_numpy()
+            arrays[f'categories_{position}'] = \
+                values.cat.categories.to_numpy(dtype=str)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values):
+            missing = values.isna().to_numpy()
+            strings = values.to_numpy(dtype=object, copy=True)
+            if pd.api.types.infer_dtype(strings[~missing]) not in ('string',
+                                                                   'empty'):
+                raise TypeError(f'Column {column} has values other than '
+                                'text and cannot be cached.')
+            strings[missing] = ''
+            arrays[f'column_{position}'] = strings.astype(str)
+            arrays[f'missing_{position}'] = missing
+            arrays[f'dtype_{position}'] = np.array(str(values.dtype))
+        else:
+            arrays[f'column_{position}'] = values.to_numpy()
+    return arrays
+
+
+def arrays_to_dataframe(arrays):
+    """Rebuild a dataframe created with dataframe_to_arrays()."""
+    columns = {}
+    for position, column in enumerate(arrays['__columns__']):
+        if f'codes_{position}' in arrays:
+            columns[column] = pd.Categorical.from_codes(
+                arrays[f'codes_{position}'],
+                categories=arrays[f'categories_{position}'],
+            )
+        elif f'missing_{position}' in arrays:
+            values = arrays[f'column_{position}'].astype(object)
+            values[arrays[f'missing_{position}']] = np.nan
+            columns[column] = pd.Series(
+                values, index=arrays['__index__'],
+                dtype=str(arrays[f'dtype_{position}']))
+        else:
+            columns[column] = arrays[f'column_{position}']
+    return pd.DataFrame(columns, index=arrays['__index__'])
+
+
+class StageCache():
+    """Create a class to cache the outputs of the pipeline stages on disk.
+
+    Each entry is keyed by a hash of the input file content, the Animal
+    metadata and the stage parameters, and saved as an uncompressed .npz
+    file named {stage}-{key}.npz. When the cache grows above max_bytes the
+    least recently used entries are removed.
+
+    Several workers can share a cache directory: files are written to a
+    .tmp file and renamed, and the hash of each input file is kept in its
+    own file in file_hashes/.
+    """
+
+    def __init__(
+            self,
+            directory,
+            max_bytes=None,
+    ):
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _write(self, path, write, mode='wb'):
+        # Write to a temporary file, then rename it. The temporary file does
+        # not match the entry pattern (*-*.npz), so evict() and invalidate()
+        # in other workers do not remove it while it is written.
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        with open(temporary_path, mode) as file:
+            write(file)
+        os.replace(temporary_path, path)
+
+    def _file_hash(self, path):
+        """Hash the content of a file, reusing the hash while it is intact."""
+        stat = os.stat(path)
+        abs_path = os.path.abspath(path)
+
+        # One file per input file, so workers do not overwrite each other
+        hashes_directory = os.path.join(self.directory, 'file_hashes')
+        os.makedirs(hashes_directory, exist_ok=True)
+        name = hashlib.sha256(abs_path.encode()).hexdigest()[:32]
+        hash_path = os.path.join(hashes_directory, f'{name}.json')
+        try:
+            with open(hash_path, 'r') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry and entry['path'] == abs_path \
+                and entry['size'] == stat.st_size \
+                and entry['mtime'] == stat.st_mtime:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+
+        entry = {'path': abs_path,
+                 'size': stat.st_size,
+                 'mtime': stat.st_mtime,
+                 'sha256': digest.hexdigest()}
+        self._write(hash_path, lambda file: json.dump(entry, file), mode='w')
+
+        return digest.hexdigest()
+
+    def key(
+            self,
+            stage,
+            input_path=None,
+            animal=None,
+            **parameters,
+    ):
+        """Return the hexadecimal key of a stage."""
+        description = {
+            'stage': stage,
+            'input': self._file_hash(input_path) if input_path else None,
+            'animal': describe_object(animal) if animal is not None else None,
+            'parameters': {name: describe_object(value)
+                           if hasattr(value, '__dict__')
+                           or hasattr(value, '__slots__') else value
+                           for name, value in parameters.items()},
+        }
+        encoded = json.dumps(description, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode()).hexdigest()[:32]
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, f'{stage}-{key}.npz')
+
+    def load(self, stage, key):
+        """Return the cached output of a stage, or None."""
+        path = self._path(stage, key)
+        try:
+            with np.load(path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        except (OSError, ValueError):
+            return None
+
+        # Mark the entry as recently used (unless another worker evicted it)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        if '__columns__' in arrays:
+            return arrays_to_dataframe(arrays)
+        return arrays
+
+    def save(self, stage, key, output):
+        """Save the output (DataFrame or dict of arrays) of a stage."""
+        if isinstance(output, pd.DataFrame):
+            output = dataframe_to_arrays(output)
+
+        self._write(self._path(stage, key),
+                    lambda file: np.savez(file, **output))
+
+        self.evict()
+
+    def get_or_compute(
+            self,
+            stage,
+            compute,
+            input_path=None,
+            animal=None,
+            **parameters,
+    ):
+        """Return the cached output of a stage, computing it if needed.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage (eg. 'preprocessing').
+
+        compute : callable
+            Function without arguments that returns the stage output.
+
+        input_path : str, optional
+            File read by the stage; its content is part of the key.
+
+        animal : Animal object, optional
+
+        **parameters
+            Parameters of the stage; they are part of the key.
+        """
+        key = self.key(stage, input_path, animal, **parameters)
+        output = self.load(stage, key)
+        if output is None:
+            output = compute()
+            self.save(stage, key, output)
+        return output
+
+    def size(self):
+        """Return the total size of the cache entries in bytes."""
+        return sum(os.path.getsize(path) for path in self._entries())
+
+    def _entries(self):
+        return glob.glob(os.path.join(self.directory, '*-*.npz'))
+
+    def evict(self):
+        """Remove the least recently used entries above max_bytes."""
+        if self.max_bytes is None:
+            return
+
+        entries = []
+        for path in self._entries():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def invalidate(self, stage=None):
+        """Remove all the entries, or only the entries of a stage."""
+        pattern = f'{stage}-*.npz' if stage else '*-*.npz'
+        for path in glob.glob(os.path.join(self.directory, pattern)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
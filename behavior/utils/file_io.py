@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+from behavior.utils.classProtocol import Protocol
+
+# Rows read at once from a deeplabcut table (about 8 MB with 40 bodyparts)
+READ_BLOCK_ROWS = 8192
+
+##############################################################################
+
+
+def read_dlc_cs_windows(
+        h5_path,
+        animal,
+        protocol=None,
+        bodyparts=None,
+        key=None,
+):
+    """Read only the frames of the cs trials from a deeplabcut .h5 file.
+
+    Overlapping trials are merged and each window is read with a separate
+    row selection, so memory depends on the window size and not on the
+    length of the session.
+
+    Parameters
+    ----------
+    h5_path : str
+        Absolute path to the deeplabcut .h5 output.
+
+    animal : Animal object
+        Provides the cs_start frames and the frame_rate.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials.
+
+    bodyparts : list of str, optional
+        Bodyparts to keep. Defaults to all. The other columns are dropped
+        by the store while each block of READ_BLOCK_ROWS rows is read.
+
+    key : str, optional
+        Key of the dataframe in the HDF5 store. Defaults to the first key
+        (deeplabcut uses 'df_with_missing').
+
+    Returns
+    -------
+    dataframe : pandas.DataFrame
+        Deeplabcut dataframe with the rows of the cs trials, indexed by the
+        original frame numbers. It can be passed directly to
+        calculate_euclidean_distance_dataframe() and
+        create_bodypart_coord_dataframe().
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    start, end = protocol.cs_windows(animal.cs_start.values(),
+                                     animal.frame_rate)
+    # The positions at frame `end` are also needed by the coordinates
+    end = end + 1
+
+    # Merge overlapping windows
+    order = np.argsort(start)
+    windows = []
+    for window_start, window_end in zip(start[order], end[order]):
+        if windows and window_start <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], window_end)
+        else:
+            windows.append([window_start, window_end])
+
+    with pd.HDFStore(h5_path, mode='r') as store:
+        if key is None:
+            key = store.keys()[0]
+
+        # Select the columns of the bodyparts in the store, using the
+        # column names saved in the table metadata
+        columns = None
+        storer = store.get_storer(key)
+        if bodyparts is not None and storer.is_table:
+            columns = [column for column in storer.non_index_axes[0][1]
+                       if column[-2] in bodyparts]
+
+        # The table holds all the columns in one block: read the rows in
+        # blocks and copy the selected columns, so that the selection does
+        # not keep the whole block in memory
+        chunks = []
+        for window_start, window_end in windows:
+            for block_start in range(int(max(window_start, 0)),
+                                     int(window_end), READ_BLOCK_ROWS):
+                chunk = store.select(key,
+                                     start=block_start,
+                                     stop=min(block_start + READ_BLOCK_ROWS,
+                                              int(window_end)),
+                                     columns=columns,
+                                     )
+                if bodyparts is not None:
+                    # Fixed format stores cannot select columns
+                    names = chunk.columns.get_level_values(-2)
+                    chunk = chunk.loc[:, names.isin(bodyparts)].copy()
+                chunks.append(chunk)
+
+    return pd.concat(chunks)
+
+##############################################################################
+
+
+def save_interim_dataframe(
+        dataframe,
+        path,
+        float32=True,
+):
+    """Save a per-animal dataframe in the compressed parquet format.
+
+    Text columns (eg. user, exp_id, cs_id, cs_epoch) are stored as
+    categorical and, by default, float columns as float32.
+
+    Parameters
+    ----------
+    dataframe : pandas.DataFrame
+        Eg. the output of create_bodypart_coord_dataframe(),
+        calculate_speed_dataframe() or the motion analysis dataframe.
+
+    path : str
+        Absolute path of the file (eg. ending in _motion_analysis_dlc.parquet).
+
+    float32 : bool, optional
+        Store the float columns as float32.
+    """
+    dataframe = dataframe.copy()
+    for column in dataframe.columns:
+        values = dataframe[column]
+        if values.dtype == object or pd.api.types.is_string_dtype(values):
+            dataframe[column] = values.astype('category')
+        elif float32 and pd.api.types.is_float_dtype(values):
+            dataframe[column] = values.astype(np.float32)
+
+    dataframe.to_parquet(path, engine='pyarrow', compression='zstd')
+
+##############################################################################
+
+
+def load_interim_dataframe(
+        path,
+        columns=None,
+):
+    """Load a dataframe saved with save_interim_dataframe().
+
+    Parameters
+    ----------
+    path : str
+
+    columns : list of str, optional
+        Read only these columns (eg. ['cs_id', 'cs_epoch', 'ed_head']).
+
+    Returns
+    -------
+    dataframe : pandas.DataFrame
+    """
+    return pd.read_parquet(path, engine='pyarrow', columns=columns)
+
+##############################################################################
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import time
+import tracemalloc
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Set by enable(); inherited by the worker processes
+ENVIRONMENT_VARIABLE = 'BEHAVIOR_INSTRUMENTATION'
+
+_settings = {'enabled': False, 'path': None, 'memory': False}
+_hooks = []
+# Peak memory of the stages running in this process, innermost last
+_memory_stack = []
+
+##############################################################################
+
+
+def enable(path=None, memory=False):
+    """Start recording the stages.
+
+    Parameters
+    ----------
+    path : str, optional
+        JSON lines file where each record is appended. Without a path the
+        records only go to the hooks.
+
+    memory : bool, optional
+        Trace the peak memory of each stage with tracemalloc (slower).
+
+    The settings are also saved in an environment variable, so the worker
+    processes started afterwards (eg. by parallel_map()) record their
+    stages in the same file.
+    """
+    _settings.update(enabled=True, path=path, memory=memory)
+    os.environ[ENVIRONMENT_VARIABLE] = json.dumps({'path': path,
+                                                   'memory': memory})
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """Stop recording the stages."""
+    _settings.update(enabled=False, path=None, memory=False)
+    os.environ.pop(ENVIRONMENT_VARIABLE, None)
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    """Return True when the stages are recorded."""
+    return _settings['enabled']
+
+
+def register_hook(hook):
+    """Call hook(record) with every record (dict) of this process."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Stop calling a hook registered with register_hook()."""
+    _hooks.remove(hook)
+
+##############################################################################
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024, 2)
+
+
+def _emit(record):
+    for hook in list(_hooks):
+        hook(record)
+    if _settings['path']:
+        # One short write per line, so records of several processes
+        # do not interleave
+        with open(_settings['path'], 'a') as file:
+            file.write(json.dumps(record, default=str) + '\n')
+
+
+@contextlib.contextmanager
+def stage(name, animal=None, **sizes):
+    """Record the wall time, cpu time and memory of a block of code.
+
+    Does nothing unless enable() was called. Eg.
+
+        with stage('read_dlc_cs_windows', animal=video_key) as record:
+            dataframe = read_dlc_cs_windows(path, animal)
+            record['n_rows'] = len(dataframe)
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+
+    animal : str, optional
+        Eg. the video key.
+
+    **sizes
+        Sizes of the inputs (eg. n_rows=len(dataframe)); more entries can
+        be added to the yielded record.
+
+    Yields
+    ------
+    record : dict
+        stage, animal, the sizes, start, wall_sec, cpu_sec, peak_mb
+        (with memory tracing), max_rss_mb (peak of the process), pid and
+        status ('done' or the name of the exception).
+    """
+    if not _settings['enabled']:
+        yield {}
+        return
+
+    record = {'stage': name, 'animal': animal, **sizes}
+    memory = _settings['memory'] and tracemalloc.is_tracing()
+    if memory:
+        # Keep the peak of the enclosing stage before resetting it
+        if _memory_stack:
+            _memory_stack[-1] = max(_memory_stack[-1],
+                                    tracemalloc.get_traced_memory()[1])
+        _memory_stack.append(0)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+
+    record['start'] = datetime.datetime.now().isoformat()
+    wall, cpu = time.perf_counter(), time.process_time()
+    status = 'done'
+    try:
+        yield record
+    except BaseException as error:
+        status = type(error).__name__
+        raise
+    finally:
+        record['wall_sec'] = round(time.perf_counter() - wall, 6)
+        record['cpu_sec'] = round(time.process_time() - cpu, 6)
+        if memory:
+            peak = max(_memory_stack.pop(),
+                       tracemalloc.get_traced_memory()[1])
+            if _memory_stack:
+                _memory_stack[-1] = max(_memory_stack[-1], peak)
+            record['peak_mb'] = round((peak - start_memory)/2**20, 3)
+        record['max_rss_mb'] = _max_rss_mb()
+        record['pid'] = os.getpid()
+        record['status'] = status
+        _emit(record)
+
+##############################################################################
+
+
+def load_records(path):
+    """Load the records of a JSON lines file as a dataframe."""
+    with open(path, 'r') as file:
+        return pd.DataFrame([json.loads(line) for line in file if line.strip()])
+
+
+def summary_report(records):
+    """Summarize the records per stage.
+
+    Parameters
+    ----------
+    records : pandas.DataFrame, list of dict or str
+        Records, or the path to a JSON lines file.
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        One row per stage, sorted by total wall time: calls, animals,
+        total, mean and max wall time, cpu/wall ratio, max peak_mb and
+        max_rss_mb, and failures.
+    """
+    if isinstance(records, str):
+        records = load_records(records)
+    records = pd.DataFrame(records)
+    for column in ['peak_mb', 'max_rss_mb', 'animal']:
+        if column not in records.columns:
+            records[column] = None
+
+    grouped = records.groupby('stage', sort=False)
+    report = pd.DataFrame({
+        'calls': grouped.size(),
+        'animals': grouped['animal'].nunique(),
+        'total_wall_sec': grouped['wall_sec'].sum(),
+        'mean_wall_sec': grouped['wall_sec'].mean(),
+        'max_wall_sec': grouped['wall_sec'].max(),
+        'cpu_wall_ratio': grouped['cpu_sec'].sum()/grouped['wall_sec'].sum(),
+        'max_peak_mb': grouped['peak_mb'].max(),
+        'max_rss_mb': grouped['max_rss_mb'].max(),
+        'failed': grouped['status'].apply(lambda status: (status != 'done'
+                                                          ).sum()),
+    })
+
+    return report.sort_values('total_wall_sec', ascending=False).round(4)
+
+##############################################################################
+
+
+# Worker processes inherit the settings of the parent
+if ENVIRONMENT_VARIABLE in os.environ:
+    try:
+        enable(**json.loads(os.environ[ENVIRONMENT_VARIABLE]))
+    except (ValueError, TypeError):
+        pass
@@ -9,9 +9,16 @@ Licensed under GNU Lesser General Public License v3.0
 
 # Dependencies
 
+import functools
+import hashlib
+import json
+import numpy as np
 import pandas as pd
 import re
-from behavior.utils.classAnimal import Animal
+from concurrent.futures import ThreadPoolExecutor
+from behavior.utils.classAnimalRegistry import AnimalRegistry
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.classSessionIndex import SessionIndex
 import glob
 import os
 
@@ -45,64 +52,50 @@ def fetch_animal_info(
     # Make sure that the key object is a string
     assert isinstance(video_key, str), 'Key must be a string object'
 
-    # Extract information from the key using python regex
-    pattern = r'(\w+)_(\w+\d+)_(\d+)_(\w+\d+)_(\w)_(\d+)_(\w\d+)'
-    match = re.search(pattern, video_key).groups()
+    # The records are read once and reused while the files are unchanged
+    registry = load_animal_registry(main_record_abs_path,
+                                    experiment_info_abs_path,
+                                    )
+    return registry.animal(video_key)
 
-    # Unpack the match object
-    user, exp, date, session, species, animal_id, trial = match
+###############################################################################
 
-    # Read other information from main record
-    main_record_dataframe = pd.read_csv(main_record_abs_path,
-                                        index_col=0)
-    entry = main_record_dataframe[
-        main_record_dataframe['animal_id'].isin([animal_id])
-    ]
 
-    # Retrive more information from the main_record
-    sex = entry.sex.item()
-    pi = entry.pi.item()
-    date_of_birth = entry.date_of_birth.item()
-    strain = str(entry.strain.item())
-    species = entry.species.item()
-    project = entry.project.item()
-
-    # Read dataframe with experiment info.
-    experiment_info_dataframe = pd.read_csv(experiment_info_abs_path,
-                                            index_col=0)
-    entry = experiment_info_dataframe[
-        experiment_info_dataframe['animal_id'].isin([animal_id])
-    ]
+def load_animal_registry(
+    main_record_abs_path,
+    experiment_info_abs_path,
+):
+    """Return an AnimalRegistry, reusing it while the files are unchanged.
+
+    Parameters
+    ----------
+    main_record_abs_path : str
+        Absolute path to the .csv file containing animal records.
+
+    experiment_info_abs_path : str
+        Absolute path to the .csv file containing specific information about
+        the experiment.
 
-    # Retrieve remaining information
-    experiment_id = entry.exp_id.item()
-    session = entry.session.item()
-    frame_rate = entry.frame_rate_fps.item()
-    cs_start = {col: entry[col].item()
-                for col in ['cs_01', 'cs_02', 'cs_03', 'cs_04', 'cs_05']}
-    group = entry.treatment.item()
-    file_key = video_key
-    cs_span_sec = entry.cs_span_sec.item()
-
-    # Instantiate an object from my class Animal
-    animal = Animal(
-        project,
-        pi,
-        user,
-        species,
-        strain,
-        animal_id,
-        sex,
-        date_of_birth,
-        experiment_id,
-        session,
-        frame_rate,
-        cs_start,
-        cs_span_sec,
-        group,
-        file_key,
+    Returns
+    -------
+    registry : AnimalRegistry
+    """
+    return _load_animal_registry(
+        main_record_abs_path,
+        experiment_info_abs_path,
+        os.path.getmtime(main_record_abs_path),
+        os.path.getmtime(experiment_info_abs_path),
     )
-    return animal
+
+
+@functools.lru_cache(maxsize=8)
+def _load_animal_registry(
+    main_record_abs_path,
+    experiment_info_abs_path,
+    main_record_mtime,
+    experiment_info_mtime,
+):
+    return AnimalRegistry(main_record_abs_path, experiment_info_abs_path)
 
 ###############################################################################
 
@@ -133,6 +126,7 @@ def create_basic_working_record(
     dataframe = pd.DataFrame(index=range(n_rows), columns=columns)
     dataframe['user'] = animal.user
     dataframe['exp_id'] = animal.experiment_id
+    dataframe['treatment'] = animal.group
     dataframe['session'] = animal.session
     dataframe['species'] = animal.species
     dataframe['animal_id'] = animal.animal_id
@@ -143,12 +137,105 @@ def create_basic_working_record(
 
 ###############################################################################
 
+def create_trial_aligned_dataframe(
+        animal,
+        cs_ids,
+        signals,
+        protocol=None,
+        dtype=np.float64,
+):
+    """Assemble a trial-aligned dataframe from preallocated signal blocks.
+
+    Metadata columns are categorical and every signal column is numeric,
+    so the dataframe is built in a single concatenation.
+
+    Parameters
+    ----------
+    animal : object from Animal Class
+        Contains the information about specific animals.
+
+    cs_ids : list of str
+        Name of each cs, in the order the blocks are stacked.
+
+    signals : dict
+        Column name as key and array with shape
+        (len(cs_ids)*protocol.n_samples,) or (len(cs_ids), protocol.n_samples)
+        as value.
+
+    protocol : Protocol object, optional
+        Timing of the cs trials used to label the cs_epoch of each sample.
+
+    dtype : numpy.dtype, optional
+        Data type of the signal columns.
+
+    Returns
+    -------
+    dataframe : DataFrame
+        One row per sample, indexed from 1.
+    """
+    if protocol is None:
+        protocol = Protocol()
+
+    n_cs = len(cs_ids)
+    n_rows = n_cs*protocol.n_samples
+
+    def constant(value):
+        # Missing metadata (eg. an empty treatment cell) is a NaN code
+        if pd.isna(value):
+            return pd.Categorical.from_codes(np.full(n_rows, -1,
+                                                     dtype=np.int8),
+                                             categories=[])
+        return pd.Categorical.from_codes(np.zeros(n_rows, dtype=np.int8),
+                                         categories=[value])
+
+    columns = {
+        'user': constant(animal.user),
+        'exp_id': constant(animal.experiment_id),
+        'treatment': constant(animal.group),
+        'session': constant(animal.session),
+        'species': constant(animal.species),
+        'animal_id': constant(animal.animal_id),
+        'cs_id': pd.Categorical.from_codes(
+            np.repeat(np.arange(n_cs), protocol.n_samples),
+            categories=list(cs_ids),
+            ),
+        'cs_epoch': pd.Categorical.from_codes(
+            np.tile(protocol.epoch_codes, n_cs),
+            categories=list(protocol.epochs),
+            ),
+    }
+    for column, values in signals.items():
+        columns[column] = np.asarray(values, dtype=dtype).reshape(n_rows)
+
+    return pd.DataFrame(columns, index=np.arange(1, n_rows+1))
+
+###############################################################################
+
+def hash_file(filepath):
+    """Return the sha256 hexdigest of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+###############################################################################
+
 def concatenate_transformed_dataframes(
         directory_path,
         save_at_directory=False,
+        n_jobs=8,
 ):
     """Concatenates dataframes with same columns at specific directory.
 
+    When the merged file is saved, a manifest with the size, mtime, hash and
+    number of rows of every merged file is saved next to it
+    ({basename}merged_summary_stats.manifest.json), in the order of their
+    rows in the merged file. The next calls only read the new files and
+    append them to the merged file. The rows of a file that was changed or
+    removed are dropped from the merged file, and a changed file is read
+    again and appended.
+
     Parameters
     ----------
     directory_path : str
@@ -157,43 +244,127 @@ def concatenate_transformed_dataframes(
     save_at_directory : bool, optional
         In True, it saves a .csv file with the merged dataframes at the dir.
 
+    n_jobs : int, optional
+        Number of threads used to read the files.
+
     Returns
     -------
     merged_dataframes : DataFrame
-        All the dataframes merged.
+        All the dataframes merged. Empty if there are no dataframes in the
+        directory.
 
     """
     # Check all the dataframes that exist in the saving directory
-    dataframe_filepaths = glob.glob(os.path.join(directory_path,
-                                                 '*_individual_summary_stats.csv'))
-
-    # Read all the dataframes and append them to a list
-    dataframes_to_merge = [pd.read_csv(filepath, index_col=0)
-                           for filepath in dataframe_filepaths]
-    # Concatenate all the dataframes together
-    merged_dataframes = pd.concat(dataframes_to_merge, ignore_index=True)
-
-    # Save the .csv file at the directory location
-    if save_at_directory:
-        # Define the basename for the final file
-        pattern = '(\w\w_\w+\d+_\d+_\w+\d+_\w_)'
-
-        # Search in the first element of the previous list of paths
-        to_match = dataframe_filepaths[0]
-        # Find the name using regex
-        matched = re.search(pattern, to_match).group()
-        final_basename = f'{matched}merged_summary_stats.csv'
-
-        # Absolute saving filepath
-        abs_savepath = os.path.join(directory_path, final_basename)
-
-        # Save the dataframe
-        merged_dataframes.to_csv(abs_savepath)
-
-        # Confirm success
-        print(f'{final_basename} file saved at \n {abs_savepath}')
-
-    return merged_dataframes
+    dataframe_filepaths = sorted(glob.glob(
+        os.path.join(directory_path, '*_individual_summary_stats.csv')))
+
+    if not dataframe_filepaths:
+        print(f'No *_individual_summary_stats.csv files at {directory_path}')
+        return pd.DataFrame()
+
+    def read_dataframes(filepaths):
+        # Read the dataframes in parallel (reading is I/O bound)
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            return list(executor.map(
+                lambda filepath: pd.read_csv(filepath, index_col=0),
+                filepaths))
+
+    if not save_at_directory:
+        # Concatenate all the dataframes together
+        return pd.concat(read_dataframes(dataframe_filepaths),
+                         ignore_index=True)
+
+    # Define the basename for the final file
+    pattern = r'(\w\w_\w+\d+_\d+_\w+\d+_\w_)'
+
+    # Search in the first element of the previous list of paths
+    to_match = dataframe_filepaths[0]
+    # Find the name using regex
+    matched = re.search(pattern, to_match).group()
+    final_basename = f'{matched}merged_summary_stats.csv'
+
+    # Absolute saving filepath
+    abs_savepath = os.path.join(directory_path, final_basename)
+    manifest_path = abs_savepath.replace('.csv', '.manifest.json')
+
+    empty_manifest = {'files': {}, 'n_rows': 0, 'columns': None}
+    try:
+        with open(manifest_path, 'r') as file:
+            manifest = json.load(file)
+        merged = pd.read_csv(abs_savepath, index_col=0)
+        if len(merged) != manifest['n_rows']:
+            raise ValueError(f'{abs_savepath} does not match its manifest')
+    except (OSError, ValueError, KeyError):
+        manifest, merged = empty_manifest, None
+
+    # Compare the files with the manifest
+    new_files, stale = [], set()
+    for filepath in dataframe_filepaths:
+        basename = os.path.basename(filepath)
+        stat = os.stat(filepath)
+        entry = manifest['files'].get(basename)
+        if entry is None:
+            new_files.append(filepath)
+        elif (entry['size'], entry['mtime']) != (stat.st_size, stat.st_mtime):
+            if hash_file(filepath) != entry['sha256']:
+                stale.add(basename)
+                new_files.append(filepath)
+            else:
+                entry['mtime'] = stat.st_mtime
+    basenames = {os.path.basename(filepath)
+                 for filepath in dataframe_filepaths}
+    stale.update(set(manifest['files']) - basenames)
+
+    new_dataframes = read_dataframes(new_files)
+    columns = manifest['columns']
+    if new_dataframes and columns is not None and any(
+            list(dataframe.columns) != columns
+            for dataframe in new_dataframes):
+        # Columns changed: rebuild to keep a consistent header
+        manifest, merged, stale = empty_manifest, None, set()
+        new_files = dataframe_filepaths
+        new_dataframes = read_dataframes(new_files)
+
+    if stale:
+        # Drop the rows of the changed and removed files
+        keep = np.ones(len(merged), dtype=bool)
+        offset = 0
+        for basename, entry in list(manifest['files'].items()):
+            if basename in stale:
+                keep[offset:offset+entry['n_rows']] = False
+                del manifest['files'][basename]
+            offset += entry['n_rows']
+        merged = pd.concat([merged[keep]] + new_dataframes, ignore_index=True)
+        merged.to_csv(abs_savepath)
+    elif new_dataframes:
+        to_append = pd.concat(new_dataframes, ignore_index=True)
+        if merged is None:
+            merged = to_append
+            merged.to_csv(abs_savepath)
+        else:
+            to_append.index += len(merged)
+            to_append.to_csv(abs_savepath, mode='a', header=False)
+            merged = pd.concat([merged, to_append])
+
+    for filepath, dataframe in zip(new_files, new_dataframes):
+        stat = os.stat(filepath)
+        manifest['files'][os.path.basename(filepath)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'sha256': hash_file(filepath),
+            'n_rows': len(dataframe),
+        }
+    manifest['n_rows'] = len(merged)
+    manifest['columns'] = list(merged.columns)
+
+    with open(manifest_path, 'w') as file:
+        json.dump(manifest, file, indent=1)
+
+    # Confirm success
+    print(f'{final_basename} file saved at \n {abs_savepath} '
+          f'({len(new_files)} new files merged)')
+
+    return merged
 
 
 ###############################################################################
@@ -209,9 +380,10 @@ def fetch_bodypart_coordinates(
 
     Parameters
     ----------
-    dataframe : pandas DataFrame
+    dataframe : pandas DataFrame or SessionIndex
         Dataframe with bodypart positions created using the function
-        create_bodypart_position_dataframe.
+        create_bodypart_position_dataframe. Pass a SessionIndex built once
+        when fetching many cs/cs_epochs to avoid rescanning the dataframe.
     bodypart : str
         Name of the bodypart must be in the columns from dataframe.
     cs_id : str
@@ -228,15 +400,12 @@ def fetch_bodypart_coordinates(
     assert isinstance(cs_id, str), f"{cs_id} must be a string"
     assert isinstance(cs_epoch, str), f"{cs_epoch} must be a string"
 
-    # Subset dataframe using cs_id
-    target_cs_id = dataframe[dataframe['cs_id'].isin([cs_id])]
-
-    # Subset previous dataframe using cs_epoch
-    target_cs_epoch = target_cs_id[target_cs_id['cs_epoch'].isin([cs_epoch])]
+    if not isinstance(dataframe, SessionIndex):
+        dataframe = SessionIndex(dataframe)
 
     # Assign the x, y coordiates as numpy arrays
-    x = target_cs_epoch[f'x_coord_{bodypart}'].to_numpy()
-    y = target_cs_epoch[f'y_coord_{bodypart}'].to_numpy()
+    x = dataframe.get(f'x_coord_{bodypart}', cs_id, cs_epoch)
+    y = dataframe.get(f'y_coord_{bodypart}', cs_id, cs_epoch)
 
     return x, y
 
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+##############################################################################
+
+
+def parallel_map(
+        function,
+        items,
+        n_jobs=None,
+):
+    """Apply a function to every item using a pool of processes.
+
+    Parameters
+    ----------
+    function : callable
+        Function defined at module level (it must be picklable).
+
+    items : iterable
+
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of cpus. With
+        n_jobs=1 the items are processed in the current process.
+
+    Returns
+    -------
+    results : list
+        The results in the same order as the items.
+    """
+    items = list(items)
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs, len(items)))
+
+    if n_jobs == 1:
+        return [function(item) for item in items]
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(function, items))
+
+##############################################################################
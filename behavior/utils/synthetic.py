@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from behavior.analysis.kinematics import PIXEL_TO_CM
+
+DEFAULT_BODYPARTS = ['head', 'ear_right', 'ear_left', 'between_eyes',
+                     'upper_torso', 'lower_torso', 'tail_base']
+
+# Position of each bodypart relative to the body center (cm, facing +x)
+BODYPART_OFFSETS = {
+    'head': (6., 0.),
+    'between_eyes': (4.5, 0.),
+    'ear_right': (3., -1.5),
+    'ear_left': (3., 1.5),
+    'upper_torso': (1., 0.),
+    'lower_torso': (-3., 0.),
+    'tail_base': (-7., 0.),
+}
+
+##############################################################################
+
+
+def _place_episodes(rng, n_frames, n_episodes, duration_range, occupied):
+    # Draw episodes that do not overlap the occupied frames
+    episodes = []
+    for _ in range(n_episodes):
+        for _attempt in range(20):
+            length = int(rng.integers(*duration_range, endpoint=True))
+            start = int(rng.integers(0, max(n_frames - length, 1)))
+            if not occupied[start:start+length].any():
+                occupied[start:start+length] = True
+                episodes.append((start, start + length))
+                break
+    return sorted(episodes)
+
+
+def generate_dlc_dataframe(
+        n_frames,
+        frame_rate=29.7,
+        bodyparts=None,
+        n_freezes=20,
+        freeze_sec=(2, 10),
+        n_darts=5,
+        dart_sec=(0.3, 1),
+        dropout_rate=0.01,
+        arena_px=(640, 480),
+        scorer='DLC_resnet50_syntheticShuffle1_100000',
+        seed=None,
+):
+    """Generate a deeplabcut dataframe of an animal moving in an arena.
+
+    The body center walks with a smoothed random velocity (about 5 cm/sec)
+    and reflects on the arena walls. During freezing episodes the animal
+    stays still apart from the tracking jitter, and during darting episodes
+    it runs at about 40 cm/sec. Dropouts are frames where a bodypart has a
+    low likelihood and a displaced position.
+
+    Parameters
+    ----------
+    n_frames : int
+
+    frame_rate : float, optional
+
+    bodyparts : list of str, optional
+        Defaults to DEFAULT_BODYPARTS. Bodyparts without an offset in
+        BODYPART_OFFSETS are placed at the body center.
+
+    n_freezes, n_darts : int, optional
+        Number of freezing and darting episodes.
+
+    freeze_sec, dart_sec : tuple of float, optional
+        Range of the duration of the episodes in seconds.
+
+    dropout_rate : float, optional
+        Fraction of low-likelihood frames per bodypart.
+
+    arena_px : tuple of int, optional
+        Width and height of the arena in pixels.
+
+    scorer : str, optional
+
+    seed : int, optional
+
+    Returns
+    -------
+    dataframe : pandas.DataFrame
+        Deeplabcut dataframe with (scorer, bodyparts, coords) columns.
+    episodes : pandas.DataFrame
+        The freezing and darting episodes: kind, start and stop frames.
+    """
+    if bodyparts is None:
+        bodyparts = DEFAULT_BODYPARTS
+    rng = np.random.default_rng(seed)
+    cm_to_px = 1/PIXEL_TO_CM
+
+    occupied = np.zeros(n_frames, dtype=bool)
+    freezes = _place_episodes(rng, n_frames, n_freezes,
+                              [int(sec*frame_rate) for sec in freeze_sec],
+                              occupied)
+    darts = _place_episodes(rng, n_frames, n_darts,
+                            [int(sec*frame_rate) for sec in dart_sec],
+                            occupied)
+
+    # Smoothed random speed (px/frame) and heading
+    kernel = np.ones(15)/15
+    speed = np.abs(np.convolve(rng.normal(5, 4, n_frames), kernel, 'same'))
+    turn = np.convolve(rng.normal(0, 0.08, n_frames), kernel, 'same')
+    speed *= cm_to_px/frame_rate
+    for start, stop in darts:
+        speed[start:stop] = 40*cm_to_px/frame_rate
+    for start, stop in freezes:
+        speed[start:stop] = 0
+        turn[start:stop] = 0
+    heading = np.cumsum(turn)
+
+    # Integrate the body center and reflect it inside the arena
+    center = []
+    for step, size in zip((np.cos(heading), np.sin(heading)), arena_px):
+        position = np.cumsum(speed*step) + size/2
+        position = np.abs((position % (2*size)) - size)
+        center.append(size - position)
+    center_x, center_y = center
+
+    columns = pd.MultiIndex.from_product([[scorer], list(bodyparts),
+                                          ['x', 'y', 'likelihood']],
+                                         names=['scorer', 'bodyparts',
+                                                'coords'])
+    data = np.empty((n_frames, len(columns)))
+    cos, sin = np.cos(heading), np.sin(heading)
+    for column, bodypart in enumerate(bodyparts):
+        offset_x, offset_y = (np.array(BODYPART_OFFSETS.get(bodypart,
+                                                            (0., 0.)))
+                              * cm_to_px)
+        # Tracking jitter of about 0.3 px
+        x = center_x + offset_x*cos - offset_y*sin + rng.normal(0, .3,
+                                                                n_frames)
+        y = center_y + offset_x*sin + offset_y*cos + rng.normal(0, .3,
+                                                                n_frames)
+        likelihood = rng.uniform(0.95, 1, n_frames)
+
+        dropout = rng.random(n_frames) < dropout_rate
+        likelihood[dropout] = rng.uniform(0, 0.5, dropout.sum())
+        x[dropout] += rng.normal(0, 30, dropout.sum())
+        y[dropout] += rng.normal(0, 30, dropout.sum())
+
+        data[:, 3*column:3*column+3] = np.column_stack([x, y, likelihood])
+
+    episodes = pd.DataFrame(
+        [('freezing', start, stop) for start, stop in freezes]
+        + [('darting', start, stop) for start, stop in darts],
+        columns=['kind', 'start', 'stop'])
+
+    return pd.DataFrame(data, columns=columns), episodes
+
+##############################################################################
+
+
+def save_dlc_h5(dataframe, path):
+    """Save a deeplabcut dataframe as deeplabcut does (.h5, table format)."""
+    dataframe.to_hdf(path, key='df_with_missing', mode='w', format='table')
+
+##############################################################################
+
+
+def generate_bonsai_dataframe(
+        n_frames,
+        cs_frames,
+        frame_rate=29.7,
+        cs_span_sec=30,
+        start_time='2020-01-10 10:00:00',
+        dropped_frames=0,
+        seed=None,
+):
+    """Generate a bonsai output: timestamp and LED area of each frame.
+
+    Parameters
+    ----------
+    n_frames : int
+
+    cs_frames : list of int
+        Frames where the LED turns on.
+
+    frame_rate : float, optional
+
+    cs_span_sec : float, optional
+        Duration of the LED ON.
+
+    start_time : str, optional
+
+    dropped_frames : int, optional
+        Number of frames removed at random (their timestamps are skipped).
+
+    seed : int, optional
+
+    Returns
+    -------
+    bonsai_df : pandas.DataFrame
+        timestamp (str, as written by bonsai) and LED_AREA columns.
+    """
+    rng = np.random.default_rng(seed)
+
+    led_area = rng.normal(20, 3, n_frames).clip(0)
+    for cs in cs_frames:
+        led_area[cs:cs + int(cs_span_sec*frame_rate)] += 400
+
+    timestamps = (pd.Timestamp(start_time)
+                  + pd.to_timedelta(np.arange(n_frames)/frame_rate, unit='s'))
+    keep = np.ones(n_frames, dtype=bool)
+    keep[rng.choice(np.arange(1, n_frames), dropped_frames,
+                    replace=False)] = False
+
+    return pd.DataFrame({
+        'timestamp': timestamps[keep].strftime('%Y-%m-%dT%H:%M:%S.%f0-05:00'),
+        'LED_AREA': led_area[keep],
+    })
+
+##############################################################################
+
+
+def generate_cohort(
+        directory,
+        n_animals=10,
+        frame_rate=29.7,
+        n_cs=5,
+        first_cs_sec=120,
+        cs_interval_sec=120,
+        cs_span_sec=30,
+        bodyparts=None,
+        seed=0,
+        **dlc_parameters,
+):
+    """Write a synthetic cohort: deeplabcut, bonsai and record files.
+
+    Each animal gets a {video_key}DLC_synthetic.h5 file and a bonsai
+    {video_key}.csv file, with the video key following the labelling
+    convention (eg. JC_EXP001_20200110_TES01_R_100000_T00). The main record
+    and the experiment info files can be passed to fetch_animal_info() and
+    to the behavior-pipeline command.
+
+    Parameters
+    ----------
+    directory : str
+
+    n_animals : int, optional
+
+    frame_rate : float, optional
+
+    n_cs : int, optional
+
+    first_cs_sec, cs_interval_sec, cs_span_sec : float, optional
+        Time of the first cs, time between cs onsets and cs duration.
+
+    bodyparts : list of str, optional
+
+    seed : int, optional
+
+    **dlc_parameters
+        Passed to generate_dlc_dataframe() (eg. n_freezes, dropout_rate).
+
+    Returns
+    -------
+    cohort : dict
+        'dlc_files', 'bonsai_files', 'video_keys', 'main_record',
+        'experiment_info' and 'episodes' (DataFrame with the animal_id of
+        each freezing and darting episode).
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    cs_frames = [int(round((first_cs_sec + number*cs_interval_sec)
+                           * frame_rate)) for number in range(n_cs)]
+    # Keep 150 seconds after the last onset for the post-cs window
+    n_frames = cs_frames[-1] + int(150*frame_rate)
+
+    cohort = {'dlc_files': [], 'bonsai_files': [], 'video_keys': []}
+    main_record, experiment_info, episodes = [], [], []
+    for number in range(n_animals):
+        animal_id = str(100000 + number)
+        video_key = f'JC_EXP001_20200110_TES01_R_{animal_id}_T00'
+
+        dataframe, animal_episodes = generate_dlc_dataframe(
+            n_frames, frame_rate, bodyparts, seed=seed + number,
+            **dlc_parameters)
+        dlc_file = os.path.join(directory, f'{video_key}DLC_synthetic.h5')
+        save_dlc_h5(dataframe, dlc_file)
+
+        bonsai_file = os.path.join(directory, f'{video_key}.csv')
+        generate_bonsai_dataframe(n_frames, cs_frames, frame_rate,
+                                  cs_span_sec, seed=seed + number,
+                                  ).to_csv(bonsai_file, header=False,
+                                           index=False)
+
+        cohort['dlc_files'].append(dlc_file)
+        cohort['bonsai_files'].append(bonsai_file)
+        cohort['video_keys'].append(video_key)
+        main_record.append({'animal_id': animal_id, 'sex': 'mf'[number % 2],
+                            'pi': 'jl', 'date_of_birth': '20191001',
+                            'strain': 'sd', 'species': 'rat',
+                            'project': 'synthetic'})
+        experiment_info.append({'animal_id': animal_id, 'exp_id': 'exp001',
+                                'session': 'tes01',
+                                'frame_rate_fps': frame_rate,
+                                **{f'cs_{cs:02d}': frame for cs, frame
+                                   in enumerate(cs_frames, start=1)},
+                                'treatment': 'ab'[(number//2) % 2],
+                                'cs_span_sec': cs_span_sec})
+        episodes.append(animal_episodes.assign(animal_id=animal_id))
+
+    cohort['main_record'] = os.path.join(directory, 'main_record.csv')
+    cohort['experiment_info'] = os.path.join(directory,
+                                             'experiment_info.csv')
+    pd.DataFrame(main_record).to_csv(cohort['main_record'])
+    pd.DataFrame(experiment_info).to_csv(cohort['experiment_info'])
+    cohort['episodes'] = pd.concat(episodes, ignore_index=True)
+
+    return cohort
+
+##############################################################################
@@ -1,2 +1,6 @@
-import behavior.visualization.plot_motion
-import behavior.visualization.plot_events
+from behavior import _lazy_submodules
+
+__getattr__, __dir__ = _lazy_submodules(__name__, [
+    'plot_motion',
+    'plot_events',
+])
@@ -61,7 +61,7 @@ def plot_bodypart_trajectory(
     ax : matplotlib.axes.Axes
         The ax to plot the data
 
-    dataframe : pandas.DataFrame
+    dataframe : pandas.DataFrame or SessionIndex
         Dataframe generated with function create_bodypart_coord_dataframe().
 
     bodypart : str
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+
+Time and memory-profile the analysis stages on a synthetic cohort.
+
+Usage:
+    python benchmarks/run_benchmarks.py --scales 1 10 100
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/old.json
+
+Every public stage is run for 1, 10 and 100 animals. The wall and cpu time
+are measured in a first pass and the peak memory (tracemalloc) of each
+stage in a second pass, since tracing slows the code down. The results are
+saved in benchmarks/results/{date}-{commit}.json.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from behavior.analysis.binning import calculate_time_course
+from behavior.analysis.classCohortTensor import CohortTensor
+from behavior.analysis.cleaning import clean_dlc_coordinates
+from behavior.analysis.freezing_analysis import extract_freezing_events
+from behavior.analysis.kinematics import extract_bodypart_list
+from behavior.analysis.motion_analysis import (
+    calculate_euclidean_distance_dataframe,
+    calculate_speed_dataframe,
+    calculate_threshold,
+    create_bodypart_coord_dataframe,
+    extract_darting_events,
+)
+from behavior.analysis.summary import calculate_epoch_summary
+from behavior.pipeline import DEFAULT_SETTINGS, METADATA_COLUMNS, run_cohort
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.file_io import read_dlc_cs_windows
+from behavior.utils.organization import (
+    create_basic_working_record,
+    fetch_animal_info,
+)
+from behavior.utils.synthetic import generate_cohort
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'results')
+
+##############################################################################
+
+
+def animal_stages(path, animal, protocol, settings):
+    """Yield (stage, function) for one animal, chaining the outputs."""
+    outputs = {}
+
+    def stage(name, function):
+        def run():
+            outputs[name] = function()
+        return name, run
+
+    yield stage('read_dlc_cs_windows',
+                lambda: read_dlc_cs_windows(path, animal, protocol))
+    yield stage('clean_dlc_coordinates',
+                lambda: clean_dlc_coordinates(
+                    outputs['read_dlc_cs_windows'])[0])
+    dataframe = 'clean_dlc_coordinates'
+    yield stage('create_bodypart_coord_dataframe',
+                lambda: create_bodypart_coord_dataframe(
+                    outputs[dataframe], animal, protocol=protocol))
+    yield stage('calculate_euclidean_distance_dataframe',
+                lambda: calculate_euclidean_distance_dataframe(
+                    outputs[dataframe], animal, protocol=protocol)[0])
+    yield stage('calculate_speed_dataframe',
+                lambda: calculate_speed_dataframe(
+                    outputs['calculate_euclidean_distance_dataframe'],
+                    extract_bodypart_list(outputs[dataframe]),
+                    protocol.fps))
+
+    def darting():
+        preprocessing = outputs['calculate_speed_dataframe']
+        bodypart = settings['darting_bodypart']
+        speed = preprocessing[f'speed_{bodypart}'].to_numpy()
+        return extract_darting_events(
+            preprocessing[f'smooth_speed_{bodypart}'].to_numpy(),
+            preprocessing[f'ed_{bodypart}'].to_numpy(),
+            calculate_threshold(speed, factor=settings['darting_factor']),
+            settings['threshold_distance'])[0]
+
+    yield stage('extract_freezing_events',
+                lambda: extract_freezing_events(
+                    outputs['calculate_speed_dataframe'],
+                    settings['freezing_bodyparts'],
+                    settings['motion_threshold'],
+                    settings['min_freezing_duration']))
+    yield stage('extract_darting_events', darting)
+
+    def summary():
+        preprocessing = outputs['calculate_speed_dataframe']
+        bodypart = settings['summary_bodypart']
+        motion = preprocessing[METADATA_COLUMNS + [f'ed_{bodypart}',
+                                                   f'speed_{bodypart}']
+                               ].copy()
+        motion['freezing_events'] = outputs['extract_freezing_events']
+        motion['darting_events'] = outputs['extract_darting_events']
+        outputs['motion'] = motion
+        return calculate_epoch_summary(motion,
+                                       distance_column=f'ed_{bodypart}',
+                                       speed_column=f'speed_{bodypart}',
+                                       protocol=protocol)
+
+    yield stage('calculate_epoch_summary', summary)
+    yield 'outputs', outputs
+
+
+def cohort_stages(motions, summaries, protocol):
+    """Yield (stage, function) of the stages run over the whole cohort."""
+    bodypart = DEFAULT_SETTINGS['summary_bodypart']
+    columns = ['freezing_events', f'ed_{bodypart}', f'speed_{bodypart}']
+
+    yield 'calculate_time_course', lambda: calculate_time_course(
+        pd.concat(motions, ignore_index=True), columns, bin_sec=5,
+        protocol=protocol)
+    yield 'cohort_tensor_aggregate', lambda: CohortTensor.from_summary(
+        pd.concat(summaries, ignore_index=True)).aggregate('treatment')
+
+##############################################################################
+
+
+def measure(run, memory):
+    """Return (wall_sec, cpu_sec) or the peak memory (bytes) of run()."""
+    if memory:
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        else:
+            # Python < 3.9: restart the tracing to reset the peak
+            tracemalloc.stop()
+            tracemalloc.start()
+        start = tracemalloc.get_traced_memory()[0]
+        run()
+        return tracemalloc.get_traced_memory()[1] - start
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    run()
+    return time.perf_counter() - wall, time.process_time() - cpu
+
+
+def run_stages(cohort, n_animals, protocol, memory=False):
+    """Run every stage for n_animals; return {stage: [measures]}."""
+    settings = DEFAULT_SETTINGS
+    measures = {}
+    motions, summaries = [], []
+
+    for path, video_key in zip(cohort['dlc_files'][:n_animals],
+                               cohort['video_keys'][:n_animals]):
+        animal = fetch_animal_info(video_key, cohort['main_record'],
+                                   cohort['experiment_info'])
+        for name, run in animal_stages(path, animal, protocol, settings):
+            if name == 'outputs':
+                summary = run['calculate_epoch_summary']
+                motions.append(run['motion'])
+                summaries.append(pd.concat(
+                    [create_basic_working_record(animal, len(summary)),
+                     summary], axis=1))
+                continue
+            measures.setdefault(name, []).append(measure(run, memory))
+
+    for name, run in cohort_stages(motions, summaries, protocol):
+        measures[name] = [measure(run, memory)]
+
+    return measures
+
+
+def run_benchmarks(scales, directory, n_jobs=None, memory=True):
+    """Benchmark every stage at every scale; return a list of records."""
+    protocol = Protocol()
+    print(f'Generating {max(scales)} synthetic animals in {directory}')
+    cohort = generate_cohort(directory, n_animals=max(scales))
+
+    records = []
+    for n_animals in scales:
+        timings = run_stages(cohort, n_animals, protocol)
+        peaks = {}
+        if memory:
+            tracemalloc.start()
+            peaks = run_stages(cohort, n_animals, protocol, memory=True)
+            tracemalloc.stop()
+
+        for stage, values in timings.items():
+            wall, cpu = np.sum(values, axis=0)
+            records.append({
+                'stage': stage,
+                'n_animals': n_animals,
+                'wall_sec': round(float(wall), 4),
+                'cpu_sec': round(float(cpu), 4),
+                'per_animal_ms': round(1000*float(wall)/n_animals, 2),
+                'peak_mb': (round(max(peaks[stage])/2**20, 2)
+                            if stage in peaks else None),
+            })
+
+        # End to end, one process per animal, on a directory with only
+        # the deeplabcut files of these animals
+        subset = os.path.join(directory, f'cohort_{n_animals}')
+        os.makedirs(subset, exist_ok=True)
+        for path in cohort['dlc_files'][:n_animals]:
+            link = os.path.join(subset, os.path.basename(path))
+            if not os.path.exists(link):
+                os.symlink(path, link)
+
+        wall = time.perf_counter()
+        run_cohort(subset, cohort['main_record'], cohort['experiment_info'],
+                   os.path.join(subset, 'output'), n_jobs=n_jobs)
+        wall = time.perf_counter() - wall
+        records.append({'stage': 'run_cohort', 'n_animals': n_animals,
+                        'wall_sec': round(wall, 4), 'cpu_sec': None,
+                        'per_animal_ms': round(1000*wall/n_animals, 2),
+                        'peak_mb': None})
+        print(pd.DataFrame([record for record in records
+                            if record['n_animals'] == n_animals]
+                           ).to_string(index=False))
+
+    return records
+
+##############################################################################
+
+
+def environment():
+    """Describe the code and machine of a benchmark run."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))
+                                ).stdout.strip()
+    except OSError:
+        commit = ''
+
+    return {'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpu_count': os.cpu_count()}
+
+
+def compare(results, reference):
+    """Return the ratio (new/reference) of the wall time of each stage."""
+    new = pd.DataFrame(results['records'])
+    old = pd.DataFrame(reference['records'])
+    merged = new.merge(old, on=['stage', 'n_animals'],
+                       suffixes=('', '_reference'))
+    merged['wall_ratio'] = (merged['wall_sec']
+                            / merged['wall_sec_reference']).round(2)
+    merged['peak_ratio'] = (merged['peak_mb']
+                            / merged['peak_mb_reference']).round(2)
+    return merged[['stage', 'n_animals', 'wall_sec_reference', 'wall_sec',
+                   'wall_ratio', 'peak_mb_reference', 'peak_mb',
+                   'peak_ratio']]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[-2],
+                                     )
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='Numbers of animals (default: 1 10 100)')
+    parser.add_argument('--directory', default=None,
+                        help='Directory for the synthetic cohort '
+                             '(default: a temporary directory)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Worker processes of run_cohort')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='Skip the memory profiling pass')
+    parser.add_argument('--output', default=None,
+                        help='Results file (default: benchmarks/results/)')
+    parser.add_argument('--compare', default=None,
+                        help='Previous results file to compare with')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        directory = args.directory or temporary_directory
+        records = run_benchmarks(sorted(args.scales), directory,
+                                 n_jobs=args.jobs,
+                                 memory=not args.no_memory)
+
+    results = {'environment': environment(), 'records': records}
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        date = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIRECTORY,
+                              f"{date}-{results['environment']['commit']}.json")
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f'Results saved at: {output}')
+
+    if args.compare:
+        with open(args.compare, 'r') as file:
+            reference = json.load(file)
+        print(compare(results, reference).to_string(index=False))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
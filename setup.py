@@ -9,6 +9,8 @@ requirements = [
     "matplotlib",
     "seaborn",
     "scipy",
+    "tables",
+    "pyarrow",
     "pingouin",
     "statsmodels",
     "sklearn",
@@ -27,6 +29,11 @@ if __name__ == "__main__":
         packages=find_packages(), #find_namespace_packages(include=["behavior.*"],
         include_package_data=True,
         install_requires=requirements,
+        entry_points={
+            'console_scripts': [
+                'behavior-pipeline=behavior.pipeline:main',
+            ],
+        },
         license='MIT',
-        python_requires='>=3.6',
+        python_requires='>=3.7',
         zip_safe=False)
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.analysis.binning import bin_trials, calculate_time_course
+from behavior.analysis.summary import calculate_epoch_summary
+from behavior.utils.classAnimal import Animal
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.organization import create_trial_aligned_dataframe
+
+PROTOCOL = Protocol(pre_cs_sec=6, cs_span_sec=3, post_cs_sec=6, fps=10,
+                    analysis_sec=3, n_cs=4)
+
+
+def make_cohort(n_animals=3, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (PROTOCOL.n_cs, PROTOCOL.n_samples)
+    dataframes = []
+    for number in range(n_animals):
+        animal = Animal('synthetic', 'jl', 'jc', 'rat', 'sd',
+                        str(100000 + number), 'm', '20191001', 'exp001',
+                        'tes01', PROTOCOL.fps, [0]*PROTOCOL.n_cs,
+                        PROTOCOL.cs_span_sec, 'a')
+        distance = rng.random(shape)
+        distance[rng.random(shape) < 0.05] = np.nan
+        dataframes.append(create_trial_aligned_dataframe(
+            animal, PROTOCOL.cs_ids(),
+            {'freezing_events': rng.random(shape) < 0.4,
+             'ed_head': distance},
+            protocol=PROTOCOL))
+    return dataframes
+
+
+@pytest.mark.parametrize('bin_sec', [0.5, 1, 3])
+def test_bins_sum_to_the_epoch_totals(bin_sec):
+    dataframes = make_cohort()
+
+    animal_ids, cs_ids, bin_start_sec, time_course = calculate_time_course(
+        pd.concat(dataframes, ignore_index=True),
+        ['freezing_events', 'ed_head'], bin_sec=bin_sec,
+        reductions=['sum', 'sum'], protocol=PROTOCOL)
+
+    assert animal_ids == ['100000', '100001', '100002']
+    assert cs_ids == PROTOCOL.cs_ids()
+    assert time_course.shape == (3, PROTOCOL.n_cs, 15/bin_sec, 2)
+    np.testing.assert_allclose(bin_start_sec,
+                               np.arange(-6, 9, bin_sec))
+
+    # Epochs of the summary: 3 seconds before, during and after the cs
+    for animal, dataframe in enumerate(dataframes):
+        summary = calculate_epoch_summary(dataframe, distance_column='ed_head',
+                                          protocol=PROTOCOL)
+        for epoch, start_sec in [('pre_cs', -3), ('peri_cs', 0),
+                                 ('post_cs', 3)]:
+            in_epoch = (bin_start_sec >= start_sec) \
+                & (bin_start_sec < start_sec + 3)
+            totals = time_course[animal][:, in_epoch].sum(axis=1)
+            expected = summary[summary['cs_epoch'] == epoch]
+            np.testing.assert_array_equal(totals[:, 0],
+                                          expected['freezing_raw'])
+            np.testing.assert_allclose(totals[:, 1],
+                                       expected['total_distance_cm'],
+                                       atol=0.005)
+
+
+def test_bin_trials_drops_the_last_partial_bin():
+    trials = np.arange(2*7*2, dtype=float).reshape(2, 7, 2)
+
+    binned = bin_trials(trials, 3, ['mean', 'sum'])
+
+    assert binned.shape == (2, 2, 2)
+    np.testing.assert_array_equal(binned[0, :, 0], [2, 8])
+    np.testing.assert_array_equal(binned[0, :, 1], [9, 27])
+
+
+def test_default_reductions_of_a_single_animal():
+    dataframe = make_cohort(n_animals=1)[0]
+
+    _, _, _, time_course = calculate_time_course(
+        dataframe, ['freezing_events', 'ed_head'], bin_sec=15,
+        protocol=PROTOCOL)
+
+    # One bin per trial: the fraction of freezing and the total distance
+    expected = dataframe.groupby('cs_id', observed=True).agg(
+        {'freezing_events': 'mean', 'ed_head': 'sum'})
+    np.testing.assert_allclose(time_course[0, :, 0], expected.to_numpy())
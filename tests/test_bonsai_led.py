@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import json
+
+import matplotlib
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.utils import bonsai_led
+
+ONSETS = [100, 1200, 2300]
+
+
+def save_bonsai_csv(path, onsets=ONSETS, n_frames=3000, fps=30,
+                    dropped=()):
+    """Bonsai output: timestamp and LED area of every frame."""
+    led_area = np.full(n_frames, 10.0)
+    for onset in onsets:
+        led_area[onset:onset + 30] = 100
+    # Frames that were not recorded leave a gap in the timestamps
+    frame_numbers = np.delete(np.arange(n_frames + len(dropped)), dropped)
+    timestamps = (pd.Timestamp('2020-01-10 10:00:00', tz='US/Eastern')
+                  + pd.to_timedelta(frame_numbers/fps, unit='s'))
+    pd.DataFrame({
+        'timestamp': timestamps.strftime('%Y-%m-%dT%H:%M:%S.%f0%z'),
+        'LED_AREA': led_area,
+    }).to_csv(path, header=False, index=False)
+    return path
+
+
+def test_detect_led_onsets_skips_the_refractory_period():
+    led_area = np.full(3000, 10.0)
+    for onset in ONSETS:
+        led_area[onset:onset + 30] = 100
+
+    cs_frames = bonsai_led.detect_led_onsets(led_area, factor=2)
+
+    assert cs_frames.tolist() == ONSETS
+    assert bonsai_led.check_cs_count(cs_frames, 3) == 'ok'
+    assert bonsai_led.check_cs_count(cs_frames, 2) == 'extra'
+    assert bonsai_led.check_cs_count(cs_frames, 4) == 'missing'
+
+
+def test_directory_run_flags_the_files_it_cannot_process(tmp_path):
+    bonsai = tmp_path / 'bonsai'
+    bonsai.mkdir()
+    save_bonsai_csv(bonsai / 'JC_EXP001_20200110_TES01_R_100000_T00.csv')
+    save_bonsai_csv(bonsai / 'JC_EXP001_20200110_TES01_R_100001_T00.csv',
+                    onsets=ONSETS[:2])
+    save_bonsai_csv(bonsai / 'copy of_TES01_.csv')
+
+    report = bonsai_led.extract_cs_onsets_from_directory(
+        str(bonsai), factor=2, CS_number=3,
+        output_directory=str(tmp_path / 'cs'), save_plot=False, n_jobs=1)
+
+    assert report['qc'].tolist() == ['ok', 'missing', 'error']
+    assert report['error'].iloc[:2].tolist() == ['', '']
+    assert 'labelling convention' in report['error'].iloc[2]
+    assert report['cs_frames'].iloc[0] == ONSETS
+
+
+def test_detect_bonsai_led_state_removes_the_chosen_frames(tmp_path,
+                                                           monkeypatch):
+    matplotlib.use('Agg')
+    bonsai_csv = save_bonsai_csv(
+        tmp_path / 'JC_EXP001_20200110_TES01_R_100000_T00.csv')
+
+    # A frame that was not detected is asked again instead of looping
+    answers = iter(['5', '1200', 'y', 'y'])
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+
+    bonsai_led.detect_bonsai_led_state(str(bonsai_csv), 2, 2,
+                                       str(tmp_path))
+
+    with open(tmp_path / 'JC_EXP001_20200110_TES01_R_100000_T00'
+                         '_CS-INDEX.json') as file:
+        cs_index = json.load(file)
+    assert cs_index['cs_frames'] == [100, 2300]
+    assert cs_index['qc'] == 'ok'
+
+
+def test_calculate_frame_rate_counts_the_dropped_frames(tmp_path):
+    save_bonsai_csv(tmp_path / 'JC_EXP001_20200110_TES01_R_100000_T00.csv',
+                    fps=29.97)
+    save_bonsai_csv(tmp_path / 'JC_EXP001_20200110_TES01_R_100001_T00.csv',
+                    dropped=[500, 501, 1500])
+    save_bonsai_csv(tmp_path / 'JC_EXP001_20200110_TES02_R_100000_T00.csv')
+
+    timing = bonsai_led.calculate_frame_rate(str(tmp_path), '_TES01_',
+                                             n_jobs=1)
+
+    assert timing['animal_id'].tolist() == ['100000', '100001']
+    assert timing['nominal_fps'].tolist() == [29.97, 30]
+    assert timing['n_frames'].tolist() == [3000, 3000]
+    assert timing['dropped_frames'].tolist() == [0, 3]
+    assert timing['duration_sec'].tolist() == pytest.approx(
+        [2999/29.97, 3002/30], abs=1e-3)
+    assert timing['frame_rate_fps'].tolist() == pytest.approx(
+        [29.97, 2999*30/3002], abs=0.01)
+    assert timing['max_interval_ms'].tolist() == pytest.approx(
+        [1000/29.97, 100], abs=0.1)
+    # The timestamps are saved with microseconds
+    assert timing['drift_sec'].abs().max() <= 0.002
+
+
+def test_cs_index_sidecar_round_trip(tmp_path):
+    path = str(tmp_path / 'JC_EXP001_20200110_TES01_R_100000_T00'
+                          '_CS-INDEX.json')
+    cs_frames = np.arange(100, 100 + 22*900, 900)
+
+    bonsai_led.save_cs_index(path, cs_frames, frame_rate_fps=29.97,
+                             qc='ok')
+
+    assert bonsai_led.load_cs_index(path) == {
+        'cs_frames': cs_frames.tolist(), 'n_cs': 22, 'frame_rate_fps': 29.97,
+        'qc': 'ok'}
+
+
+def test_merge_extracted_cs_indices_with_any_number_of_cs(tmp_path):
+    bonsai_led.save_cs_index(
+        str(tmp_path / 'JC_EXP001_20200110_TES01_R_100000_T00'
+                       '_CS-INDEX.json'),
+        np.arange(100, 100 + 22*900, 900), frame_rate_fps=30, qc='ok')
+    bonsai_led.save_cs_index(
+        str(tmp_path / 'JC_EXP001_20200110_TES01_M_100001_T00'
+                       '_CS-INDEX.json'),
+        ONSETS, frame_rate_fps=29.97, qc='missing')
+    # Legacy files are read when there is no .json for the same video
+    for animal_id in [100001, 100002]:
+        with open(tmp_path / f'JC_EXP001_20200110_TES01_R_{animal_id}_T00'
+                             '_CS-INDEX.txt', 'w') as file:
+            file.write(str(ONSETS[:2]))
+    bonsai_led.save_cs_index(
+        str(tmp_path / 'JC_EXP001_20200110_TES02_R_100000_T00'
+                       '_CS-INDEX.json'), ONSETS)
+
+    merged = bonsai_led.merge_extracted_cs_indices(str(tmp_path), '_TES01_')
+
+    cs_columns = [f'cs_{number:02d}' for number in range(1, 23)]
+    assert merged.columns.tolist() == (['user', 'exp_id', 'date', 'session',
+                                        'species', 'animal_id'] + cs_columns
+                                       + ['frame_rate_fps', 'qc'])
+    assert merged['animal_id'].tolist() == ['100001', '100000', '100001',
+                                            '100002']
+    assert merged['species'].tolist() == ['mouse', 'rat', 'rat', 'rat']
+    assert merged.loc[1, cs_columns].tolist() == list(range(100, 100 + 22*900,
+                                                            900))
+    assert merged.loc[0, cs_columns[:4]].tolist() == ONSETS + [pd.NA]
+    assert merged.loc[3, cs_columns[:3]].tolist() == ONSETS[:2] + [pd.NA]
+    assert merged['qc'].iloc[:2].tolist() == ['missing', 'ok']
+    assert merged[['frame_rate_fps', 'qc']].iloc[2:].isna().all(axis=None)
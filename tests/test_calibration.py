@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.analysis.calibration import (
+    sweep_darting_parameters,
+    sweep_freezing_parameters,
+)
+from behavior.analysis.freezing_analysis import (
+    calculate_mean_freezing,
+    extract_freezing_events,
+)
+from behavior.analysis.motion_analysis import (
+    calculate_threshold,
+    extract_darting_events,
+)
+from behavior.analysis.summary import calculate_epoch_summary
+from behavior.utils.classAnimal import Animal
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.organization import create_trial_aligned_dataframe
+
+PROTOCOL = Protocol(pre_cs_sec=6, cs_span_sec=3, post_cs_sec=6, fps=10,
+                    analysis_sec=3, n_cs=4)
+
+
+def make_cohort(n_animals=3, seed=0):
+    """Trial-aligned speed and distance of animals with bursts of speed."""
+    rng = np.random.default_rng(seed)
+    n_rows = PROTOCOL.n_cs*PROTOCOL.n_samples
+
+    dataframes = []
+    for number in range(n_animals):
+        animal = Animal('synthetic', 'jl', 'jc', 'rat', 'sd',
+                        str(100000 + number), 'm', '20191001', 'exp001',
+                        'tes01', PROTOCOL.fps,
+                        [0]*PROTOCOL.n_cs, PROTOCOL.cs_span_sec, 'a')
+        speed = rng.gamma(2, 2, n_rows)
+        for start in rng.integers(0, n_rows, 25):
+            speed[start:start + rng.integers(2, 15)] += 30
+        # Bursts at the edges of the animal, to test the animal boundaries
+        speed[:3] += 40
+        speed[-3:] += 40
+        speed[rng.integers(0, n_rows, 5)] = np.nan
+        smooth_speed = np.convolve(np.nan_to_num(speed), np.ones(3)/3, 'same')
+
+        dataframes.append(create_trial_aligned_dataframe(
+            animal, PROTOCOL.cs_ids(),
+            {'speed_head': speed, 'smooth_speed_head': smooth_speed,
+             'ed_head': speed/PROTOCOL.fps},
+            protocol=PROTOCOL))
+
+    return dataframes
+
+
+@pytest.mark.parametrize('cs_epoch', ['pre_cs', 'peri_cs', 'post_cs'])
+def test_sweep_darting_parameters_matches_single_runs(cs_epoch):
+    dataframes = make_cohort()
+    factors = [0, 0.5, 1, 2]
+    threshold_distances = [0, 2, 5, 10]
+
+    rng = np.random.default_rng(1)
+    reference = pd.DataFrame({
+        'animal_id': np.repeat([str(100000 + number) for number in range(3)],
+                               PROTOCOL.n_cs),
+        'cs_id': PROTOCOL.cs_ids()*3,
+        'darting_events': rng.integers(0, 4, 3*PROTOCOL.n_cs),
+    })
+
+    scores, per_cs_error = sweep_darting_parameters(
+        pd.concat(dataframes, ignore_index=True), 'head', factors,
+        threshold_distances, reference, cs_epoch=cs_epoch, protocol=PROTOCOL)
+
+    expected = reference['darting_events'].to_numpy(dtype=float)
+    for row, (factor, threshold_distance) in enumerate(
+            (factor, threshold_distance) for factor in factors
+            for threshold_distance in threshold_distances):
+        detected = []
+        for dataframe in dataframes:
+            threshold = calculate_threshold(dataframe['speed_head'], factor)
+            events, _ = extract_darting_events(
+                dataframe['smooth_speed_head'].to_numpy(),
+                dataframe['ed_head'].to_numpy(),
+                threshold,
+                threshold_distance)
+            summary = calculate_epoch_summary(
+                dataframe[['cs_id']].assign(darting_events=events),
+                protocol=PROTOCOL)
+            detected.extend(summary.loc[summary['cs_epoch'] == cs_epoch,
+                                        'darting_events'])
+        error = np.array(detected) - expected
+
+        score = scores.iloc[row]
+        assert score['factor'] == factor
+        assert score['threshold_distance'] == threshold_distance
+        assert score['bias'] == pytest.approx(error.mean())
+        assert score['mae'] == pytest.approx(np.abs(error).mean())
+        if np.std(detected) > 0:
+            assert score['r'] == pytest.approx(
+                np.corrcoef(detected, expected)[0, 1])
+
+        per_cs = per_cs_error[(per_cs_error['factor'] == factor)
+                              & (per_cs_error['threshold_distance']
+                                 == threshold_distance)]
+        assert per_cs['bias'].to_numpy() == pytest.approx(
+            error.reshape(3, PROTOCOL.n_cs).mean(axis=0))
+
+
+def test_sweep_freezing_parameters_reproduces_the_pipeline():
+    dataframes = make_cohort()
+    thresholds = [1, 2, 4]
+    durations = [0, 1, 3, 10]
+
+    def pipeline_freezing(threshold, duration, cs_epoch='peri_cs'):
+        freezing = []
+        for dataframe in dataframes:
+            events = extract_freezing_events(dataframe, ['head'], threshold,
+                                             duration)
+            summary = calculate_mean_freezing(
+                dataframe[['cs_id']].assign(freezing_events=events),
+                protocol=PROTOCOL)
+            freezing.extend(summary.loc[summary['cs_epoch'] == cs_epoch,
+                                        'freezing_norm'])
+        return np.array(freezing)
+
+    # The pipeline output of one setting is the reference scoring
+    reference = pd.DataFrame({
+        'animal_id': np.repeat([str(100000 + number) for number in range(3)],
+                               PROTOCOL.n_cs),
+        'cs_id': PROTOCOL.cs_ids()*3,
+        'freezing_norm': pipeline_freezing(2, 3),
+    })
+
+    scores, _ = sweep_freezing_parameters(
+        pd.concat(dataframes, ignore_index=True), ['head'], thresholds,
+        durations, reference, protocol=PROTOCOL)
+
+    expected = reference['freezing_norm'].to_numpy()
+    for _, score in scores.iterrows():
+        error = pipeline_freezing(score['motion_threshold'],
+                                  score['min_freezing_duration']) - expected
+        assert score['bias'] == pytest.approx(error.mean())
+        assert score['mae'] == pytest.approx(np.abs(error).mean())
+
+    best = scores.loc[scores['mae'].idxmin()]
+    assert best['mae'] == 0
+    assert (best['motion_threshold'], best['min_freezing_duration']) in [
+        (2, 0), (2, 1), (2, 3)]
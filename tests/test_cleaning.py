@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+
+from behavior.analysis.cleaning import clean_dlc_coordinates
+
+
+def make_dlc_dataframe(likelihood):
+    """Deeplabcut dataframe where x is the frame number and y = 2*x."""
+    n_frames = len(likelihood['head'])
+    columns = pd.MultiIndex.from_product(
+        [['DLC_synthetic'], list(likelihood), ['x', 'y', 'likelihood']],
+        names=['scorer', 'bodyparts', 'coords'])
+    frames = np.arange(n_frames, dtype=float)
+    return pd.DataFrame(
+        np.column_stack([column for bodypart in likelihood
+                         for column in (frames, 2*frames,
+                                        likelihood[bodypart])]),
+        columns=columns)
+
+
+def test_cleaning_thresholds():
+    # Gaps of 2 and 4 frames, and a gap at the end of the recording
+    head = np.array([0.9, 0.5, 0.5, 0.95, 0.1, 0.1, 0.1, 0.1, 0.9, 0.2])
+    dataframe = make_dlc_dataframe({'head': head, 'tail_base': np.ones(10)})
+
+    cleaned, dropout = clean_dlc_coordinates(dataframe, likelihood_cutoff=0.9,
+                                             max_gap=3)
+
+    x = cleaned[('DLC_synthetic', 'head', 'x')].to_numpy()
+    nan = np.nan
+    np.testing.assert_array_equal(x, [0, 1, 2, 3, nan, nan, nan, nan, 8, nan])
+    np.testing.assert_array_equal(cleaned[('DLC_synthetic', 'head', 'y')],
+                                  2*x)
+    pd.testing.assert_frame_equal(cleaned['DLC_synthetic']['tail_base'],
+                                  dataframe['DLC_synthetic']['tail_base'])
+    pd.testing.assert_series_equal(
+        cleaned[('DLC_synthetic', 'head', 'likelihood')],
+        dataframe[('DLC_synthetic', 'head', 'likelihood')])
+
+    assert dropout.set_index('bodypart').to_dict('index') == {
+        'head': {'n_frames': 10, 'n_low_likelihood': 7,
+                 'dropout_fraction': 0.7, 'n_gaps': 3, 'longest_gap': 4,
+                 'n_interpolated': 2, 'n_flagged': 5},
+        'tail_base': {'n_frames': 10, 'n_low_likelihood': 0,
+                      'dropout_fraction': 0., 'n_gaps': 0, 'longest_gap': 0,
+                      'n_interpolated': 0, 'n_flagged': 0},
+    }
+
+
+def test_cleaning_a_gap_at_the_start():
+    dataframe = make_dlc_dataframe({'head': np.array([0.1, 0.9, 0.9])})
+
+    cleaned, dropout = clean_dlc_coordinates(dataframe, max_gap=5)
+
+    np.testing.assert_array_equal(cleaned[('DLC_synthetic', 'head', 'x')],
+                                  [np.nan, 1, 2])
+    assert dropout['n_flagged'].tolist() == [1]
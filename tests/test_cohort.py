@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.analysis.classCohortTensor import CohortTensor
+from behavior.utils.classAnimal import Animal
+from behavior.utils.classCohortStore import CohortStore, build_cohort_store
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.file_io import save_interim_dataframe
+from behavior.utils.organization import create_trial_aligned_dataframe
+
+PROTOCOL = Protocol(pre_cs_sec=6, cs_span_sec=3, post_cs_sec=6, fps=10,
+                    analysis_sec=3, n_cs=3)
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_cohort_store_reads_back_the_animals(tmp_path, n_jobs):
+    rng = np.random.default_rng(0)
+    shape = (PROTOCOL.n_cs, PROTOCOL.n_samples)
+    animal_files, signals = [], []
+    for number, treatment in enumerate(['a', 'b', 'a']):
+        animal = Animal('synthetic', 'jl', 'jc', 'rat', 'sd',
+                        str(100000 + number), 'm', '20191001', 'exp001',
+                        'tes01', PROTOCOL.fps, [0]*PROTOCOL.n_cs,
+                        PROTOCOL.cs_span_sec, treatment)
+        signals.append({'speed_head': rng.random(shape),
+                        'freezing_events': rng.integers(0, 2, shape)})
+        dataframe = create_trial_aligned_dataframe(
+            animal, PROTOCOL.cs_ids(), signals[-1], protocol=PROTOCOL)
+
+        # One animal per format, the last one split in two files
+        basename = str(tmp_path / f'animal_{number}')
+        if number == 0:
+            save_interim_dataframe(dataframe, f'{basename}.parquet')
+            animal_files.append(f'{basename}.parquet')
+        elif number == 1:
+            dataframe.to_csv(f'{basename}.csv')
+            animal_files.append(f'{basename}.csv')
+        else:
+            dataframe.drop(columns='freezing_events').to_csv(
+                f'{basename}_speed.csv')
+            save_interim_dataframe(dataframe.drop(columns='speed_head'),
+                                   f'{basename}_motion.parquet')
+            animal_files.append([f'{basename}_speed.csv',
+                                 f'{basename}_motion.parquet'])
+
+    build_cohort_store(str(tmp_path / 'store'), animal_files,
+                       ['speed_head', 'freezing_events'], protocol=PROTOCOL,
+                       n_jobs=n_jobs)
+    store = CohortStore(str(tmp_path / 'store'))
+
+    assert store.cs_ids == PROTOCOL.cs_ids()
+    assert vars(store.protocol) == vars(PROTOCOL)
+    assert store.index['animal_id'].tolist() == ['100000', '100001',
+                                                 '100002']
+    assert store.index['treatment'].tolist() == ['a', 'b', 'a']
+    for name in ['speed_head', 'freezing_events']:
+        np.testing.assert_allclose(
+            store.signal(name),
+            np.stack([animal[name] for animal in signals]), rtol=1e-6)
+    assert store.select(treatment='a').tolist() == [0, 2]
+
+
+def make_summary(seed=0):
+    """Summary statistics of 4 animals, two of them in two sessions."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for animal_id, treatment, sex, sessions in [
+            ('100000', 'a', 'm', ['tes01', 'tes02']),
+            ('100001', 'a', 'f', ['tes01']),
+            ('100002', 'b', 'm', ['tes01', 'tes02']),
+            ('100003', 'b', 'f', ['tes01'])]:
+        for session in sessions:
+            for cs_id in ['cs_01', 'cs_02', 'cs_03']:
+                for cs_epoch in ['pre_cs', 'peri_cs', 'post_cs']:
+                    rows.append({'animal_id': animal_id, 'session': session,
+                                 'treatment': treatment, 'sex': sex,
+                                 'cs_id': cs_id, 'cs_epoch': cs_epoch,
+                                 'freezing_norm': rng.random(),
+                                 'darting_events': rng.integers(0, 5)})
+    summary = pd.DataFrame(rows)
+    # Shuffle the rows and remove an entry
+    return summary.sample(frac=1, random_state=seed).drop(index=[4])
+
+
+def test_tensor_reads_back_the_summary():
+    summary = make_summary()
+
+    tensor = CohortTensor.from_summary(summary)
+
+    assert tensor.values.shape == (6, 3, 3, 2)
+    assert tensor.cs_epochs == ['pre_cs', 'peri_cs', 'post_cs']
+    assert tensor.metrics == ['freezing_norm', 'darting_events']
+    assert np.isnan(tensor.values).sum() == 2
+    for row in summary.itertuples():
+        animal = np.flatnonzero((tensor.coords['animal_id'] == row.animal_id)
+                                & (tensor.coords['session'] == row.session))
+        assert len(animal) == 1
+        assert tensor.values[animal[0],
+                             tensor.cs_ids.index(row.cs_id),
+                             tensor.cs_epochs.index(row.cs_epoch)
+                             ].tolist() == [row.freezing_norm,
+                                            row.darting_events]
+
+
+@pytest.mark.parametrize('by', ['treatment', ['treatment', 'sex']])
+def test_aggregate_matches_a_groupby(by):
+    summary = make_summary()
+
+    aggregated = CohortTensor.from_summary(summary).aggregate_dataframe(by)
+
+    columns = [by] if isinstance(by, str) else by
+    expected = summary.groupby(columns + ['cs_id', 'cs_epoch'])[
+        'freezing_norm'].agg(['mean', 'sem', 'count'])
+    aggregated = aggregated.set_index(columns + ['cs_id', 'cs_epoch'])
+    aggregated = aggregated.loc[expected.index]
+    np.testing.assert_allclose(aggregated['freezing_norm_mean'],
+                               expected['mean'])
+    np.testing.assert_allclose(aggregated['freezing_norm_sem'],
+                               expected['sem'])
+    np.testing.assert_array_equal(aggregated['freezing_norm_n'],
+                                  expected['count'])
+
+
+def test_tensor_of_a_summary_without_sessions():
+    summary = make_summary()
+    summary = summary[summary['session'] == 'tes01'].drop(columns='session')
+
+    tensor = CohortTensor.from_summary(summary)
+
+    assert tensor.coords.columns.tolist() == ['animal_id', 'treatment', 'sex']
+    assert tensor.coords['animal_id'].tolist() == ['100000', '100001',
+                                                   '100002', '100003']
+    assert tensor.values.shape == (4, 3, 3, 2)
+
+
+def test_tensor_rejects_duplicated_rows():
+    summary = make_summary().drop(columns='session')
+
+    with pytest.raises(ValueError, match='several rows'):
+        CohortTensor.from_summary(summary)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.utils import file_io
+from behavior.utils.classAnimal import Animal
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.file_io import (
+    load_interim_dataframe,
+    read_dlc_cs_windows,
+    save_interim_dataframe,
+)
+from behavior.utils.synthetic import generate_dlc_dataframe
+
+PROTOCOL = Protocol(pre_cs_sec=6, cs_span_sec=3, post_cs_sec=6, fps=10,
+                    analysis_sec=3, n_cs=4)
+
+
+def make_animal(cs_start, frame_rate=10):
+    return Animal('synthetic', 'jl', 'jc', 'rat', 'sd', '100000', 'm',
+                  '20191001', 'exp001', 'tes01', frame_rate,
+                  {f'cs_{number:02d}': frame for number, frame
+                   in enumerate(cs_start, start=1)}, PROTOCOL.cs_span_sec,
+                  'a')
+
+
+@pytest.mark.parametrize('format', ['table', 'fixed'])
+@pytest.mark.parametrize('bodyparts', [None, ['head', 'tail_base']])
+def test_read_dlc_cs_windows_matches_a_full_read(tmp_path, monkeypatch,
+                                                 format, bodyparts):
+    # Small blocks so that the windows span several reads
+    monkeypatch.setattr(file_io, 'READ_BLOCK_ROWS', 17)
+    path = str(tmp_path / 'dlc.h5')
+    dataframe, _ = generate_dlc_dataframe(2000, frame_rate=10, seed=0)
+    dataframe.to_hdf(path, key='df_with_missing', mode='w', format=format)
+    # The first trial starts before the video and the last two overlap
+    animal = make_animal([30, 600, 1400, 1480])
+
+    dataframe = read_dlc_cs_windows(path, animal, PROTOCOL, bodyparts)
+
+    full = pd.read_hdf(path)
+    if bodyparts is not None:
+        full = full.loc[:, full.columns.get_level_values(-2).isin(bodyparts)]
+    start, end = PROTOCOL.cs_windows(animal.cs_start.values(),
+                                     animal.frame_rate)
+    frames = np.unique(np.concatenate([
+        np.arange(max(window_start, 0), window_end + 1)
+        for window_start, window_end in zip(start, end)]))
+    pd.testing.assert_frame_equal(dataframe, full.iloc[frames])
+
+
+def make_interim_dataframe():
+    return pd.DataFrame({
+        'animal_id': '100000',
+        'cs_id': pd.Categorical(['cs_01']*3 + ['cs_02']*3),
+        'cs_epoch': ['pre_cs', 'peri_cs', 'post_cs']*2,
+        'treatment': ['a']*3 + [None]*3,
+        'ed_head': [0.5, np.nan, 1.25, 2., 0., 3.5],
+        'freezing_events': np.array([0, 1, 1, 0, 0, 1]),
+        'darting': [True, False]*3,
+    }, index=range(1, 7))
+
+
+@pytest.mark.parametrize('float32', [True, False])
+def test_interim_dataframe_round_trip_keeps_the_dtypes(tmp_path, float32):
+    dataframe = make_interim_dataframe()
+    path = str(tmp_path / 'motion_analysis_dlc.parquet')
+
+    save_interim_dataframe(dataframe, path, float32=float32)
+    loaded = load_interim_dataframe(path)
+
+    float_dtype = np.float32 if float32 else np.float64
+    assert loaded.dtypes.to_dict() == {
+        'animal_id': 'category',
+        'cs_id': 'category',
+        'cs_epoch': 'category',
+        'treatment': 'category',
+        'ed_head': float_dtype,
+        'freezing_events': np.int64,
+        'darting': bool,
+    }
+    pd.testing.assert_frame_equal(loaded, dataframe, check_dtype=False,
+                                  check_categorical=False)
+
+
+def test_load_interim_dataframe_columns(tmp_path):
+    path = str(tmp_path / 'motion_analysis_dlc.parquet')
+    save_interim_dataframe(make_interim_dataframe(), path)
+
+    loaded = load_interim_dataframe(path, columns=['cs_id', 'ed_head'])
+
+    assert loaded.columns.tolist() == ['cs_id', 'ed_head']
+    assert loaded.index.tolist() == list(range(1, 7))
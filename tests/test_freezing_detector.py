@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.analysis.classFreezingDetector import (
+    FreezingDetector,
+    replay_freezing_detector,
+)
+from behavior.analysis.freezing_analysis import extract_freezing_events
+from behavior.analysis.motion_analysis import calculate_euclidean_distance
+from behavior.utils.synthetic import generate_dlc_dataframe
+
+BODYPARTS = ['head', 'ear_right', 'ear_left', 'between_eyes']
+
+
+@pytest.mark.parametrize('min_freezing_duration', [1, 15, 60])
+@pytest.mark.parametrize('motion_threshold', [0.2, 1])
+def test_replay_matches_extract_freezing_events(motion_threshold,
+                                                min_freezing_duration):
+    dataframe, _ = generate_dlc_dataframe(6000, seed=0, dropout_rate=0.01)
+    scorer = dataframe.columns.get_level_values(0)[0]
+    distances = pd.DataFrame({
+        f'ed_{bodypart}': calculate_euclidean_distance(
+            dataframe[scorer][bodypart], convert=True)
+        for bodypart in BODYPARTS})
+
+    expected = extract_freezing_events(distances, BODYPARTS,
+                                       motion_threshold,
+                                       min_freezing_duration)
+    freezing_events, events = replay_freezing_detector(
+        dataframe, BODYPARTS, motion_threshold, min_freezing_duration)
+
+    assert expected.any()
+    np.testing.assert_array_equal(freezing_events, expected)
+    # Events alternate between onsets and offsets
+    assert [name for name, _ in events] == ['onset', 'offset']*(
+        len(events)//2)
+
+
+def test_onset_is_reported_when_the_run_reaches_the_duration():
+    detector = FreezingDetector(motion_threshold=1, min_freezing_duration=3,
+                                convert=False)
+    positions = [0, 5, 5.5, 5.5, 6, 6, 20, 20]
+
+    events = [detector.update([[x, 0]]) for x in positions]
+
+    # Samples 1 to 4 are still: the onset is known at frame 4
+    assert events == [None, None, None, None, ('onset', 1), None,
+                      ('offset', 5), None]
+    assert detector.run_length == 1
+    assert not detector.freezing
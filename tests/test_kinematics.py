@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+from scipy.signal import savgol_filter
+
+from behavior.analysis.kinematics import smooth_signals
+
+
+def test_smooth_signals_uses_nearest_edges_for_segments_with_nan():
+    rng = np.random.default_rng(0)
+    signal = np.cumsum(rng.normal(size=120))
+    signal[80] = np.nan
+    segments = np.repeat([0, 1], 60)
+    half = 9 // 2
+
+    smoothed = smooth_signals(signal, window_length=9, polyorder=2,
+                              segments=segments)
+
+    # Without NaN, the edges of the segment are fitted (mode='interp')
+    np.testing.assert_allclose(
+        smoothed[:60],
+        savgol_filter(signal[:60], 9, 2, mode='interp'))
+
+    # With NaN, the edges repeat the edge samples (mode='nearest')
+    np.testing.assert_allclose(
+        smoothed[60:],
+        savgol_filter(signal[60:], 9, 2, mode='nearest'))
+
+    # Only the first and last half window differ from mode='interp': the
+    # interior does not depend on the mode, and the first window has no NaN
+    np.testing.assert_allclose(
+        smoothed[60 + half:-half],
+        savgol_filter(signal[60:], 9, 2, mode='mirror')[half:-half])
+    interp_edge = savgol_filter(signal[60:80], 9, 2, mode='interp')[:half]
+    assert not np.allclose(smoothed[60:60 + half], interp_edge)
+
+    # The NaN spreads to the samples within half a window
+    assert np.isnan(smoothed).sum() == 9
+    assert np.isnan(smoothed[80 - half:80 + half + 1]).all()
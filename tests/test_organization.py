@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import os
+import pandas as pd
+import pytest
+
+from behavior.utils.classAnimal import Animal
+from behavior.utils.organization import (
+    concatenate_transformed_dataframes,
+    create_trial_aligned_dataframe,
+    fetch_animal_info,
+)
+
+
+def make_animal(**attributes):
+    information = dict(project='synthetic', pi='jl', user='jc',
+                       species='rat', strain='sd', animal_id='100000',
+                       sex='m', date_of_birth='20191001',
+                       experiment_id='exp001', session='tes01',
+                       frame_rate=30, cs_start=[3600], cs_span_sec=30,
+                       group='a')
+    information.update(attributes)
+    return Animal(**information)
+
+
+@pytest.mark.parametrize('attribute, column', [('group', 'treatment'),
+                                               ('species', 'species')])
+@pytest.mark.parametrize('missing', [np.nan, None])
+def test_trial_aligned_dataframe_with_missing_metadata(attribute, column,
+                                                       missing):
+    animal = make_animal(**{attribute: missing})
+
+    dataframe = create_trial_aligned_dataframe(
+        animal, ['cs_01', 'cs_02'], {'speed_head': np.arange(2*4500)})
+
+    assert len(dataframe) == 2*4500
+    assert dataframe[column].isna().all()
+    assert dataframe['animal_id'].eq('100000').all()
+    assert dataframe['speed_head'].tolist() == list(range(len(dataframe)))
+
+
+def test_fetch_animal_info_returns_independent_animals(tmp_path):
+    main_record = tmp_path / 'main_record.csv'
+    experiment_info = tmp_path / 'experiment_info.csv'
+    pd.DataFrame([{'animal_id': '100000', 'sex': 'm', 'pi': 'jl',
+                   'date_of_birth': '20191001', 'strain': 'sd',
+                   'species': 'rat', 'project': 'synthetic'}]
+                 ).to_csv(main_record)
+    pd.DataFrame([{'animal_id': '100000', 'exp_id': 'exp001',
+                   'session': 'tes01', 'frame_rate_fps': 30,
+                   'cs_01': 3600, 'cs_02': 7200, 'treatment': 'a',
+                   'cs_span_sec': 30}]).to_csv(experiment_info)
+    video_key = 'JC_EXP001_20200110_TES01_R_100000_T00'
+
+    animal = fetch_animal_info(video_key, str(main_record),
+                               str(experiment_info))
+    animal.cs_start['cs_01'] = 0
+    animal.group = 'b'
+
+    other = fetch_animal_info(video_key, str(main_record),
+                              str(experiment_info))
+    assert other is not animal
+    assert other.cs_start == {'cs_01': 3600, 'cs_02': 7200}
+    assert other.group == 'a'
+
+
+@pytest.mark.parametrize('cs_02', ['', ' ', np.nan, '7200.0'])
+def test_fetch_animal_info_with_missing_cs(tmp_path, cs_02):
+    main_record = tmp_path / 'main_record.csv'
+    experiment_info = tmp_path / 'experiment_info.csv'
+    pd.DataFrame([{'animal_id': '100000', 'sex': 'm', 'pi': 'jl',
+                   'date_of_birth': '20191001', 'strain': 'sd',
+                   'species': 'rat', 'project': 'synthetic'}]
+                 ).to_csv(main_record)
+    pd.DataFrame([{'animal_id': '100000', 'exp_id': 'exp001',
+                   'session': 'tes01', 'frame_rate_fps': 30,
+                   'cs_01': 3600, 'cs_02': cs_02, 'treatment': 'a',
+                   'cs_span_sec': 30}]).to_csv(experiment_info)
+
+    animal = fetch_animal_info('JC_EXP001_20200110_TES01_R_100000_T00',
+                               str(main_record), str(experiment_info))
+
+    if cs_02 == '7200.0':
+        assert animal.cs_start == {'cs_01': 3600, 'cs_02': 7200}
+    else:
+        assert animal.cs_start == {'cs_01': 3600}
+
+
+def save_summary(directory, animal_id, freezing=(0.25, 0.5)):
+    pd.DataFrame({'animal_id': animal_id,
+                  'cs_id': ['cs_01', 'cs_02'],
+                  'freezing_norm': freezing}).to_csv(
+        directory / f'jc_exp001_20200110_tes01_r_{animal_id}_t00'
+                    '_individual_summary_stats.csv')
+
+
+def read_merged_file(directory):
+    return pd.read_csv(
+        directory / 'jc_exp001_20200110_tes01_r_merged_summary_stats.csv',
+        index_col=0)
+
+
+def test_incremental_merge_appends_new_files(tmp_path):
+    save_summary(tmp_path, 100000)
+    merged = concatenate_transformed_dataframes(str(tmp_path),
+                                                save_at_directory=True)
+    pd.testing.assert_frame_equal(merged, read_merged_file(tmp_path))
+
+    for animal_id in [100001, 100002]:
+        save_summary(tmp_path, animal_id)
+        merged = concatenate_transformed_dataframes(str(tmp_path),
+                                                    save_at_directory=True)
+        pd.testing.assert_frame_equal(merged, read_merged_file(tmp_path))
+
+    assert merged['animal_id'].tolist() == [100000]*2 + [100001]*2 + [100002]*2
+    assert merged.index.tolist() == list(range(6))
+
+
+def test_incremental_merge_replaces_changed_and_removed_files(tmp_path):
+    for animal_id in [100000, 100001, 100002]:
+        save_summary(tmp_path, animal_id)
+    concatenate_transformed_dataframes(str(tmp_path), save_at_directory=True)
+
+    save_summary(tmp_path, 100001, freezing=(0.125, 1.0))
+    merged = concatenate_transformed_dataframes(str(tmp_path),
+                                                save_at_directory=True)
+    pd.testing.assert_frame_equal(merged, read_merged_file(tmp_path))
+    assert merged['animal_id'].tolist() == [100000]*2 + [100002]*2 + [100001]*2
+    assert merged['freezing_norm'].tolist() == [0.25, 0.5]*2 + [0.125, 1.0]
+
+    os.remove(tmp_path / 'jc_exp001_20200110_tes01_r_100000_t00'
+                         '_individual_summary_stats.csv')
+    merged = concatenate_transformed_dataframes(str(tmp_path),
+                                                save_at_directory=True)
+    pd.testing.assert_frame_equal(merged, read_merged_file(tmp_path))
+    assert merged['animal_id'].tolist() == [100002]*2 + [100001]*2
+
+    rebuilt = concatenate_transformed_dataframes(str(tmp_path))
+    pd.testing.assert_frame_equal(
+        merged.sort_values(['animal_id', 'cs_id'], ignore_index=True),
+        rebuilt.sort_values(['animal_id', 'cs_id'], ignore_index=True))
+
+
+def test_merge_of_an_empty_directory(tmp_path):
+    merged = concatenate_transformed_dataframes(str(tmp_path),
+                                                save_at_directory=True)
+    assert merged.empty
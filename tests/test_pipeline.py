@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import pandas as pd
+
+from behavior.pipeline import discover_dlc_outputs, run_cohort
+from behavior.utils.file_io import load_interim_dataframe
+from behavior.utils.synthetic import generate_cohort
+
+
+def test_discover_dlc_outputs_follows_the_record_convention(tmp_path):
+    for basename in ['JC_EXP001_20200110_TES01_R_100000_T00'
+                     'DLC_resnet50_shuffle1.h5',
+                     'AB_EXP12_2021_TEST1_L_1234567_T1DLC_resnet50.h5',
+                     'JC_EXP001_20200110_TES01_R_100001_T00.h5',
+                     'notes.h5']:
+        (tmp_path / basename).touch()
+
+    assert [video_key for video_key, _
+            in discover_dlc_outputs(str(tmp_path))] == [
+        'AB_EXP12_2021_TEST1_L_1234567_T1',
+        'JC_EXP001_20200110_TES01_R_100000_T00',
+        'JC_EXP001_20200110_TES01_R_100001_T00',
+    ]
+
+
+def test_run_cohort_uses_the_protocol_of_each_animal(tmp_path):
+    cohort = generate_cohort(str(tmp_path / 'cohort'), n_animals=2, n_cs=3,
+                             cs_span_sec=20)
+    output_directory = str(tmp_path / 'output')
+
+    report = run_cohort(str(tmp_path / 'cohort'), cohort['main_record'],
+                        cohort['experiment_info'], output_directory,
+                        n_jobs=1)
+
+    assert report['status'].tolist() == ['done', 'done']
+    for video_key in cohort['video_keys']:
+        basename = f'{output_directory}/{video_key}'.lower()
+        summary = pd.read_csv(f'{basename}_individual_summary_stats.csv')
+        assert summary['cs_id'].unique().tolist() == ['cs_01', 'cs_02',
+                                                      'cs_03']
+
+        preprocessing = load_interim_dataframe(
+            f'{basename}_individual_preprocessing_dlc.parquet')
+        assert preprocessing.groupby('cs_id')['cs_epoch'].apply(
+            lambda epoch: (epoch == 'peri_cs').sum()).eq(20*30).all()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+
+from behavior.analysis.freezing_analysis import extract_freezing_events
+from behavior.analysis.motion_analysis import (
+    extract_darting_events,
+    group_darting_events,
+)
+from behavior.analysis.run_length import detect_runs, runs_to_mask
+
+
+def test_detect_runs_keeps_the_runs_at_both_ends():
+    mask = np.array([1, 1, 0, 0, 1, 0, 1, 1, 1], dtype=bool)
+    values = np.arange(len(mask), dtype=float)
+
+    runs = detect_runs(mask, values=values)
+
+    assert runs['start'].tolist() == [0, 4, 6]
+    assert runs['stop'].tolist() == [2, 5, 9]
+    assert runs['length'].tolist() == [2, 1, 3]
+    assert runs['distance'].tolist() == [1, 4, 6 + 7 + 8]
+    assert runs_to_mask(runs, len(mask)).tolist() == mask.astype(int).tolist()
+
+    runs = detect_runs(mask, min_length=3)
+    assert (runs['start'].tolist(), runs['stop'].tolist()) == ([6], [9])
+
+
+def test_events_that_last_until_the_last_frame_are_counted():
+    distance = np.array([5, 0.1, 0.1, 5, 0.1, 0.1, 0.1])
+
+    freezing = extract_freezing_events(pd.DataFrame({'ed_head': distance}),
+                                       ['head'], 1, 3)
+    assert freezing.tolist() == [0, 0, 0, 0, 1, 1, 1]
+
+    speed = np.array([0, 0, 10, 10, 0, 0, 10, 10, 10])
+    darting, events = extract_darting_events(speed, speed/10, 5, 1)
+    assert darting.tolist() == [0, 0, 1, 1, 0, 0, 1, 1, 1]
+    assert events == [(1, [2, 3]), (2, [6, 7, 8])]
+
+
+def test_group_darting_events_uses_the_epoch_of_the_first_frame():
+    dataframe = pd.DataFrame({
+        'darting_events': [1, 0, 0, 1, 1, 0, 1, 1, 1],
+        'cs_epoch': ['pre_cs']*3 + ['peri_cs']*2 + ['post_cs']*4,
+    })
+    dataframe.loc[4, 'cs_epoch'] = 'post_cs'
+
+    assert group_darting_events(dataframe) == {'pre_cs': 1, 'peri_cs': 1,
+                                               'post_cs': 1}
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.utils.classStageCache import StageCache
+
+
+def test_cache_hit_returns_the_computed_dataframe(tmp_path):
+    dataframe = pd.DataFrame({
+        'cs_id': pd.Categorical(['cs_01', 'cs_01', 'cs_02']),
+        'label': np.array(['a', None, 'nan'], dtype=object),
+        'text': pd.Series(['x', None, 'zz'], dtype='str').to_numpy(),
+        'speed': [1.0, np.nan, 2.0],
+        'frame': [10, 11, 12],
+    }, index=[1, 2, 3])
+    cache = StageCache(str(tmp_path))
+
+    computed = cache.get_or_compute('stage', dataframe.copy, value=1)
+    cached = cache.get_or_compute('stage', pytest.fail, value=1)
+
+    pd.testing.assert_frame_equal(computed, dataframe)
+    pd.testing.assert_frame_equal(cached, dataframe)
+    assert cached['label'].isna().tolist() == [False, True, False]
+    assert cached['label'][3] == 'nan'
+
+
+def test_object_columns_other_than_text_are_refused(tmp_path):
+    dataframe = pd.DataFrame({'mixed': np.array([1, 'a'], dtype=object)})
+    with pytest.raises(TypeError):
+        StageCache(str(tmp_path)).save('stage', 'key', dataframe)
+
+
+def test_temporary_files_are_not_cache_entries(tmp_path):
+    cache = StageCache(str(tmp_path), max_bytes=0)
+    writing = tmp_path / f'stage-key.npz.{os.getpid() + 1}.tmp'
+    writing.write_bytes(b'partial entry')
+
+    cache.save('stage', 'key', {'values': np.arange(10)})
+    cache.invalidate()
+
+    assert writing.exists()
+    assert glob.glob(str(tmp_path / '*.npz')) == []
+
+
+def hash_files(directory, paths):
+    cache = StageCache(directory)
+    return [cache._file_hash(path) for path in paths]
+
+
+def test_workers_keep_the_hashes_of_each_other(tmp_path):
+    inputs = tmp_path / 'inputs'
+    inputs.mkdir()
+    paths = []
+    for number in range(40):
+        path = inputs / f'{number}.h5'
+        path.write_bytes(bytes([number])*100)
+        paths.append(str(path))
+
+    directory = str(tmp_path / 'cache')
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(hash_files, [directory]*4,
+                          [paths[worker::4] for worker in range(4)]))
+
+    assert len(os.listdir(os.path.join(directory, 'file_hashes'))) == 40
+
+    # The saved hashes are reused until the file changes
+    cache = StageCache(directory)
+    key = cache.key('stage', paths[0])
+    assert cache.key('stage', paths[0]) == key
+    with open(paths[0], 'ab') as file:
+        file.write(b'more frames')
+    assert cache.key('stage', paths[0]) != key
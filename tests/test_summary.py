@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Behavior - 2020 - LeDoux Lab
+
+Licensed under GNU Lesser General Public License v3.0
+
+@author: Jose Oliveira da Cruz | jose.cruz@nyu.edu
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from behavior.analysis.summary import calculate_epoch_summary
+from behavior.utils.classAnimal import Animal
+from behavior.utils.classProtocol import Protocol
+from behavior.utils.organization import create_trial_aligned_dataframe
+
+PROTOCOL = Protocol(pre_cs_sec=6, cs_span_sec=3, post_cs_sec=6, fps=10,
+                    analysis_sec=3, n_cs=4)
+
+
+def make_trials(seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (PROTOCOL.n_cs, PROTOCOL.n_samples)
+    animal = Animal('synthetic', 'jl', 'jc', 'rat', 'sd', '100000', 'm',
+                    '20191001', 'exp001', 'tes01', PROTOCOL.fps,
+                    [0]*PROTOCOL.n_cs, PROTOCOL.cs_span_sec, 'a')
+    distance = rng.random(shape)
+    distance[rng.random(shape) < 0.05] = np.nan
+    return create_trial_aligned_dataframe(
+        animal, PROTOCOL.cs_ids(),
+        {'freezing_events': rng.random(shape) < 0.4,
+         'darting_events': rng.random(shape) < 0.3,
+         'ed_head': distance,
+         'speed_head': distance*PROTOCOL.fps},
+        protocol=PROTOCOL)
+
+
+def test_epoch_summary_matches_a_loop_over_the_epochs():
+    dataframe = make_trials()
+
+    summary = calculate_epoch_summary(dataframe, distance_column='ed_head',
+                                      speed_column='speed_head',
+                                      protocol=PROTOCOL)
+
+    bounds = PROTOCOL.analysis_bounds
+    window_start, window_stop = bounds['pre_cs'][0], bounds['post_cs'][1]
+    expected = []
+    for cs_id, trial in dataframe.groupby('cs_id', observed=True, sort=False):
+        darting = trial['darting_events'].to_numpy()[
+            window_start:window_stop] == 1
+        onsets = np.flatnonzero(darting & ~np.r_[False, darting[:-1]])
+        for cs_epoch, (start, stop) in bounds.items():
+            epoch = trial.iloc[start:stop]
+            expected.append({
+                'cs_id': cs_id,
+                'cs_epoch': cs_epoch,
+                'freezing_raw': epoch['freezing_events'].sum(),
+                'freezing_norm': round(epoch['freezing_events'].mean(), 2),
+                'darting_raw': epoch['darting_events'].sum(),
+                'darting_norm': round(epoch['darting_events'].mean(), 2),
+                'darting_events': np.sum((onsets >= start - window_start)
+                                         & (onsets < stop - window_start)),
+                'total_distance_cm': round(epoch['ed_head'].sum(), 2),
+                'mean_speed_cm/sec': round(epoch['speed_head'].mean(), 2),
+            })
+    expected = pd.DataFrame(expected)
+
+    assert summary['cs_id'].tolist() == expected['cs_id'].tolist()
+    assert summary['cs_epoch'].tolist() == expected['cs_epoch'].tolist()
+    for column in expected.columns[2:]:
+        np.testing.assert_allclose(summary[column], expected[column],
+                                   err_msg=column)
+
+
+def test_epoch_summary_rejects_trials_of_another_protocol():
+    dataframe = make_trials()
+
+    with pytest.raises(ValueError, match='contiguous'):
+        calculate_epoch_summary(dataframe, protocol=Protocol())